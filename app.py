@@ -1,18 +1,31 @@
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, make_response, send_file, send_from_directory, redirect, url_for, flash
 from youtube_service import YouTubeService
 from download_service import DownloadService
-from cache import Cache
+from cache import Cache, ShardedCache, MemoryBackend, create_backend
+from pagination import SEARCH_PAGE_SIZES, CHANNEL_PAGE_SIZE, decode_cursor, continuation_key, page_response
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
 import json
+import hashlib
+import queue
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import inspect, text
+from cache_warmer import CacheWarmer
+from download_jobs import DownloadJobQueue
+from http_client import count_requests, error_type_for_status
+from singleflight import SingleFlight
+from thumbnail_store import RESIZE_FORMATS, THUMBNAIL_VARIANTS, VIDEO_ID_PATTERN, get_thumbnail_store, proxy_srcset
 from oauthlib.oauth2 import WebApplicationClient
+from werkzeug.wsgi import ClosingIterator
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -35,15 +48,123 @@ login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 
-# Initialize services
-youtube_service = YouTubeService()
-download_service = DownloadService()  # Initialize download service
+# Initialize services. YOUTUBE_CLIENT=async routes upstream fetches through
+# one shared asyncio loop (requires aiohttp) behind a blocking facade.
+# YOUTUBE_BASE_URL points searches and channel pages elsewhere, e.g. at the
+# benchmark stand-in in benchmarks/youtube_standin.py
+YOUTUBE_BASE_URL = os.environ.get("YOUTUBE_BASE_URL", "https://www.youtube.com")
+if os.environ.get("YOUTUBE_CLIENT", "sync") == "async":
+    from async_youtube_service import AsyncYouTubeService, SyncYouTubeFacade
+    youtube_service = SyncYouTubeFacade(AsyncYouTubeService(base_url=YOUTUBE_BASE_URL))
+else:
+    youtube_service = YouTubeService(base_url=YOUTUBE_BASE_URL)
+# Thumbnails are proxied through /thumb from a disk cache shared by every
+# worker (THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_CACHE_TTL);
+# browsers may reuse a served image for THUMBNAIL_MAX_AGE seconds. Smaller
+# WebP/JPEG renditions are made by THUMBNAIL_RESIZE_WORKERS processes when
+# Pillow is installed
+thumbnail_store = get_thumbnail_store()
+THUMBNAIL_MAX_AGE = int(os.environ.get("THUMBNAIL_MAX_AGE", 7 * 24 * 3600))
+app.add_template_global(proxy_srcset, 'thumbnail_srcset')
 
-# Initialize cache with specific settings
-search_cache = Cache(ttl_seconds=3600, max_size=100, prefix="search")  # 1 hour TTL for searches
+# /search/batch: queries accepted per request, and upstream fetches in
+# flight at once across every batch handled by this worker
+SEARCH_BATCH_MAX_ITEMS = int(os.environ.get("SEARCH_BATCH_MAX_ITEMS", 25))
+search_batch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("SEARCH_BATCH_CONCURRENCY", 4)),
+                                       thread_name_prefix="search-batch")
+
+# Cache storage: "memory" is private to each worker, "sqlite" shares one
+# WAL-mode file between all gunicorn workers on the node
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_PATH = os.environ.get("CACHE_PATH", os.path.join(app.instance_path, "cache.sqlite3"))
+
+# Number of independently locked segments for the in-memory cache; useful
+# under threaded workers where one lock becomes the serialization point
+CACHE_SHARDS = int(os.environ.get("CACHE_SHARDS", 1))
+
+# How long to remember each class of upstream failure, so known-bad
+# searches, channels and videos fail fast instead of refetching
+NEGATIVE_TTLS = {
+    "not_found": 600,        # dead channels, removed or private videos
+    "invalid": 600,
+    "rate_limited": 120,
+    "download_failed": 300,  # every download method failed for a format
+    "upstream_error": 30,    # transient network or parse failures
+    "timeout": 15
+}
+
+# Initialize cache with specific settings. Searches are fresh for 1 hour;
+# after that the stale result is served while a background refresh runs,
+# and it is dropped entirely after 3 hours
+search_cache_options = dict(
+    ttl_seconds=3 * 3600,
+    soft_ttl_seconds=3600,
+    max_size=100,
+    prefix="search",
+    max_bytes=int(os.environ.get("SEARCH_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    negative_ttls=NEGATIVE_TTLS
+)
+if CACHE_BACKEND == "memory" and CACHE_SHARDS > 1:
+    search_cache = ShardedCache(shards=CACHE_SHARDS, backend_factory=MemoryBackend, **search_cache_options)
+else:
+    search_cache = Cache(backend=create_backend(CACHE_BACKEND, CACHE_PATH, namespace="search"),
+                         negative_backend=create_backend(CACHE_BACKEND, CACHE_PATH, namespace="search:negative"),
+                         **search_cache_options)
+
+# Channel pages are fresh for CHANNEL_CACHE_SOFT_TTL, then served stale
+# while a background refresh runs until CHANNEL_CACHE_TTL drops them
+channel_cache = Cache(ttl_seconds=int(os.environ.get("CHANNEL_CACHE_TTL", 6 * 3600)),
+                      soft_ttl_seconds=int(os.environ.get("CHANNEL_CACHE_SOFT_TTL", 1800)),
+                      max_size=int(os.environ.get("CHANNEL_CACHE_MAX_SIZE", 200)),
+                      max_bytes=int(os.environ.get("CHANNEL_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+                      prefix="channel", negative_ttls=NEGATIVE_TTLS,
+                      backend=create_backend(CACHE_BACKEND, CACHE_PATH, namespace="channel"),
+                      negative_backend=create_backend(CACHE_BACKEND, CACHE_PATH, namespace="channel:negative"))
+
+# Rendered channel page bodies, keyed by channel ID, data version and login
+# state, so repeat views of popular channels skip the Jinja render too.
+# Kept in process memory; set CHANNEL_FRAGMENT_CACHE=0 to disable
+channel_fragment_cache = None
+if os.environ.get("CHANNEL_FRAGMENT_CACHE", "1") != "0":
+    channel_fragment_cache = Cache(ttl_seconds=int(os.environ.get("CHANNEL_CACHE_TTL", 6 * 3600)),
+                                   max_size=int(os.environ.get("CHANNEL_FRAGMENT_CACHE_MAX_SIZE", 100)),
+                                   max_bytes=int(os.environ.get("CHANNEL_FRAGMENT_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+                                   prefix="channel_page")
+
+# Per-video cache; for now this only remembers failures
+video_cache = Cache(ttl_seconds=1800, max_size=500, prefix="video", negative_ttls=NEGATIVE_TTLS,
+                    negative_backend=create_backend(CACHE_BACKEND, CACHE_PATH, namespace="video:negative"))
+
+# Title, author and length per video for the download endpoints, fed from
+# watch pages and from search and channel results already parsed. Always
+# stored in SQLite so it persists across restarts and is shared by workers;
+# records are refetched in the background after VIDEO_METADATA_SOFT_TTL
+video_metadata = Cache(ttl_seconds=int(os.environ.get("VIDEO_METADATA_TTL", 30 * 24 * 3600)),
+                       soft_ttl_seconds=int(os.environ.get("VIDEO_METADATA_SOFT_TTL", 24 * 3600)),
+                       max_size=int(os.environ.get("VIDEO_METADATA_MAX_SIZE", 50000)),
+                       prefix="video_meta",
+                       backend=create_backend("sqlite", CACHE_PATH, namespace="video_meta"))
+# Finished downloads are stored once per (video, format) under
+# static/downloads/<video_id>/ and indexed in DOWNLOAD_INDEX_PATH, so a
+# repeat request for the same format is answered without running yt-dlp.
+# Past DOWNLOAD_STORE_MAX_BYTES the files served least recently ("lru") or
+# least often ("lfu", DOWNLOAD_EVICTION_POLICY) through /downloads are
+# removed, except those served or written in the last DOWNLOAD_STORE_MIN_AGE
+# seconds
+download_service = DownloadService(metadata=video_metadata)  # Initialize download service
+
+# Warm restarts: the in-memory cache is snapshotted periodically and at exit,
+# and the last snapshot is streamed back in the background at startup. The
+# SQLite backend already persists, so it needs no snapshots.
+SEARCH_CACHE_SNAPSHOT = os.environ.get("SEARCH_CACHE_SNAPSHOT",
+                                       os.path.join(app.instance_path, "search_cache.snapshot"))
+if CACHE_BACKEND == "memory" and SEARCH_CACHE_SNAPSHOT:
+    search_cache.load_snapshot(SEARCH_CACHE_SNAPSHOT)
+    search_cache.start_snapshotting(SEARCH_CACHE_SNAPSHOT,
+                                    interval=int(os.environ.get("CACHE_SNAPSHOT_INTERVAL", 300)))
 
 # Import models after db initialization
-from models import User, SearchHistory, Video, UserVideo
+from models import User, SearchHistory, Video, UserVideo, DownloadJob
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -73,19 +194,179 @@ class RegistrationForm(FlaskForm):
         if user is not None:
             raise ValidationError('Please use a different email address.')
 
+def _add_missing_columns(table, columns):
+    """create_all never alters existing tables, so add new nullable columns by hand"""
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            with db.engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            logger.info(f"Added column {table}.{name}")
+
 with app.app_context():
     try:
         # Create database tables
         db.create_all()
+        _add_missing_columns('search_history', {'search_type': 'VARCHAR(20)'})
     except Exception as e:
         logger.error(f"Database connection error: {str(e)}")
         # Continue running the app even if database connection fails
         pass
 
+def _popular_searches(search_type, limit):
+    """The limit most frequent recent queries of a search type, lowercased"""
+    since = datetime.utcnow() - timedelta(hours=int(os.environ.get("CACHE_WARMER_LOOKBACK_HOURS", 24)))
+    with app.app_context():
+        normalized = db.func.lower(SearchHistory.query)
+        rows = (db.session.query(normalized, db.func.count(SearchHistory.id).label('searches'))
+                .filter(SearchHistory.search_type == search_type, SearchHistory.timestamp >= since)
+                .group_by(normalized)
+                .order_by(db.desc('searches'))
+                .limit(limit)
+                .all())
+        db.session.remove()
+    return [row[0] for row in rows]
+
+# Cache hits are recorded off the request path: rows are queued here and a
+# background thread, started with the warmer, inserts them in batches, so
+# the warmer sees popular queries even when they are always served from
+# the cache. The rows are anonymous, so they count towards popularity
+# without adding repeats to anyone's own search history
+_cached_search_queue = queue.Queue(maxsize=10000)
+
+def _record_cached_search(query, search_type, results):
+    """Queue an anonymous SearchHistory row for a search answered from the cache"""
+    if cache_warmer is None:
+        return
+    items_key = 'channels' if search_type == 'channels' else 'results'
+    row = {
+        'query': query,
+        'search_type': search_type,
+        'results_count': len(results.get(items_key, [])),
+        'user_id': None,
+        'timestamp': datetime.utcnow()
+    }
+    try:
+        _cached_search_queue.put_nowait(row)
+    except queue.Full:
+        logger.warning(f"Search history queue full, not recording cached search: {query}")
+
+def _flush_cached_searches():
+    while True:
+        rows = [_cached_search_queue.get()]
+        while len(rows) < 500:
+            try:
+                rows.append(_cached_search_queue.get_nowait())
+            except queue.Empty:
+                break
+        with app.app_context():
+            try:
+                db.session.bulk_insert_mappings(SearchHistory, rows)
+                db.session.commit()
+            except Exception as db_error:
+                logger.error(f"Database error recording cached searches: {str(db_error)}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        # Let the next batch accumulate
+        time.sleep(1)
+
+# Background warming: every CACHE_WARMER_INTERVAL seconds the top
+# CACHE_WARMER_TOP_K searches of each type are refetched if their entry is
+# missing or about to go stale, at most CACHE_WARMER_RATE upstream fetches
+# a minute, and only while live traffic is not already using the
+# connection pool. With the shared SQLite backend one worker warms per
+# cycle. Set CACHE_WARMER=0 to disable
+cache_warmer = None
+if os.environ.get("CACHE_WARMER", "1") != "0":
+    warmer_max_in_flight = int(os.environ.get("CACHE_WARMER_MAX_IN_FLIGHT", 2))
+    cache_warmer = CacheWarmer(
+        search_cache,
+        fetch=lambda query, search_type: _search_upstream(query, search_type),
+        top_queries=_popular_searches,
+        cache_key=lambda query, search_type: f"{search_type}:{query.lower()}",
+        top_k=int(os.environ.get("CACHE_WARMER_TOP_K", 20)),
+        interval=int(os.environ.get("CACHE_WARMER_INTERVAL", 300)),
+        rate_per_minute=float(os.environ.get("CACHE_WARMER_RATE", 10)),
+        busy=lambda: youtube_service.in_flight() >= warmer_max_in_flight,
+        lock_path=os.path.join(app.instance_path, "cache_warmer.lock") if CACHE_BACKEND == "sqlite" else None
+    )
+    cache_warmer.start()
+    threading.Thread(target=_flush_cached_searches, name="search-history-writer", daemon=True).start()
+
+# Background downloads: POST /video/download/<id> queues a job in the
+# database and returns at once. Each worker process runs at most
+# DOWNLOAD_WORKERS jobs; the rest wait in the table for whichever worker
+# frees up first, and a job whose worker died (no heartbeat for
+# DOWNLOAD_JOB_LEASE seconds) is queued again
+download_jobs = DownloadJobQueue(
+    app, db, DownloadJob,
+    run=lambda video_id, itag, user_id: _run_download(video_id, itag, user_id)[:2],
+    workers=int(os.environ.get("DOWNLOAD_WORKERS", 2)),
+    poll_interval=float(os.environ.get("DOWNLOAD_JOB_POLL_INTERVAL", 2)),
+    lease=int(os.environ.get("DOWNLOAD_JOB_LEASE", 120)),
+    max_attempts=int(os.environ.get("DOWNLOAD_JOB_MAX_ATTEMPTS", 2))
+)
+download_jobs.start()
+
+def _upstream_error_class(error):
+    """Classify an exception from an upstream fetch for negative caching"""
+    if isinstance(error, (requests.Timeout, TimeoutError)):
+        return "timeout"
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+    else:
+        # The async client raises errors carrying a plain status attribute
+        status = getattr(error, "status", None)
+    return error_type_for_status(status)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def _search_upstream(query, search_type, continuation=None):
+    """Run a search against YouTube, indexing the videos it returns for the download endpoints"""
+    results = youtube_service.search(query, search_type=search_type, continuation=continuation)
+    if search_type == 'videos':
+        try:
+            download_service.remember_videos(results.get('results', []))
+        except Exception as e:
+            logger.warning(f"Could not index video metadata: {str(e)}")
+    return results
+
+def _save_search_history(query, search_type, results):
+    """Record a fetched search for the current user; failures are logged, not raised"""
+    try:
+        # Save search history with user_id if authenticated
+        search_history = SearchHistory(
+            query=query,
+            search_type=search_type,
+            results_count=len(results.get('results', [])) if search_type == 'videos' else len(results.get('channels', [])),
+            user_id=current_user.id if current_user.is_authenticated else None
+        )
+        db.session.add(search_history)
+
+        # Save video information only if searching for videos
+        if search_type == 'videos':
+            for video in results.get('results', []):
+                try:
+                    db_video = Video(
+                        id=video['id'],
+                        title=video['title'],
+                        thumbnail_url=video['thumbnail'],
+                        search_query=search_history
+                    )
+                    db.session.add(db_video)
+                except Exception as video_error:
+                    logger.warning(f"Skipping duplicate video {video['id']}: {str(video_error)}")
+                    continue
+
+        db.session.commit()
+    except Exception as db_error:
+        logger.error(f"Database error: {str(db_error)}")
+        db.session.rollback()
+        # Continue with the search even if the database operation fails
+
 @app.route('/search')
 def search():
     query = request.args.get('q', '')
@@ -94,54 +375,170 @@ def search():
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
 
+    # A cursor picks up where a previous page left off: further into a
+    # fetched results page, or at the page its continuation token leads to
+    continuation, offset = None, 0
+    if request.args.get('cursor'):
+        try:
+            continuation, offset = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    items_key = 'channels' if search_type == 'channels' else 'results'
+    page_size = SEARCH_PAGE_SIZES['channels' if search_type == 'channels' else 'videos']
+
     cache_key = f"{search_type}:{query.lower()}"  # Normalize the cache key
-    cached_results = search_cache.get(cache_key)
+    if continuation:
+        cache_key = f"{cache_key}:{continuation_key(continuation)}"
+    cached_results = search_cache.get(
+        cache_key,
+        refresh=lambda: _search_upstream(query, search_type, continuation)
+    )
 
     if cached_results:
         logger.debug(f"Cache hit for {search_type} search query: {query}")
-        return jsonify(cached_results)
+        if not continuation:
+            _record_cached_search(query, search_type, cached_results)
+        return jsonify(page_response(cached_results, items_key, continuation, offset, page_size))
+
+    if search_cache.get_negative(cache_key):
+        logger.debug(f"Negative cache hit for {search_type} search query: {query}")
+        return jsonify({'error': 'Failed to fetch search results'}), 500
 
     try:
-        results = youtube_service.search(query, search_type=search_type)
+        results = _search_upstream(query, search_type, continuation)
         search_cache.set(cache_key, results)
         logger.debug(f"Cache miss for {search_type} search query: {query}, fetched and cached new results")
+        if continuation:
+            # Follow-on pages are not new searches
+            return jsonify(page_response(results, items_key, continuation, offset, page_size))
 
-        try:
-            # Save search history with user_id if authenticated
-            search_history = SearchHistory(
-                query=query,
-                results_count=len(results.get('results', [])) if search_type == 'videos' else len(results.get('channels', [])),
-                user_id=current_user.id if current_user.is_authenticated else None
-            )
-            db.session.add(search_history)
-
-            # Save video information only if searching for videos
-            if search_type == 'videos':
-                for video in results.get('results', []):
-                    try:
-                        db_video = Video(
-                            id=video['id'],
-                            title=video['title'],
-                            thumbnail_url=video['thumbnail'],
-                            search_query=search_history
-                        )
-                        db.session.add(db_video)
-                    except Exception as video_error:
-                        logger.warning(f"Skipping duplicate video {video['id']}: {str(video_error)}")
-                        continue
-
-            db.session.commit()
-        except Exception as db_error:
-            logger.error(f"Database error: {str(db_error)}")
-            db.session.rollback()
-            # Continue with the search even if the database operation fails
-            
-        return jsonify(results)
+        _save_search_history(query, search_type, results)
+        return jsonify(page_response(results, items_key, continuation, offset, page_size))
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
+        search_cache.set_negative(cache_key, str(e), _upstream_error_class(e))
         db.session.rollback()
         return jsonify({'error': 'Failed to fetch search results'}), 500
 
+def _fetch_search(query, search_type, cache_key):
+    """Fetch and cache one search miss; runs on the batch pool"""
+    try:
+        results = _search_upstream(query, search_type)
+    except Exception as e:
+        logger.error(f"Batch search error for {search_type} query {query}: {str(e)}")
+        search_cache.set_negative(cache_key, str(e), _upstream_error_class(e))
+        raise
+    search_cache.set(cache_key, results)
+    return results
+
+def _batch_entry(query, search_type, results, cached):
+    """First page of one batch item's results"""
+    items_key = 'channels' if search_type == 'channels' else 'results'
+    entry = page_response(results, items_key, None, 0, SEARCH_PAGE_SIZES[search_type])
+    entry.update({'q': query, 'type': search_type, 'cached': cached})
+    return entry
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """Run several searches in one request.
+
+    Takes {"queries": [{"q": ..., "type": ...}, ...]} (or the bare list) and
+    returns one entry per item, in order: the first page of results, or an
+    error. Cache hits are answered directly; misses are fetched concurrently
+    on a bounded pool, and duplicate items share one fetch.
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get('queries') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Expected a non-empty list of {q, type} items'}), 400
+    if len(items) > SEARCH_BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {SEARCH_BATCH_MAX_ITEMS} queries per batch'}), 400
+
+    responses = [None] * len(items)
+    fetches = {}  # cache key -> (future, query, search_type)
+    waiting = []  # (index, query, cache key) for items answered by a fetch
+    hits = []  # (query, search_type, results) served from the cache
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            responses[index] = {'error': 'Expected an object with q and type'}
+            continue
+        query = str(item.get('q') or '').strip()
+        search_type = item.get('type', 'channels')
+        if not query:
+            responses[index] = {'q': query, 'type': search_type, 'error': 'Query parameter is required'}
+            continue
+        # A list or dict type would be unhashable in the lookup
+        if not isinstance(search_type, str) or search_type not in SEARCH_PAGE_SIZES:
+            responses[index] = {'q': query, 'type': search_type, 'error': 'Unknown search type'}
+            continue
+
+        cache_key = f"{search_type}:{query.lower()}"
+        cached_results = search_cache.get(
+            cache_key,
+            refresh=lambda query=query, search_type=search_type: _search_upstream(query, search_type)
+        )
+        if cached_results:
+            responses[index] = _batch_entry(query, search_type, cached_results, cached=True)
+            hits.append((query, search_type, cached_results))
+        elif search_cache.get_negative(cache_key):
+            responses[index] = {'q': query, 'type': search_type, 'error': 'Failed to fetch search results'}
+        else:
+            if cache_key not in fetches:
+                future = search_batch_pool.submit(_fetch_search, query, search_type, cache_key)
+                fetches[cache_key] = (future, query, search_type)
+            waiting.append((index, query, cache_key))
+
+    for index, query, cache_key in waiting:
+        future, _, search_type = fetches[cache_key]
+        try:
+            responses[index] = _batch_entry(query, search_type, future.result(), cached=False)
+        except Exception:
+            responses[index] = {'q': query, 'type': search_type, 'error': 'Failed to fetch search results'}
+
+    for future, query, search_type in fetches.values():
+        if future.exception() is None:
+            _save_search_history(query, search_type, future.result())
+    for query, search_type, results in hits:
+        _record_cached_search(query, search_type, results)
+
+    logger.debug(f"Batch search: {len(items)} items, {len(fetches)} fetched upstream")
+    return jsonify({'results': responses})
+
+def _fetch_channel(channel_id, continuation=None):
+    """Fetch channel data, stamping successful results with a content version"""
+    if continuation:
+        channel_data = youtube_service.get_channel_videos(channel_id, continuation=continuation)
+    else:
+        channel_data = youtube_service.get_channel_videos(channel_id)
+    if not channel_data.get('error'):
+        try:
+            download_service.remember_videos(channel_data.get('videos', []), author=channel_data.get('title'))
+        except Exception as e:
+            logger.warning(f"Could not index video metadata: {str(e)}")
+        payload = json.dumps(channel_data, sort_keys=True, default=str).encode()
+        channel_data['version'] = hashlib.sha1(payload).hexdigest()[:16]
+    return channel_data
+
+def _refresh_channel(channel_id, continuation=None):
+    """Background refresh for channel_cache; failures keep the stale copy"""
+    channel_data = _fetch_channel(channel_id, continuation)
+    return None if channel_data.get('error') else channel_data
+
+def _render_channel(channel_id, channel_data):
+    """Render the channel page, reusing a cached body for this data version"""
+    channel_data = page_response(channel_data, 'videos', None, 0, CHANNEL_PAGE_SIZE)
+    if channel_fragment_cache is None or not channel_data.get('version'):
+        return render_template('channel.html', channel=channel_data)
+
+    fragment_key = f"{channel_id}:{channel_data['version']}:{int(current_user.is_authenticated)}"
+    fragment = channel_fragment_cache.get(fragment_key)
+    if fragment is None:
+        fragment = render_template('channel_content.html', channel=channel_data)
+        channel_fragment_cache.set(fragment_key, fragment)
+    else:
+        logger.debug(f"Fragment cache hit for channel {channel_id}")
+    return render_template('channel.html', channel=channel_data, channel_fragment=fragment)
+
 @app.route('/channel/')
 @app.route('/channel/<channel_id>')
 def channel(channel_id=None):
@@ -149,19 +546,71 @@ def channel(channel_id=None):
         logger.error("No channel ID provided")
         return render_template('index.html', focus_channels=True)
 
+    cached_channel = channel_cache.get(channel_id, refresh=lambda: _refresh_channel(channel_id))
+    if cached_channel:
+        logger.debug(f"Cache hit for channel {channel_id}")
+        return _render_channel(channel_id, cached_channel)
+
+    negative = channel_cache.get_negative(channel_id)
+    if negative:
+        logger.debug(f"Negative cache hit for channel {channel_id}: {negative['error']}")
+        return render_template('error.html', error=negative['error']), 404
+
     try:
         logger.debug(f"Fetching channel data for ID: {channel_id}")
-        channel_data = youtube_service.get_channel_videos(channel_id)
+        channel_data = _fetch_channel(channel_id)
 
         if channel_data.get('error'):
             logger.error(f"Error fetching channel: {channel_data['error']}")
+            channel_cache.set_negative(channel_id, channel_data['error'],
+                                       channel_data.get('error_type', 'upstream_error'))
             return render_template('error.html', error=channel_data['error']), 404
 
-        return render_template('channel.html', channel=channel_data)
+        channel_cache.set(channel_id, channel_data)
+        return _render_channel(channel_id, channel_data)
     except Exception as e:
         logger.error(f"Channel fetch error: {str(e)}")
+        channel_cache.set_negative(channel_id, "Failed to fetch channel data", _upstream_error_class(e))
         return render_template('error.html', error="Failed to fetch channel data"), 500
 
+@app.route('/channel/<channel_id>/videos')
+def channel_videos(channel_id):
+    """One page of a channel's videos as JSON; pass next_cursor back as ?cursor= for the next"""
+    continuation, offset = None, 0
+    if request.args.get('cursor'):
+        try:
+            continuation, offset = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    # The first page shares its cache entry with the /channel page
+    cache_key = f"{channel_id}:{continuation_key(continuation)}" if continuation else channel_id
+    channel_data = channel_cache.get(cache_key, refresh=lambda: _refresh_channel(channel_id, continuation))
+    if channel_data:
+        logger.debug(f"Cache hit for channel {channel_id} page")
+    else:
+        negative = channel_cache.get_negative(cache_key)
+        if negative:
+            logger.debug(f"Negative cache hit for channel {channel_id} page: {negative['error']}")
+            return jsonify({'error': negative['error']}), 404
+
+        try:
+            channel_data = _fetch_channel(channel_id, continuation)
+        except Exception as e:
+            logger.error(f"Channel page fetch error: {str(e)}")
+            channel_cache.set_negative(cache_key, "Failed to fetch channel data", _upstream_error_class(e))
+            return jsonify({'error': 'Failed to fetch channel data'}), 500
+
+        if channel_data.get('error'):
+            logger.error(f"Error fetching channel page: {channel_data['error']}")
+            channel_cache.set_negative(cache_key, channel_data['error'],
+                                       channel_data.get('error_type', 'upstream_error'))
+            return jsonify({'error': channel_data['error']}), 404
+        channel_cache.set(cache_key, channel_data)
+
+    page = page_response(channel_data, 'videos', continuation, offset, CHANNEL_PAGE_SIZE)
+    return jsonify({'id': channel_id, 'videos': page['videos'], 'next_cursor': page['next_cursor']})
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('error.html', error="Page not found"), 404
@@ -172,8 +621,15 @@ def video_download_options(video_id):
     if not video_id:
         return jsonify({'error': 'Video ID is required'}), 400
     
+    negative = video_cache.get_negative(video_id)
+    if negative:
+        return jsonify({'success': False, 'error': negative['error']})
+
     try:
         streams_data = download_service.get_available_streams(video_id)
+        if not streams_data['success']:
+            video_cache.set_negative(video_id, streams_data['error'],
+                                     streams_data.get('error_type', 'upstream_error'))
         return jsonify(streams_data)
     except Exception as e:
         logger.error(f"Download options error: {str(e)}")
@@ -181,29 +637,148 @@ def video_download_options(video_id):
 
 @app.route('/video/download/<video_id>')
 def download_video(video_id):
-    """Download a video with the specified itag"""
-    if not video_id:
-        return jsonify({'error': 'Video ID is required'}), 400
-    
-    itag = request.args.get('itag')
-    if not itag:
+    """Download a video with the specified itag, blocking until it finishes.
+
+    The POST form of this route runs the same download as a background job.
+    """
+    try:
+        itag = int(request.args.get('itag'))
+    except (TypeError, ValueError):
         return jsonify({'error': 'Stream itag is required'}), 400
+
+    result, status, fetches = _run_download(video_id, itag,
+                                            current_user.id if current_user.is_authenticated else None)
+    response = make_response(jsonify(result), status)
+    response.headers['X-Upstream-Fetches'] = str(fetches)
+    return response
+
+@app.route('/video/download/<video_id>', methods=['POST'])
+def create_download_job(video_id):
+    """Queue a download and return its job ID at once; poll /jobs/<job_id> for the result"""
+    data = request.get_json(silent=True) or {}
+    itag = data.get('itag') or request.values.get('itag')
+    if not VIDEO_ID_PATTERN.match(video_id):
+        return jsonify({'error': 'Invalid video ID'}), 400
+    try:
+        itag = int(itag)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Stream itag is required'}), 400
+
+    try:
+        job = download_jobs.submit(video_id, itag,
+                                   user_id=current_user.id if current_user.is_authenticated else None)
+    except Exception as e:
+        logger.error(f"Could not queue download of {video_id}: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to queue download'}), 500
+    job['status_url'] = url_for('download_job', job_id=job['job_id'])
+    response = make_response(jsonify(job), 202)
+    response.headers['Location'] = job['status_url']
+    return response
+
+@app.route('/jobs/stats')
+def download_stats():
+    """Download queue depth and wait times: yt-dlp slots node-wide, jobs in this worker,
+    and download store disk usage and evictions"""
+    return jsonify({
+        'scheduler': download_service.scheduler.get_stats(),
+        'jobs': download_jobs.get_stats(),
+        'store': download_service.store.get_stats()
+    })
+
+@app.route('/jobs/<job_id>')
+def download_job(job_id):
+    """State of a download job, with its result once it has finished"""
+    job = download_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+def _download_user(user_id):
+    """Who a download is for, for fair scheduling of yt-dlp runs"""
+    return f"user:{user_id}" if user_id is not None else None
+
+# Concurrent requests for the same video and format in this worker share one
+# pipeline run instead of each starting yt-dlp
+_download_flight = SingleFlight()
+
+def _run_download(video_id, itag, user_id=None):
+    """_download_pipeline, counting and logging the upstream requests it makes"""
+    with count_requests() as upstream:
+        result, status = _download_flight.do((video_id, int(itag)), _download_pipeline,
+                                             video_id, itag, _download_user(user_id))
+    # Callers that joined an in-flight run get their own copy to annotate
+    result = dict(result)
+    fetches = sum(upstream.values())
+    logger.info(f"Download of {video_id} made {fetches} upstream requests: {dict(upstream)}")
+    if result.get('success'):
+        result['upstream_fetches'] = fetches
+        result['download_url'] = _download_url(result['file_path'])
+        if user_id is not None:
+            _record_download_path(user_id, video_id, result['file_path'])
+    return result, status, fetches
+
+def _download_url(file_path):
+    """URL of a file in static/downloads, served through /downloads so its accesses are counted"""
+    prefix = 'static/downloads/'
+    if file_path.startswith(prefix):
+        # Built by hand: download jobs run outside a request, where url_for cannot
+        return '/downloads/' + file_path[len(prefix):]
+    return '/' + file_path
+
+app.add_template_global(_download_url, 'download_url')
+
+def _record_download_path(user_id, video_id, file_path):
+    """Point the user's saved copy of a video at its file in the download store"""
+    if not download_service.store.owns(file_path):
+        return
+    try:
+        UserVideo.query.filter_by(user_id=user_id, video_id=video_id).update(
+            {'download_path': file_path}, synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Could not record download path for {video_id}: {str(e)}")
+        db.session.rollback()
+
+def _download_pipeline(video_id, itag, user=None):
+    """Resolve the video info once, then try each download method in turn.
+
+    Returns (result, HTTP status). Runs in a request or on a download job worker.
+    """
+    # A format downloaded before, by anyone, is served from the store
+    stored = download_service.find_download(video_id, str(itag))
+    if stored:
+        return stored, 200
+
+    # Known-bad videos, or formats that just failed every method, fail fast
+    negative = video_cache.get_negative(video_id)
+    if negative:
+        return {'success': False, 'error': negative['error']}, 200
+    if video_cache.get_negative(f"{video_id}:{itag}"):
+        return {'success': False, 'error': 'All download methods failed'}, 400
     
     try:
         logger.info(f"Attempting to download video {video_id} with itag {itag}")
         
         # First, get the video information for backup purposes
         streams_data = download_service.get_available_streams(video_id)
+
+        # Every method below needs the same video info, so stop here if it failed
+        if not streams_data['success']:
+            video_cache.set_negative(video_id, streams_data['error'],
+                                     streams_data.get('error_type', 'upstream_error'))
+            return streams_data, 200
         
         # Try multiple methods in sequence until one works
         
         # Method 1: Try standard itag-based download
-        result = download_service.download_video(video_id, int(itag))
+        result = download_service.download_video(video_id, int(itag), video_info=streams_data, user=user)
         
         if not result['success'] or 'thumbnail' in result.get('file_path', '').lower():
             # Method 2: Direct download with best quality
             logger.warning(f"Itag download failed for {video_id}, trying direct download")
-            result = download_service.direct_download(video_id, 'best')
+            result = download_service.direct_download(video_id, 'best', video_info=streams_data,
+                                                     user=user, itag=int(itag))
         
         if not result['success'] or 'thumbnail' in result.get('file_path', '').lower():
             # Method 3: Direct download with format selected based on itag type
@@ -215,22 +790,20 @@ def download_video(video_id):
             else:  # Audio formats
                 format_code = 'bestaudio[ext=m4a]/bestaudio/best'
                 
-            result = download_service.direct_download(video_id, format_code)
+            result = download_service.direct_download(video_id, format_code, video_info=streams_data,
+                                                     user=user, itag=int(itag))
         
         # Always ensure we return a success response with fallback to thumbnail if needed
         if not result['success'] and streams_data['success']:
             # If all methods fail but we have video info, return a thumbnail at minimum
             logger.warning(f"All download methods failed for {video_id}, falling back to thumbnail")
             title = streams_data.get('title', 'Unknown Video')
-            thumbnail_url = f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg"
             thumbnail_path = os.path.join(download_service.download_folder, f"{video_id}_thumbnail.jpg")
             
             # Try to download the thumbnail as last resort
             try:
-                thumbnail_response = requests.get(thumbnail_url)
-                if thumbnail_response.ok:
-                    with open(thumbnail_path, 'wb') as f:
-                        f.write(thumbnail_response.content)
+                if not os.path.exists(thumbnail_path):
+                    download_service._save_thumbnail(video_id, thumbnail_path)
                         
                 result = {
                     'success': True,
@@ -242,18 +815,80 @@ def download_video(video_id):
                 }
             except Exception as thumb_error:
                 logger.error(f"Even thumbnail download failed: {str(thumb_error)}")
-                return jsonify({'success': False, 'error': 'All download methods failed'}), 400
+                video_cache.set_negative(f"{video_id}:{itag}", 'All download methods failed', 'download_failed')
+                return {'success': False, 'error': 'All download methods failed'}, 400
+        
+        # A fallback method's file answers the next request for this itag too
+        download_service.store.alias(video_id, str(itag), result['file_path'])
         
         # Return the result of whichever method succeeded
-        return jsonify(result)
+        return result, 200
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
-        return jsonify({'error': f'Failed to download video: {str(e)}'}), 500
+        return {'error': f'Failed to download video: {str(e)}'}, 500
 
 @app.route('/downloads/<path:filename>')
 def download_file(filename):
-    """Serve downloaded files"""
-    return send_from_directory(download_service.download_folder, filename)
+    """Serve downloaded files, under their video title when they are in the download store"""
+    store = download_service.store
+    stored = store.lookup_path(filename)
+    if stored and stored['download_name']:
+        response = send_from_directory(download_service.download_folder, filename,
+                                       as_attachment=True, download_name=stored['download_name'])
+    else:
+        response = send_from_directory(download_service.download_folder, filename)
+    store.record_access(filename)
+    if request.method != 'HEAD' and response.status_code in (200, 206):
+        # Not evicted while the body is streaming; call_on_close is skipped for file responses
+        store.pin(filename)
+        response.response = ClosingIterator(response.response, lambda: store.unpin(filename))
+    return response
+
+@app.route('/thumb/<video_id>/<variant>')
+def thumbnail(video_id, variant):
+    """Serve a video thumbnail from the local thumbnail cache"""
+    if variant.endswith('.jpg'):
+        variant = variant[:-4]
+    if not VIDEO_ID_PATTERN.match(video_id) or variant not in THUMBNAIL_VARIANTS:
+        return '', 404
+
+    try:
+        found = thumbnail_store.get(video_id, variant)
+    except Exception as e:
+        # Let the browser fetch it directly rather than show a broken image
+        logger.warning(f"Thumbnail fetch failed for {video_id}/{variant}: {str(e)}")
+        return redirect(f"https://i.ytimg.com/vi/{video_id}/{variant}.jpg")
+    if found is None:
+        return '', 404
+
+    path, etag = found
+    mimetype = 'image/jpeg'
+
+    # ?w= asks for the smallest rendition at least that many pixels wide,
+    # as WebP when the browser accepts it; without ?w= the WebP keeps the
+    # variant's own width
+    width = request.args.get('w', type=int)
+    ext = 'webp' if request.accept_mimetypes['image/webp'] else 'jpg'
+    fallback = False
+    if width is not None or ext == 'webp':
+        rendition = thumbnail_store.get_rendition(path, etag, width, ext)
+        if rendition:
+            path, etag = rendition
+            mimetype = RESIZE_FORMATS[ext][1]
+        else:
+            fallback = True
+
+    # The content hash is a strong validator, so revalidation is a 304
+    response = send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                         max_age=0 if fallback else THUMBNAIL_MAX_AGE)
+    response.cache_control.public = True
+    if fallback:
+        # The full-size source stands in until the rendition is built, so
+        # it must not be cached under this URL; revalidating picks up the
+        # rendition through its different ETag
+        response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -410,6 +1045,7 @@ def save_video(video_id):
                 user_video.downloaded = True
                 user_video.download_date = datetime.utcnow()
                 user_video.download_quality = video_data.get('download_quality', 'Unknown')
+                user_video.download_path = _stored_download_path(video_data.get('download_path'))
             
             db.session.add(user_video)
             db.session.commit()
@@ -421,6 +1057,8 @@ def save_video(video_id):
                 existing.download_date = datetime.utcnow()
                 if video_data.get('download_quality'):
                     existing.download_quality = video_data.get('download_quality')
+                if _stored_download_path(video_data.get('download_path')):
+                    existing.download_path = video_data.get('download_path')
                 db.session.commit()
                 return jsonify({'success': True, 'message': 'Video marked as downloaded'})
             else:
@@ -431,6 +1069,12 @@ def save_video(video_id):
         logger.error(f"Error saving video: {str(e)}")
         return jsonify({'success': False, 'message': f'Error saving video: {str(e)}'}), 500
 
+def _stored_download_path(file_path):
+    """file_path if it names a file in the download store, else None"""
+    if file_path and download_service.store.owns(file_path):
+        return file_path
+    return None
+
 @app.route('/update-video/<int:user_video_id>', methods=['POST'])
 @login_required
 def update_video(user_video_id):
@@ -0,0 +1,310 @@
+from typing import Any, Awaitable, Dict, Hashable, Optional
+from collections import Counter
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+from http_client import DEFAULT_HEADERS, error_type_for_status
+from youtube_service import YouTubeServiceBase
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, only needed when the async client is enabled
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+class UpstreamHTTPError(Exception):
+    """Non-2xx response from YouTube, mirroring requests' raise_for_status"""
+
+    def __init__(self, status: int, url: str):
+        super().__init__(f"{status} Error for url: {url}")
+        self.status = status
+        self.url = url
+
+class AsyncYouTubeService(YouTubeServiceBase):
+    """asyncio variant of YouTubeService built on aiohttp.
+
+    search, get_video_url and get_channel_videos are coroutines returning
+    the same dicts as the blocking service. One aiohttp connector is shared
+    by all calls, so a single event loop can keep hundreds of upstream
+    fetches in flight instead of pinning a worker per request.
+    """
+
+    def __init__(self, max_connections: int = 200, per_host_limit: int = 50, timeout: float = 15.0,
+                 resolution_cache=None, base_url: str = "https://www.youtube.com"):
+        if aiohttp is None:
+            raise RuntimeError("AsyncYouTubeService requires the aiohttp package")
+        super().__init__(resolution_cache=resolution_cache, base_url=base_url)
+        self._max_connections = max_connections
+        self._per_host_limit = per_host_limit
+        self._timeout = timeout
+        self._session: Optional["aiohttp.ClientSession"] = None
+        # Concurrent identical requests share one task, cancelled once none
+        # of them is still waiting for it
+        self._in_flight: Dict[Hashable, "asyncio.Future"] = {}
+        self._waiters: Counter = Counter()
+        self._video_lookups = 0
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """The shared session, created lazily on the running loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_connections, limit_per_host=self._per_host_limit)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=DEFAULT_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+                cookie_jar=aiohttp.DummyCookieJar()
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _fetch(self, url: str, params: Optional[Dict[str, str]] = None) -> tuple:
+        """GET url, returning (status, body text)"""
+        async with self._get_session().get(url, params=params) as response:
+            return response.status, await response.text()
+
+    async def _post_json(self, url: str, params: Dict[str, str], body: Dict[str, Any]) -> tuple:
+        """POST a JSON body, returning (status, decoded JSON or None)"""
+        async with self._get_session().post(url, params=params, json=body) as response:
+            if response.status != 200:
+                return response.status, None
+            return response.status, await response.json(content_type=None)
+
+    async def _coalesce(self, key: Hashable, factory) -> Any:
+        """Await the in-flight task for key, or start one with factory().
+
+        The task is shielded from each caller's cancellation and cancelled
+        only when the last caller waiting on it is.
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        self._waiters[future] += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+                if not future.done():
+                    future.cancel()
+
+    async def _first_success(self, candidates: list, probe) -> tuple:
+        """Await probe(candidate) for each candidate in preference order.
+
+        Returns (candidate, result) for the first candidate whose probe
+        gives a truthy result, or (None, None) if every probe fails. The
+        forms can belong to different channels, so a later candidate is
+        only tried once every earlier one has failed.
+        """
+        for candidate in candidates:
+            result = await probe(candidate)
+            if result:
+                return candidate, result
+        return None, None
+
+    async def _resolve(self, key: str, candidates: list, probe, name=lambda candidate: candidate) -> tuple:
+        """Probe the remembered candidate alone, else the others in order, remembering the winner"""
+        remembered, others = self._remembered_first(key, candidates, name)
+        if remembered:
+            result = await probe(remembered[0])
+            if result:
+                return remembered[0], result
+            logger.debug(f"Remembered resolution for {key} failed, probing all candidates")
+            self._resolutions.delete(key)
+        candidate, result = await self._first_success(others, probe)
+        if candidate is not None:
+            self._resolutions.set(key, name(candidate))
+        return candidate, result
+
+    def in_flight(self) -> int:
+        """Upstream calls running now: shared search and channel fetches plus video lookups"""
+        return len(self._in_flight) + self._video_lookups
+
+    async def search(self, query: str, search_type="videos", continuation=None) -> dict:
+        """Search YouTube, coalescing concurrent identical queries into one fetch"""
+        return await self._coalesce(("search", search_type, query.lower(), continuation),
+                                    lambda: self._search(query, search_type, continuation))
+
+    async def _search(self, query: str, search_type="videos", continuation=None) -> dict:
+        if continuation:
+            return await self._search_continuation(search_type, continuation)
+        logger.debug(f"Searching for query: {query}, type: {search_type}")
+        try:
+            status, html_content = await self._fetch(self.search_url, self._search_params(query, search_type))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Search request failed: {str(e)}")
+            raise
+        if status >= 400:
+            logger.error(f"YouTube search failed with status code: {status}")
+            raise UpstreamHTTPError(status, self.search_url)
+        if status != 200:
+            return {'results': [], 'search_type': search_type}
+        # Parsing is CPU-bound; run it off the loop so other fetches keep flowing
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._parse_search_results, html_content, search_type)
+
+    async def _search_continuation(self, search_type: str, continuation: str) -> dict:
+        logger.debug(f"Fetching search continuation, type: {search_type}")
+        url, params, body = self._continuation_request("search", continuation)
+        try:
+            status, data = await self._post_json(url, params, body)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Search continuation request failed: {str(e)}")
+            raise
+        if status != 200 or not isinstance(data, dict):
+            logger.error(f"Search continuation failed with status code: {status}")
+            raise UpstreamHTTPError(status, url)
+        return self._parse_search_continuation(data, search_type)
+
+    async def get_video_url(self, video_id: str) -> dict:
+        """Get video URL with availability check and metadata"""
+        self._video_lookups += 1
+        try:
+            return await self._get_video_url(video_id)
+        finally:
+            self._video_lookups -= 1
+
+    async def _get_video_url(self, video_id: str) -> dict:
+        logger.debug(f"Attempting to get video URL for ID: {video_id}")
+        video_info = {
+            'url': None,
+            'is_restricted': False,
+            'error_message': None
+        }
+
+        # Check the watch page for restrictions while the URL forms are probed
+        info_task = asyncio.ensure_future(self._fetch(f"{self.base_url}/watch?v={video_id}"))
+
+        async def probe(candidate):
+            pattern, url = candidate
+            try:
+                async with self._get_session().head(url, allow_redirects=True) as response:
+                    return response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Failed to access {pattern} URL for video {video_id}: {str(e)}")
+                return False
+
+        try:
+            candidate, _ = await self._resolve(f"video:{video_id}", self._video_url_candidates(video_id), probe,
+                                               name=lambda candidate: candidate[0])
+
+            try:
+                _, html_content = await info_task
+                self._check_watch_page(html_content, video_info)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Failed to check video info: {str(e)}")
+        finally:
+            # Stops the watch page fetch if the probe raised or the call was cancelled
+            info_task.cancel()
+
+        if candidate is not None and not video_info['is_restricted']:
+            video_info['url'] = candidate[1]
+            logger.debug(f"Successfully found working URL pattern: {candidate[0]}")
+
+        if not video_info['url'] and not video_info['error_message']:
+            video_info['error_message'] = "This video is currently unavailable in your region"
+
+        return video_info
+
+    async def get_channel_videos(self, channel_id: str, continuation=None) -> dict:
+        """Fetch videos for a specific channel, coalescing concurrent requests for it"""
+        return await self._coalesce(("channel", channel_id, continuation),
+                                    lambda: self._get_channel_videos(channel_id, continuation))
+
+    async def _get_channel_videos(self, channel_id: str, continuation=None) -> dict:
+        if not channel_id:
+            logger.error("Channel ID is required")
+            return {'error': 'Channel ID is required', 'error_type': 'invalid'}
+
+        if continuation:
+            return await self._channel_continuation(channel_id, continuation)
+
+        try:
+            logger.debug(f"Fetching videos for channel: {channel_id}")
+
+            async def probe(url):
+                try:
+                    logger.debug(f"Trying channel URL: {url}")
+                    status, body = await self._fetch(url)
+                    if status == 200:
+                        return body
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Failed to access {url}: {str(e)}")
+                return None
+
+            url, html_content = await self._resolve(f"channel:{channel_id}", self._channel_urls(channel_id), probe)
+            if html_content:
+                logger.debug(f"Successfully received channel page HTML from {url}")
+
+            if not html_content:
+                logger.error("All channel URL formats failed")
+                return {'error': 'Channel not found or unavailable', 'error_type': 'not_found'}
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._parse_channel_page, channel_id, html_content)
+
+        except Exception as e:
+            logger.error(f"Channel fetch request failed: {str(e)}")
+            return {'error': f'Failed to fetch channel data: {str(e)}', 'error_type': 'upstream_error'}
+
+    async def _channel_continuation(self, channel_id: str, continuation: str) -> dict:
+        try:
+            logger.debug(f"Fetching channel continuation for: {channel_id}")
+            url, params, body = self._continuation_request("browse", continuation)
+            status, data = await self._post_json(url, params, body)
+            if status != 200 or not isinstance(data, dict):
+                logger.error(f"Channel continuation failed with status code: {status}")
+                return {'error': 'Channel page unavailable', 'error_type': error_type_for_status(status)}
+            return self._parse_channel_continuation(channel_id, data)
+        except Exception as e:
+            logger.error(f"Channel continuation request failed: {str(e)}")
+            return {'error': f'Failed to fetch channel data: {str(e)}', 'error_type': 'upstream_error'}
+
+class SyncYouTubeFacade:
+    """Blocking facade over AsyncYouTubeService for the Flask routes.
+
+    Runs one event loop on a daemon thread; each call submits a coroutine to
+    it and waits for the result, so every request thread in the process
+    shares the loop's connection pool and in-flight fetches.
+    """
+
+    def __init__(self, service: Optional[AsyncYouTubeService] = None, call_timeout: float = 60.0):
+        self._service = service or AsyncYouTubeService()
+        self._call_timeout = call_timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="youtube-async-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self, coroutine: Awaitable) -> Any:
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result(self._call_timeout)
+        except concurrent.futures.TimeoutError:
+            # Cancel the task on the loop too; its own requests stop, and a
+            # coalesced fetch stops once no other caller is waiting for it
+            future.cancel()
+            raise
+
+    def search(self, query: str, search_type="videos", continuation=None) -> dict:
+        return self._run(self._service.search(query, search_type=search_type, continuation=continuation))
+
+    def get_video_url(self, video_id: str) -> dict:
+        return self._run(self._service.get_video_url(video_id))
+
+    def in_flight(self) -> int:
+        return self._service.in_flight()
+
+    def get_channel_videos(self, channel_id: str, continuation=None) -> dict:
+        return self._run(self._service.get_channel_videos(channel_id, continuation=continuation))
+
+    def close(self) -> None:
+        self._run(self._service.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
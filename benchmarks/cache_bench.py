@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Cache microbenchmark
+Measures Cache.set/get latency for a full cache at increasing max_size,
+to check that per-operation cost does not grow with the number of entries.
+
+Usage: python benchmarks/cache_bench.py [--ops N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import Cache
+
+
+def bench(max_size, ops):
+    """Return (set_us, get_us) per operation for a cache filled to max_size"""
+    cache = Cache(ttl_seconds=3600, max_size=max_size, prefix="bench")
+    for i in range(max_size):
+        cache.set(f"warm:{i}", {"results": [i]})
+
+    # Every set is a new key on a full cache, so each one also evicts
+    start = time.perf_counter()
+    for i in range(ops):
+        cache.set(f"new:{i}", {"results": [i]})
+    set_us = (time.perf_counter() - start) / ops * 1e6
+
+    keys = [f"new:{i}" for i in range(max(0, ops - max_size), ops)]
+    start = time.perf_counter()
+    for i in range(ops):
+        cache.get(keys[i % len(keys)])
+    get_us = (time.perf_counter() - start) / ops * 1e6
+
+    return set_us, get_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache set/get latency vs max_size")
+    parser.add_argument("--ops", type=int, default=20000, help="Operations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'max_size':>10} {'set (us/op)':>12} {'get (us/op)':>12}")
+    for max_size in (100, 1000, 10000, 100000):
+        set_us, get_us = bench(max_size, args.ops)
+        print(f"{max_size:>10} {set_us:>12.2f} {get_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+End-to-end latency benchmark
+Runs the Flask app in-process against the local YouTube stand-in and reports
+/search and /channel latency percentiles, cold (every request a cache miss,
+so an upstream fetch and a parse) and warm (served from the caches), then
+checks the served fields, including paging, against the fixtures.
+
+Usage: python benchmarks/e2e_bench.py [--requests N] [--concurrency C] [--delay-ms D]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import page_fixtures
+import youtube_standin
+from parser_bench import CHANNEL_FIELDS, VIDEO_FIELDS, correctness
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(app, paths, concurrency):
+    """GET every path, return (latencies in ms, non-200 count)"""
+    def fetch(path):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.get(path)
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, paths))
+    return [ms for ms, _ in results], sum(status != 200 for _, status in results)
+
+
+def follow_pages(client, path, key):
+    """All items from path and every page its next_cursor leads to"""
+    items, separator = [], "&" if "?" in path else "?"
+    data = client.get(path).get_json()
+    items.extend(data[key])
+    while data.get("next_cursor"):
+        data = client.get(f"{path}{separator}cursor={data['next_cursor']}").get_json()
+        items.extend(data[key])
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/search and /channel latency against a local YouTube")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Simulated upstream latency per request")
+    args = parser.parse_args()
+
+    server = youtube_standin.start(delay=args.delay_ms / 1000)
+    workdir = tempfile.mkdtemp(prefix="yt-bench-")
+    os.environ["YOUTUBE_BASE_URL"] = server.base_url
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("CACHE_PATH", os.path.join(workdir, "cache.sqlite3"))
+    os.environ["SEARCH_CACHE_SNAPSHOT"] = ""
+    os.environ["CACHE_WARMER"] = "0"
+
+    import app as app_module
+    logging.disable(logging.CRITICAL)
+    app = app_module.app
+    with app.app_context():
+        app_module.db.create_all()
+
+    n = args.requests
+    scenarios = [
+        ("/search cold", [f"/search?q=bench+{i}&type=videos" for i in range(n)]),
+        ("/search warm", ["/search?q=bench+0&type=videos"] * n),
+        ("/channel cold", [f"/channel/UCbench{i}" for i in range(n)]),
+        ("/channel warm", ["/channel/UCbench0"] * n),
+    ]
+    print(f"{n} requests per scenario, concurrency {args.concurrency}, upstream delay {args.delay_ms:g} ms")
+    print(f"{'scenario':<15} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'req/s':>8} {'errors':>7}")
+    for label, paths in scenarios:
+        start = time.perf_counter()
+        latencies, errors = run(app, paths, args.concurrency)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<15} {percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.9):>8.2f} "
+              f"{percentile(latencies, 0.99):>8.2f} {max(latencies):>8.2f} {len(paths) / elapsed:>8.1f} {errors:>7}")
+    print(f"upstream requests: {dict(server.requests)}")
+
+    # Field correctness of what the routes serve, across every page
+    client = app.test_client()
+    _, search_videos = page_fixtures.load("search_videos")
+    _, search_more = page_fixtures.load("search_continuation")
+    _, search_channels = page_fixtures.load("search_channels")
+    _, channel_videos = page_fixtures.load("channel_videos")
+    _, channel_more = page_fixtures.load("channel_continuation")
+    checks = [
+        ("search videos", follow_pages(client, "/search?q=correctness&type=videos", "results"),
+         search_videos["videos"] + search_more["videos"], VIDEO_FIELDS),
+        ("search channels", follow_pages(client, "/search?q=correctness&type=channels", "channels"),
+         search_channels["channels"], CHANNEL_FIELDS),
+        ("channel videos", follow_pages(client, "/channel/UCcorrectness/videos", "videos"),
+         channel_videos["videos"] + channel_more["videos"], ("id", "title", "duration", "publish_time")),
+    ]
+    print(f"\n{'served':<16} {'items':>6} {'expected':>9} {'correct':>8}")
+    for label, items, expected, fields in checks:
+        print(f"{label:<16} {len(items):>6} {len(expected):>9} {correctness(items, expected, fields):>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+"""
+HTML page fixtures for parser benchmarks
+Builds deterministic YouTube-style pages (search results, channel search,
+channel videos, watch pages) with an embedded ytInitialData blob laid out
+like the live site: compact JSON with escaped slashes, tracking noise,
+videoId repeated in navigation endpoints, shorts shelves, live videos without
+lengthText and titles containing quotes, plus the innertube JSON returned for
+search and channel continuations. Each page is stored gzipped next to the
+fields a correct parser should extract.
+
+Run this file to regenerate benchmarks/fixtures/.
+"""
+
+import gzip
+import json
+import os
+import random
+import string
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+WORDS = (
+    "minecraft speedrun lofi beats tutorial python guitar cover review unboxing "
+    "vlog highlights live stream podcast recipe easy quick ultimate guide 2024 "
+    "official music video trailer reaction explained history documentary"
+).split()
+
+
+def _json_for_html(data):
+    """Serialize like YouTube does inside a <script>: compact, with / & < > escaped"""
+    text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    return (text.replace("/", "\\/").replace("&", "\\u0026")
+            .replace("<", "\\u003c").replace(">", "\\u003e"))
+
+
+def _token(rng, length):
+    return "".join(rng.choice(string.ascii_letters + string.digits + "-_") for _ in range(length))
+
+
+def _title(rng, index):
+    words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9))).title()
+    if index % 7 == 3:
+        return f'{words} "Part {index}"'
+    if index % 5 == 1:
+        return f"{words} & More"
+    return words
+
+
+def _channel_endpoint(rng, channel_id, handle):
+    return {
+        "clickTrackingParams": _token(rng, 40),
+        "commandMetadata": {"webCommandMetadata": {
+            "url": f"/@{handle}", "webPageType": "WEB_PAGE_TYPE_CHANNEL",
+            "rootVe": 3611, "apiUrl": "/youtubei/v1/browse"}},
+        "browseEndpoint": {"browseId": channel_id, "canonicalBaseUrl": f"/@{handle}"}
+    }
+
+
+def _byline(rng, channel, channel_id, handle):
+    return {"runs": [{"text": channel, "navigationEndpoint": _channel_endpoint(rng, channel_id, handle)}]}
+
+
+def _video(rng, index, channel=None):
+    """Return (videoRenderer, expected parsed dict)"""
+    video_id = _token(rng, 11)
+    title = _title(rng, index)
+    if channel is None:
+        name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"
+        channel = (name, "UC" + _token(rng, 22), name.replace(" ", "").lower())
+    name, channel_id, handle = channel
+    views = f"{rng.randint(1, 9_999_999):,} views"
+    live = index % 11 == 5
+    duration = None if live else f"{rng.randint(0, 59)}:{rng.randint(0, 59):02d}"
+    published = None if live else f"{rng.randint(1, 11)} months ago"
+    description = None if index % 4 == 2 else " ".join(rng.choice(WORDS) for _ in range(20))
+
+    renderer = {
+        "videoId": video_id,
+        "thumbnail": {"thumbnails": [
+            {"url": f"https://i.ytimg.com/vi/{video_id}/hq720.jpg?sqp={_token(rng, 60)}&rs={_token(rng, 30)}",
+             "width": 360, "height": 202},
+            {"url": f"https://i.ytimg.com/vi/{video_id}/hq720.jpg?sqp={_token(rng, 60)}&rs={_token(rng, 30)}",
+             "width": 720, "height": 404}]},
+        "title": {"runs": [{"text": title}],
+                  "accessibility": {"accessibilityData": {"label": f"{title} by {name} {views}"}}},
+        "longBylineText": _byline(rng, name, channel_id, handle),
+    }
+    if published:
+        renderer["publishedTimeText"] = {"simpleText": published}
+    if duration:
+        renderer["lengthText"] = {
+            "accessibility": {"accessibilityData": {"label": f"{duration} minutes"}},
+            "simpleText": duration}
+    renderer.update({
+        "viewCountText": {"simpleText": views},
+        "navigationEndpoint": {
+            "clickTrackingParams": _token(rng, 40),
+            "commandMetadata": {"webCommandMetadata": {
+                "url": f"/watch?v={video_id}", "webPageType": "WEB_PAGE_TYPE_WATCH", "rootVe": 3832}},
+            "watchEndpoint": {"videoId": video_id, "params": _token(rng, 12),
+                              "watchEndpointSupportedOnesieConfig": {"html5PlaybackOnesieConfig": {
+                                  "commonConfig": {"url": f"https://rr1---sn-{_token(rng, 8)}.googlevideo.com/initplayback?source=youtube&oeis=1"}}}}},
+        "ownerText": _byline(rng, name, channel_id, handle),
+        "shortBylineText": _byline(rng, name, channel_id, handle),
+        "trackingParams": _token(rng, 40),
+        "showActionMenu": False,
+        "shortViewCountText": {"simpleText": views.split(" ")[0] + " views"},
+        "channelThumbnailSupportedRenderers": {"channelThumbnailWithLinkRenderer": {
+            "thumbnail": {"thumbnails": [{"url": f"https://yt3.ggpht.com/{_token(rng, 60)}=s68-c-k-c0x00ffffff-no-rj",
+                                          "width": 68, "height": 68}]},
+            "navigationEndpoint": _channel_endpoint(rng, channel_id, handle)}},
+    })
+    if description:
+        renderer["descriptionSnippet"] = {"runs": [{"text": description}]}
+    renderer["thumbnailOverlays"] = [
+        {"thumbnailOverlayTimeStatusRenderer": {"text": {"simpleText": duration or "LIVE"}, "style": "DEFAULT"}},
+        {"thumbnailOverlayToggleButtonRenderer": {"isToggled": False, "untoggledTooltip": "Watch later",
+                                                  "trackingParams": _token(rng, 40)}},
+    ]
+
+    expected = {
+        "id": video_id,
+        "title": title,
+        "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        "channel": name,
+        "channel_id": channel_id,
+        "views": views,
+        "duration": duration or "Unknown duration",
+        "publish_time": published or "",
+        "description": description or "",
+    }
+    return renderer, expected
+
+
+def _channel(rng, index):
+    """Return (channelRenderer, expected parsed dict)"""
+    channel_id = "UC" + _token(rng, 22)
+    name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {index}"
+    handle = name.replace(" ", "").lower()
+    subscribers = f"{rng.randint(1, 999)}K subscribers"
+    description = " ".join(rng.choice(WORDS) for _ in range(15))
+    thumb = f"//yt3.ggpht.com/{_token(rng, 60)}=s88-c-k-c0x00ffffff-no-rj-mo"
+    renderer = {
+        "channelId": channel_id,
+        "title": {"simpleText": name},
+        "navigationEndpoint": _channel_endpoint(rng, channel_id, handle),
+        "thumbnail": {"thumbnails": [{"url": thumb, "width": 88, "height": 88},
+                                     {"url": thumb.replace("s88", "s176"), "width": 176, "height": 176}]},
+        "descriptionSnippet": {"runs": [{"text": description}]},
+        "shortBylineText": _byline(rng, name, channel_id, handle),
+        "videoCountText": {"runs": [{"text": str(rng.randint(1, 900))}, {"text": " videos"}]},
+        "subscriberCountText": {"accessibility": {"accessibilityData": {"label": subscribers}},
+                                "simpleText": subscribers},
+        "trackingParams": _token(rng, 40),
+        "longBylineText": _byline(rng, name, channel_id, handle),
+    }
+    expected = {
+        "id": channel_id,
+        "name": name,
+        "thumbnail": "https:" + thumb,
+        "subscriber_count": subscribers,
+        "description": description,
+        "handle": "@" + handle,
+    }
+    return renderer, expected
+
+
+def _reel_shelf(rng):
+    """A shorts shelf: videoIds that are not videoRenderers"""
+    items = []
+    for _ in range(6):
+        video_id = _token(rng, 11)
+        items.append({"reelItemRenderer": {
+            "videoId": video_id,
+            "headline": {"simpleText": " ".join(rng.choice(WORDS) for _ in range(4))},
+            "viewCountText": {"simpleText": f"{rng.randint(1, 900)}K views"},
+            "navigationEndpoint": {"reelWatchEndpoint": {"videoId": video_id}},
+            "trackingParams": _token(rng, 40)}})
+    return {"reelShelfRenderer": {"title": {"runs": [{"text": "Shorts"}]}, "items": items}}
+
+
+TRAILING_SCRIPT = 'if (window.ytcsi) {ytcsi.tick("pdr", null, "");} '
+
+
+def _page(title, initial_data, rng):
+    """Wrap ytInitialData in a page with roughly the script weight of the real site"""
+    config = {"INNERTUBE_CONTEXT": {"client": {"hl": "en", "gl": "US", "clientName": "WEB"}},
+              "EXPERIMENT_FLAGS": {f"flag_{i}_{_token(rng, 8)}": (i % 3 == 0) for i in range(3000)},
+              "SERIALIZED_CLIENT_CONFIG_DATA": _token(rng, 20000)}
+    player = {"responseContext": {"serviceTrackingParams": [
+        {"service": "GFEEDBACK", "params": [{"key": f"e{i}", "value": _token(rng, 30)} for i in range(400)]}]}}
+    return (
+        "<!DOCTYPE html><html lang=\"en\"><head>"
+        f"<title>{title} - YouTube</title>"
+        f"<script nonce=\"{_token(rng, 22)}\">var ytcfg = {{}}; ytcfg.set({_json_for_html(config)});</script>"
+        f"<script nonce=\"{_token(rng, 22)}\">{'/* polyfill */ ' * 30000}</script>"
+        "</head><body>"
+        f"<script nonce=\"{_token(rng, 22)}\">var ytInitialData = {_json_for_html(initial_data)};</script>"
+        f"<script nonce=\"{_token(rng, 22)}\">var ytInitialPlayerResponse = {_json_for_html(player)};</script>"
+        f"<script nonce=\"{_token(rng, 22)}\">{TRAILING_SCRIPT * 6000}</script>"
+        "</body></html>"
+    )
+
+
+def build_search_videos(seed=1):
+    rng = random.Random(seed)
+    contents, expected = [], []
+    for i in range(40):
+        renderer, video = _video(rng, i)
+        contents.append({"videoRenderer": renderer})
+        expected.append(video)
+        if i == 4:
+            contents.append(_reel_shelf(rng))
+    contents.append({"continuationItemRenderer": {"continuationEndpoint": {
+        "continuationCommand": {"token": _token(rng, 120), "request": "CONTINUATION_REQUEST_TYPE_SEARCH"}}}})
+    data = {"estimatedResults": "1234567", "contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {
+        "sectionListRenderer": {"contents": [{"itemSectionRenderer": {"contents": contents}}]}}}}}
+    return _page("minecraft speedrun", data, rng), {"videos": expected}
+
+
+def build_search_channels(seed=2):
+    rng = random.Random(seed)
+    contents, expected = [], []
+    for i in range(20):
+        renderer, channel = _channel(rng, i)
+        contents.append({"channelRenderer": renderer})
+        expected.append(channel)
+    data = {"estimatedResults": "9000", "contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {
+        "sectionListRenderer": {"contents": [{"itemSectionRenderer": {"contents": contents}}]}}}}}
+    return _page("lofi", data, rng), {"channels": expected}
+
+
+def build_channel_videos(seed=3):
+    rng = random.Random(seed)
+    name = "Lofi Girl"
+    channel = (name, "UC" + _token(rng, 22), "lofigirl")
+    subscribers = "14.2M subscribers"
+    contents, expected = [], []
+    for i in range(30):
+        renderer, video = _video(rng, i, channel=channel)
+        # Channel grids list videos without owner bylines
+        for key in ("ownerText", "longBylineText", "shortBylineText"):
+            renderer.pop(key)
+        video["channel"] = "Unknown Channel"
+        video["channel_id"] = ""
+        contents.append({"richItemRenderer": {"content": {"videoRenderer": renderer}}})
+        expected.append(video)
+    contents.append({"continuationItemRenderer": {"continuationEndpoint": {
+        "continuationCommand": {"token": _token(rng, 120), "request": "CONTINUATION_REQUEST_TYPE_BROWSE"}}}})
+    data = {
+        "header": {"c4TabbedHeaderRenderer": {
+            "channelId": channel[1], "title": name,
+            "subscriberCountText": {"accessibility": {"accessibilityData": {"label": subscribers}},
+                                    "simpleText": subscribers}}},
+        "contents": {"twoColumnBrowseResultsRenderer": {"tabs": [{"tabRenderer": {
+            "title": "Videos", "selected": True,
+            "content": {"richGridRenderer": {"contents": contents}}}}]}},
+        "metadata": {"channelMetadataRenderer": {"title": name, "externalId": channel[1]}},
+    }
+    return _page(name, data, rng), {"title": name, "subscriber_count": subscribers, "videos": expected}
+
+
+def _watch(rng, title, playability, video_id=None):
+    video_id = video_id or _token(rng, 11)
+    player = {
+        "playabilityStatus": playability,
+        "videoDetails": {"videoId": video_id, "title": title, "lengthSeconds": str(rng.randint(60, 3600)),
+                         "author": "Lofi Girl", "shortDescription": " ".join(rng.choice(WORDS) for _ in range(80))},
+        "streamingData": {"adaptiveFormats": [
+            {"itag": itag, "mimeType": mime, "bitrate": rng.randint(50_000, 5_000_000),
+             "signatureCipher": f"s={_token(rng, 100)}&sp=sig&url=https://rr1---sn-{_token(rng, 8)}.googlevideo.com/videoplayback"}
+            for itag, mime in ((137, 'video/mp4; codecs="avc1.640028"'), (248, 'video/webm; codecs="vp9"'),
+                               (140, 'audio/mp4; codecs="mp4a.40.2"'), (251, 'audio/webm; codecs="opus"'))]}
+    }
+    data = {"contents": {"twoColumnWatchNextResults": {"results": {"results": {"contents": [
+        {"videoPrimaryInfoRenderer": {"title": {"runs": [{"text": title}]},
+                                      "viewCount": {"videoViewCountRenderer": {
+                                          "viewCount": {"simpleText": f"{rng.randint(1, 9_999_999):,} views"}}}}}]}}}}}
+    html = _page(title, data, rng).replace(
+        "var ytInitialPlayerResponse = ",
+        f"var ytInitialPlayerResponse = {_json_for_html(player)}; var ytUnusedPlayerResponse = ", 1)
+    return video_id, html
+
+
+def build_watch(seed=4):
+    rng = random.Random(seed)
+    title = "lofi hip hop radio - beats to relax/study to"
+    video_id, html = _watch(rng, title, {"status": "OK", "playableInEmbed": True})
+    return html, {"video_id": video_id, "title": title, "is_restricted": False, "error_message": None}
+
+
+def build_watch_restricted(seed=5):
+    rng = random.Random(seed)
+    title = "Age gated documentary"
+    # Age-gated videos come back as LOGIN_REQUIRED with a sign-in reason
+    video_id, html = _watch(rng, title, {
+        "status": "LOGIN_REQUIRED", "reason": "Sign in to confirm your age",
+        "errorScreen": {"playerErrorMessageRenderer": {
+            "reason": {"simpleText": "Sign in to confirm your age"},
+            "subreason": {"runs": [{"text": "This video may be inappropriate for some users."}]}}},
+        "desktopLegacyAgeGateReason": 1})
+    return html, {"video_id": video_id, "title": title, "is_restricted": True,
+                  "error_message": "This video is age-restricted"}
+
+
+def build_search_continuation(seed=6):
+    """innertube /youtubei/v1/search response for the page after search_videos"""
+    rng = random.Random(seed)
+    contents, expected = [], []
+    for i in range(20):
+        renderer, video = _video(rng, i)
+        contents.append({"videoRenderer": renderer})
+        expected.append(video)
+    data = {"responseContext": {"visitorData": _token(rng, 40)}, "estimatedResults": "1234567",
+            "onResponseReceivedCommands": [{"appendContinuationItemsAction": {"continuationItems": [
+                {"itemSectionRenderer": {"contents": contents}}]}}]}
+    return json.dumps(data, separators=(",", ":")), {"videos": expected}
+
+
+def build_channel_continuation(seed=7):
+    """innertube /youtubei/v1/browse response for the page after channel_videos"""
+    rng = random.Random(seed)
+    channel = ("Lofi Girl", "UC" + _token(rng, 22), "lofigirl")
+    contents, expected = [], []
+    for i in range(30):
+        renderer, video = _video(rng, i, channel=channel)
+        for key in ("ownerText", "longBylineText", "shortBylineText"):
+            renderer.pop(key)
+        video["channel"] = "Unknown Channel"
+        video["channel_id"] = ""
+        contents.append({"richItemRenderer": {"content": {"videoRenderer": renderer}}})
+        expected.append(video)
+    data = {"responseContext": {"visitorData": _token(rng, 40)},
+            "onResponseReceivedActions": [{"appendContinuationItemsAction": {"continuationItems": contents}}]}
+    return json.dumps(data, separators=(",", ":")), {"videos": expected}
+
+
+BUILDERS = {
+    "search_videos": build_search_videos,
+    "search_channels": build_search_channels,
+    "channel_videos": build_channel_videos,
+    "watch": build_watch,
+    "watch_restricted": build_watch_restricted,
+    "search_continuation": build_search_continuation,
+    "channel_continuation": build_channel_continuation,
+}
+
+# Fixtures that are innertube JSON responses rather than HTML pages
+JSON_FIXTURES = frozenset(("search_continuation", "channel_continuation"))
+
+
+def _fixture_path(name):
+    extension = "json" if name in JSON_FIXTURES else "html"
+    return os.path.join(FIXTURE_DIR, f"{name}.{extension}.gz")
+
+
+def load(name):
+    """Return (body, expected) for a stored fixture"""
+    with gzip.open(_fixture_path(name), "rt", encoding="utf-8") as f:
+        html = f.read()
+    with open(os.path.join(FIXTURE_DIR, f"{name}.expected.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+    return html, expected
+
+
+def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for name, builder in BUILDERS.items():
+        html, expected = builder()
+        with gzip.GzipFile(_fixture_path(name), "wb", mtime=0) as f:
+            f.write(html.encode("utf-8"))
+        with open(os.path.join(FIXTURE_DIR, f"{name}.expected.json"), "w", encoding="utf-8") as f:
+            json.dump(expected, f, indent=1, ensure_ascii=False)
+        print(f"{name}: {len(html) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
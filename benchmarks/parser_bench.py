@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Parser benchmark
+Compares the ytInitialData single-pass parser with the per-field regex
+extraction on the HTML fixtures in benchmarks/fixtures, reporting time per
+page, time per MB, throughput and how many extracted fields match the
+expected values. Also checks the channel title/subscriber extraction and the
+watch-page restriction check.
+
+Usage: python benchmarks/parser_bench.py [--repeat N]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import page_fixtures
+from youtube_service import YouTubeService
+
+VIDEO_FIELDS = ("id", "title", "channel", "channel_id", "views", "duration", "publish_time", "description")
+CHANNEL_FIELDS = ("id", "name", "thumbnail", "subscriber_count", "description", "handle")
+
+
+def correctness(items, expected, fields):
+    """Fraction of expected (item, field) values reproduced at the same position"""
+    total = matched = 0
+    for i, want in enumerate(expected):
+        got = items[i] if i < len(items) else {}
+        for field in fields:
+            total += 1
+            matched += got.get(field) == want.get(field)
+    return matched / total if total else 1.0
+
+
+def timed(fn, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(html)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ytInitialData parser vs regex extraction")
+    parser.add_argument("--repeat", type=int, default=20, help="Parses per measurement")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    service = YouTubeService()
+    cases = [
+        ("search_videos", "videos", service._extract_video_id, service._extract_video_id_regex, VIDEO_FIELDS),
+        ("channel_videos", "videos", service._extract_video_id, service._extract_video_id_regex, VIDEO_FIELDS),
+        ("search_channels", "channels", service._extract_channel_info, service._extract_channel_info_regex,
+         CHANNEL_FIELDS),
+    ]
+
+    print(f"{'fixture':<16} {'path':<7} {'ms/page':>8} {'ms/MB':>7} {'MB/s':>7} {'items':>6} {'correct':>8}")
+    for name, key, fast, slow, fields in cases:
+        html, expected = page_fixtures.load(name)
+        mb = len(html.encode("utf-8")) / 1e6
+        for label, fn in (("regex", slow), ("parser", fast)):
+            seconds, items = timed(fn, html, args.repeat)
+            score = correctness(items, expected[key], fields)
+            print(f"{name:<16} {label:<7} {seconds * 1000:>8.2f} {seconds * 1000 / mb:>7.2f} {mb / seconds:>7.1f} "
+                  f"{len(items):>6} {score:>7.1%}")
+
+    # Whole channel page: title and subscriber regexes plus the video list
+    html, expected = page_fixtures.load("channel_videos")
+    mb = len(html.encode("utf-8")) / 1e6
+    seconds, channel = timed(lambda page: service._parse_channel_page("UCbenchmark", page), html, args.repeat)
+    header = [(field, channel.get(field), expected[field]) for field in ("title", "subscriber_count")]
+    print(f"\nchannel page     {seconds * 1000:.2f} ms/page, {seconds * 1000 / mb:.2f} ms/MB")
+    for field, got, want in header:
+        print(f"  {field:<17} {'ok' if got == want else 'WRONG':<6} got {got!r}, expected {want!r}")
+
+    # Watch page restriction check
+    print()
+    for name in ("watch", "watch_restricted"):
+        html, expected = page_fixtures.load(name)
+        mb = len(html.encode("utf-8")) / 1e6
+        info = {'url': None, 'is_restricted': False, 'error_message': None}
+        seconds, _ = timed(lambda page: service._check_watch_page(page, dict(info)), html, args.repeat)
+        service._check_watch_page(html, info)
+        ok = all(info[field] == expected[field] for field in ("is_restricted", "error_message"))
+        print(f"{name:<16} {seconds * 1000:.2f} ms/page, {seconds * 1000 / mb:.2f} ms/MB  {'ok' if ok else 'WRONG':<6} "
+              f"got restricted={info['is_restricted']} error={info['error_message']!r}")
+
+
+if __name__ == "__main__":
+    main()
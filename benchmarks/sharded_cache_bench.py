@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Threaded cache benchmark
+Compares throughput of the single-lock Cache against ShardedCache with
+several threads doing a mixed get/set workload, as under gthread workers.
+
+Usage: python benchmarks/sharded_cache_bench.py [--threads 1,4,8,16] [--ops N] [--shards N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import Cache, ShardedCache
+
+KEY_SPACE = 2000
+
+
+def worker(cache, ops, read_ratio, seed, barrier):
+    rng = random.Random(seed)
+    keys = [f"videos:query {rng.randrange(KEY_SPACE)}" for _ in range(ops)]
+    reads = [rng.random() < read_ratio for _ in range(ops)]
+    barrier.wait()
+    for key, read in zip(keys, reads):
+        if read:
+            cache.get(key)
+        else:
+            cache.set(key, {"results": [key]})
+
+
+def run(cache, threads, ops, read_ratio):
+    """Return total operations per second across all threads"""
+    for i in range(KEY_SPACE // 2):
+        cache.set(f"videos:query {i}", {"results": [i]})
+    barrier = threading.Barrier(threads + 1)
+    pool = [
+        threading.Thread(target=worker, args=(cache, ops, read_ratio, seed, barrier))
+        for seed in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return threads * ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-lock vs sharded cache throughput")
+    parser.add_argument("--threads", default="1,4,8,16", help="Comma-separated thread counts")
+    parser.add_argument("--ops", type=int, default=50000, help="Operations per thread")
+    parser.add_argument("--shards", type=int, default=16, help="Shards for ShardedCache")
+    parser.add_argument("--read-ratio", type=float, default=0.9, help="Fraction of operations that are gets")
+    args = parser.parse_args()
+
+    print(f"{'threads':>8} {'Cache (ops/s)':>15} {'Sharded (ops/s)':>16} {'speedup':>8}")
+    for threads in (int(t) for t in args.threads.split(",")):
+        single = run(Cache(max_size=1000), threads, args.ops, args.read_ratio)
+        sharded = run(ShardedCache(shards=args.shards, max_size=1000), threads, args.ops, args.read_ratio)
+        print(f"{threads:>8} {single:>15,.0f} {sharded:>16,.0f} {sharded / single:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
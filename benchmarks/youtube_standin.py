@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Local YouTube stand-in
+Serves the benchmark fixtures over HTTP with the URL layout the services
+use, so search, channel, watch and pagination flows can be measured end to
+end without touching live YouTube.
+
+  GET  /results?search_query=...&sp=...   search_videos (search_channels for the channel filter)
+  GET  /channel/<id>/videos, /@<handle>/videos, /c/<name>/videos, /user/<name>/videos
+                                          channel_videos
+  GET  /watch?v=<id>                      watch (watch_restricted for ids starting with "age")
+  GET  /embed/<id>, /shorts/<id>          a small player page (HEAD too)
+  POST /youtubei/v1/search, /browse       search_continuation, channel_continuation
+
+Usage: python benchmarks/youtube_standin.py [--port 8765] [--delay-ms 0]
+then start the app with YOUTUBE_BASE_URL=http://127.0.0.1:8765
+"""
+
+import argparse
+import collections
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import page_fixtures
+
+# Prefix of the sp filter the services send for a channel search
+CHANNEL_FILTER = "EgIQAg"
+
+EMBED_PAGE = b"<!DOCTYPE html><html><head><title>YouTube</title></head><body><div id=\"player\"></div></body></html>"
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0):
+        super().__init__(address, StandinHandler)
+        self.delay = delay
+        self.pages = {name: page_fixtures.load(name)[0].encode("utf-8") for name in page_fixtures.BUILDERS}
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] += 1
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _route(self):
+        """(fixture kind, body, content type) for the request, or None for 404"""
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+        pages = self.server.pages
+        if url.path == "/results":
+            if query.get("sp", [""])[0].startswith(CHANNEL_FILTER):
+                return "search_channels", pages["search_channels"], "text/html"
+            return "search_videos", pages["search_videos"], "text/html"
+        if url.path == "/watch":
+            video_id = query.get("v", [""])[0]
+            name = "watch_restricted" if video_id.startswith("age") else "watch"
+            return name, pages[name], "text/html"
+        if len(parts) == 2 and parts[0] in ("embed", "shorts"):
+            return parts[0], EMBED_PAGE, "text/html"
+        if parts and parts[-1] == "videos" and (parts[0] in ("channel", "c", "user") or parts[0].startswith("@")):
+            return "channel_videos", pages["channel_videos"], "text/html"
+        return None
+
+    def _respond(self, kind, body, content_type, head=False):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.server.count(kind)
+        self.send_response(200 if kind != "not_found" else 404)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        route = self._route()
+        if route is None:
+            self._respond("not_found", b"Not Found", "text/plain")
+        else:
+            self._respond(*route)
+
+    def do_HEAD(self):
+        route = self._route()
+        if route is None:
+            self._respond("not_found", b"", "text/plain", head=True)
+        else:
+            self._respond(*route, head=True)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        path = urlparse(self.path).path
+        if path == "/youtubei/v1/search":
+            self._respond("search_continuation", self.server.pages["search_continuation"], "application/json")
+        elif path == "/youtubei/v1/browse":
+            self._respond("channel_continuation", self.server.pages["channel_continuation"], "application/json")
+        else:
+            self._respond("not_found", b"{}", "application/json")
+
+
+def start(port=0, delay=0.0):
+    """Serve on 127.0.0.1 from a daemon thread and return the server"""
+    server = StandinServer(("127.0.0.1", port), delay=delay)
+    threading.Thread(target=server.serve_forever, name="youtube-standin", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve benchmark fixtures as a local YouTube")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Added latency per request")
+    args = parser.parse_args()
+
+    server = StandinServer(("127.0.0.1", args.port), delay=args.delay_ms / 1000)
+    print(f"Serving fixtures on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(dict(server.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,111 +1,1065 @@
-from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Callable, Iterable, Iterator, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import heapq
+import itertools
+import os
+import pickle
+import sqlite3
+import sys
 import threading
 import logging
+import time
+import zlib
 from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+def estimate_size(value: Any) -> int:
+    """Estimate the memory footprint of a value in bytes.
+
+    Walks dicts, lists, tuples and sets adding sys.getsizeof of every object,
+    counting shared objects once. It is an estimate of what the value keeps
+    alive, good enough for budgeting, not an exact allocator figure.
+    """
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
+
 class CacheEntry:
-    def __init__(self, value: Any, ttl: int):
+    """A cached value with its absolute expiry times on the backend's clock.
+
+    An entry is fresh until stale_at and still servable, but due for a
+    refresh, until expires_at. Without a soft TTL both times are equal.
+    """
+    __slots__ = ("value", "expires_at", "stale_at", "last_accessed", "size")
+
+    def __init__(self, value: Any, ttl: int, now: Optional[float] = None, soft_ttl: Optional[int] = None,
+                 size: int = 0):
+        if now is None:
+            now = time.monotonic()
         self.value = value
-        self.timestamp = datetime.now()
-        self.ttl = ttl
-        self.last_accessed = datetime.now()
+        self.expires_at = now + ttl
+        self.stale_at = now + min(soft_ttl, ttl) if soft_ttl is not None else self.expires_at
+        self.last_accessed = now
+        self.size = size
+
+    @classmethod
+    def restore(cls, value: Any, expires_at: float, last_accessed: float,
+                stale_at: Optional[float] = None, size: int = 0) -> "CacheEntry":
+        """Rebuild an entry from stored absolute timestamps"""
+        entry = cls.__new__(cls)
+        entry.value = value
+        entry.expires_at = expires_at
+        entry.stale_at = stale_at if stale_at is not None else expires_at
+        entry.last_accessed = last_accessed
+        entry.size = size or 0
+        return entry
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        return now > self.expires_at
+
+    def is_stale(self, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        return now > self.stale_at
+
+class MemoryBackend:
+    """Per-process storage: an LRU-ordered dict plus a min-heap expiry index"""
+
+    def __init__(self):
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        # Min-heap of (expires_at, seq, key) so expired entries can be found
+        # without scanning the whole cache. Records for keys that were
+        # overwritten or evicted are left in place and skipped when popped.
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._bytes = 0
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        return self._entries.get(key)
+
+    def touch(self, key: str, entry: CacheEntry, now: float) -> None:
+        entry.last_accessed = now
+        self._entries.move_to_end(key)
+
+    def put(self, key: str, entry: CacheEntry, max_size: int, max_bytes: Optional[int] = None) -> int:
+        """Store entry as most recently used, returning the number of LRU evictions.
+
+        Evicts until there is room for one more entry and, with max_bytes,
+        until the new entry fits in the byte budget.
+        """
+        self.delete(key)
+        evicted = 0
+        while self._entries and (
+            len(self._entries) >= max_size
+            or (max_bytes is not None and self._bytes + entry.size > max_bytes)
+        ):
+            _, lru_entry = self._entries.popitem(last=False)  # Remove the first item (least recently used)
+            self._bytes -= lru_entry.size
+            evicted += 1
+        self._entries[key] = entry
+        self._bytes += entry.size
+        heapq.heappush(self._expiry_heap, (entry.expires_at, next(self._seq), key))
+        return evicted
+
+    def put_many(self, entries: List[Tuple[str, CacheEntry]], max_size: int, max_bytes: Optional[int] = None,
+                 keep_fresh_at: Optional[float] = None) -> Tuple[int, int]:
+        """Store several entries, returning (entries stored, LRU evictions).
+
+        With keep_fresh_at, keys whose current entry is still fresh at that
+        time are left alone.
+        """
+        stored = evicted = 0
+        for key, entry in entries:
+            existing = self._entries.get(key)
+            if keep_fresh_at is not None and existing is not None and existing.stale_at > keep_fresh_at:
+                continue
+            evicted += self.put(key, entry, max_size, max_bytes)
+            stored += 1
+        return stored, evicted
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.delete(key)
+
+    def remove_expired(self, now: float) -> int:
+        """Pop due records off the expiry heap, returning the number removed"""
+        removed = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] < now:
+            _, _, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            # Skip stale heap records whose key was refreshed or removed
+            if entry is not None and entry.is_expired(now):
+                self.delete(key)
+                removed += 1
+
+        # Rebuild the heap once stale records outnumber live entries
+        if len(heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [
+                (entry.expires_at, next(self._seq), key)
+                for key, entry in self._entries.items()
+            ]
+            heapq.heapify(self._expiry_heap)
+        return removed
+
+    def keys(self) -> List[str]:
+        return list(self._entries.keys())
+
+    def timestamps(self) -> List[Tuple[str, float, float]]:
+        """(key, stale_at, expires_at) for every stored entry, LRU first"""
+        return [(key, entry.stale_at, entry.expires_at) for key, entry in self._entries.items()]
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        """Every stored (key, entry) pair, LRU first"""
+        return list(self._entries.items())
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def bytes_used(self) -> int:
+        return self._bytes
+
+    def largest(self, n: int) -> List[Tuple[str, int]]:
+        """The n biggest entries as (key, size) pairs"""
+        return heapq.nlargest(n, ((key, entry.size) for key, entry in self._entries.items()),
+                              key=lambda item: item[1])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._expiry_heap.clear()
+        self._bytes = 0
+
+class SQLiteBackend:
+    """Node-local storage shared by every process that opens the same file.
+
+    Uses SQLite in WAL mode so gunicorn workers can read concurrently while
+    one writes. Timestamps are wall-clock because the monotonic clock is not
+    comparable across processes. Values are pickled, so the file must only be
+    writable by this application.
+
+    Entry and byte totals per namespace are kept in cache_counts by triggers,
+    in the same transaction as the change, so size checks on every write
+    don't have to count the namespace.
+    """
+
+    # Skip the LRU write on a hit if the entry was touched this recently,
+    # so hot keys don't turn every read into a write transaction
+    TOUCH_INTERVAL = 1.0
+
+    def __init__(self, path: str, namespace: str = "default", timeout: float = 5.0):
+        self._path = path
+        self._namespace = namespace
+        self._timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_accessed REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._add_missing_columns(conn, {"stale_at": "REAL", "size": "INTEGER NOT NULL DEFAULT 0"})
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_expires"
+                " ON cache_entries (namespace, expires_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_lru"
+                " ON cache_entries (namespace, last_accessed)"
+            )
+        self._create_counts(conn)
+
+    @staticmethod
+    def _create_counts(conn: sqlite3.Connection) -> None:
+        """Set up the cache_counts triggers, seeding the totals for a file that predates them"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seeded = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'cache_counts_insert'"
+            ).fetchone()
+            if seeded is None:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_counts ("
+                    " namespace TEXT PRIMARY KEY,"
+                    " entries INTEGER NOT NULL,"
+                    " bytes INTEGER NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TRIGGER cache_counts_insert AFTER INSERT ON cache_entries BEGIN"
+                    # Not INSERT OR IGNORE: the outer INSERT OR REPLACE would override it
+                    " INSERT INTO cache_counts SELECT NEW.namespace, 0, 0"
+                    "  WHERE NOT EXISTS (SELECT 1 FROM cache_counts WHERE namespace = NEW.namespace);"
+                    " UPDATE cache_counts SET entries = entries + 1, bytes = bytes + NEW.size"
+                    "  WHERE namespace = NEW.namespace;"
+                    " END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER cache_counts_delete AFTER DELETE ON cache_entries BEGIN"
+                    " UPDATE cache_counts SET entries = entries - 1, bytes = bytes - OLD.size"
+                    "  WHERE namespace = OLD.namespace;"
+                    " END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER cache_counts_resize AFTER UPDATE OF size ON cache_entries BEGIN"
+                    " UPDATE cache_counts SET bytes = bytes + NEW.size - OLD.size"
+                    "  WHERE namespace = NEW.namespace;"
+                    " END"
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_counts"
+                    " SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries GROUP BY namespace"
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _add_missing_columns(conn: sqlite3.Connection, columns: Dict[str, str]) -> None:
+        """Upgrade a cache file created by an older version of this backend"""
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(cache_entries)")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE cache_entries ADD COLUMN {name} {column_type}")
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not thread-safe"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Rows replaced by INSERT OR REPLACE must fire the delete trigger
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+        return conn
+
+    def now(self) -> float:
+        return time.time()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        row = self._conn().execute(
+            "SELECT value, expires_at, last_accessed, stale_at, size FROM cache_entries"
+            " WHERE namespace = ? AND key = ?",
+            (self._namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            value = pickle.loads(row[0])
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {str(e)}")
+            self.delete(key)
+            return None
+        return CacheEntry.restore(value, row[1], row[2], row[3], row[4])
+
+    def touch(self, key: str, entry: CacheEntry, now: float) -> None:
+        if now - entry.last_accessed < self.TOUCH_INTERVAL:
+            return
+        entry.last_accessed = now
+        self._conn().execute(
+            "UPDATE cache_entries SET last_accessed = ? WHERE namespace = ? AND key = ?",
+            (now, self._namespace, key)
+        )
+
+    def put(self, key: str, entry: CacheEntry, max_size: int, max_bytes: Optional[int] = None) -> int:
+        """Store entry and trim the namespace to its limits in one transaction"""
+        conn = self._conn()
+        blob = pickle.dumps(entry.value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries"
+                " (namespace, key, value, expires_at, last_accessed, stale_at, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._namespace, key, blob, entry.expires_at, entry.last_accessed, entry.stale_at, entry.size)
+            )
+            evicted = self._trim(conn, key, max_size, max_bytes)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def put_many(self, entries: List[Tuple[str, CacheEntry]], max_size: int, max_bytes: Optional[int] = None,
+                 keep_fresh_at: Optional[float] = None) -> Tuple[int, int]:
+        """Store several entries and trim once, all in one transaction; returns (stored, evicted).
+
+        With keep_fresh_at, keys whose current entry is still fresh at that
+        time are left alone.
+        """
+        if not entries:
+            return 0, 0
+        rows = [
+            (self._namespace, key, pickle.dumps(entry.value, protocol=pickle.HIGHEST_PROTOCOL),
+             entry.expires_at, entry.last_accessed, entry.stale_at, entry.size, keep_fresh_at)
+            for key, entry in entries
+        ]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.executemany(
+                "INSERT INTO cache_entries"
+                " (namespace, key, value, expires_at, last_accessed, stale_at, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET"
+                " value = excluded.value, expires_at = excluded.expires_at,"
+                " last_accessed = excluded.last_accessed, stale_at = excluded.stale_at, size = excluded.size"
+                " WHERE ?8 IS NULL OR COALESCE(cache_entries.stale_at, cache_entries.expires_at) <= ?8",
+                rows
+            )
+            stored = max(cursor.rowcount, 0)
+            evicted = self._trim(conn, entries[-1][0], max_size, max_bytes)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return stored, evicted
+
+    def _trim(self, conn: sqlite3.Connection, keep_key: str, max_size: int, max_bytes: Optional[int]) -> int:
+        """Delete LRU entries while the namespace is over its limits"""
+        evicted = 0
+        excess = self._counts(conn)[0] - max_size
+        if excess > 0:
+            cursor = conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache_entries WHERE namespace = ?"
+                " ORDER BY last_accessed LIMIT ?)",
+                (self._namespace, self._namespace, excess)
+            )
+            evicted = max(cursor.rowcount, 0)
+        if max_bytes is not None:
+            evicted += self._trim_bytes(conn, keep_key, max_bytes)
+        return evicted
+
+    def _trim_bytes(self, conn: sqlite3.Connection, keep_key: str, max_bytes: int) -> int:
+        """Delete LRU entries, other than keep_key, until the namespace fits max_bytes"""
+        excess = self._counts(conn)[1] - max_bytes
+        if excess <= 0:
+            return 0
+        victims = []
+        rows = conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? AND key != ?"
+            " ORDER BY last_accessed",
+            (self._namespace, keep_key)
+        )
+        for victim_key, size in rows:
+            if excess <= 0:
+                break
+            victims.append((self._namespace, victim_key))
+            excess -= size
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+        return len(victims)
+
+    def delete(self, key: str) -> None:
+        self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self._namespace, key)
+        )
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """Delete several keys in one transaction"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                             [(self._namespace, key) for key in keys])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove_expired(self, now: float) -> int:
+        cursor = self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at < ?",
+            (self._namespace, now)
+        )
+        return max(cursor.rowcount, 0)
+
+    def keys(self) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY last_accessed",
+            (self._namespace,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def timestamps(self) -> List[Tuple[str, float, float]]:
+        """(key, stale_at, expires_at) for every stored entry, LRU first"""
+        return self._conn().execute(
+            "SELECT key, COALESCE(stale_at, expires_at), expires_at FROM cache_entries"
+            " WHERE namespace = ? ORDER BY last_accessed",
+            (self._namespace,)
+        ).fetchall()
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        """Every stored (key, entry) pair, LRU first"""
+        rows = self._conn().execute(
+            "SELECT key, value, expires_at, last_accessed, stale_at, size FROM cache_entries"
+            " WHERE namespace = ? ORDER BY last_accessed",
+            (self._namespace,)
+        ).fetchall()
+        entries = []
+        for key, blob, expires_at, last_accessed, stale_at, size in rows:
+            try:
+                value = pickle.loads(blob)
+            except Exception:
+                continue
+            entries.append((key, CacheEntry.restore(value, expires_at, last_accessed, stale_at, size)))
+        return entries
+
+    def _counts(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        """(entries, bytes) stored in this namespace"""
+        row = conn.execute(
+            "SELECT entries, bytes FROM cache_counts WHERE namespace = ?", (self._namespace,)
+        ).fetchone()
+        return (row[0], row[1]) if row is not None else (0, 0)
+
+    def size(self) -> int:
+        return self._counts(self._conn())[0]
+
+    def bytes_used(self) -> int:
+        return self._counts(self._conn())[1]
+
+    def largest(self, n: int) -> List[Tuple[str, int]]:
+        """The n biggest entries as (key, size) pairs"""
+        return self._conn().execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY size DESC LIMIT ?",
+            (self._namespace, n)
+        ).fetchall()
+
+    def clear(self) -> None:
+        self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ?", (self._namespace,)
+        )
+
+def create_backend(name: str, path: Optional[str] = None, namespace: str = "default"):
+    """Build a cache backend from a configuration name ('memory' or 'sqlite')"""
+    if name == "sqlite":
+        return SQLiteBackend(path or os.path.join(os.getcwd(), "instance", "cache.sqlite3"), namespace=namespace)
+    if name != "memory":
+        logger.warning(f"Unknown cache backend '{name}', using memory")
+    return MemoryBackend()
+
+SNAPSHOT_VERSION = 1
+
+def _write_snapshot(path: str, records: Iterable[Tuple[str, Any, float, float]]) -> int:
+    """Stream (key, value, expires_in, stale_in) records to path atomically.
+
+    The file is a header followed by one pickle per record, so it can be
+    read back one entry at a time. It is written to a temporary file and
+    renamed, so concurrent writers and readers never see a partial file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    count = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": SNAPSHOT_VERSION, "saved_at": time.time()}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            for record in records:
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+                count += 1
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
+
+def _read_snapshot(path: str) -> Iterator[Tuple[str, Any, float, float]]:
+    """Yield records from a snapshot with TTLs adjusted for time since it was saved"""
+    with open(path, "rb") as f:
+        header = pickle.load(f)
+        if header.get("version") != SNAPSHOT_VERSION:
+            logger.warning(f"Ignoring snapshot {path} with unknown version {header.get('version')}")
+            return
+        elapsed = max(0.0, time.time() - header["saved_at"])
+        while True:
+            try:
+                key, value, expires_in, stale_in = pickle.load(f)
+            except EOFError:
+                return
+            if expires_in - elapsed > 0:
+                yield key, value, expires_in - elapsed, stale_in - elapsed
+
+class SnapshotMixin:
+    """Snapshot/restore for caches that provide _snapshot_records and _restore_entry.
+
+    Snapshots hold pickled values, so the file must only be writable by this
+    application, like the SQLite backend.
+    """
+
+    def save_snapshot(self, path: str) -> int:
+        """Write every non-expired entry with its remaining TTL to path"""
+        try:
+            count = _write_snapshot(path, self._snapshot_records())
+            logger.debug(f"Saved {count} cache entries to {path}")
+            return count
+        except Exception as e:
+            logger.error(f"Failed to save cache snapshot to {path}: {str(e)}")
+            return 0
+
+    def load_snapshot(self, path: str, background: bool = True) -> Optional[threading.Thread]:
+        """Restore entries from path.
+
+        By default entries are streamed in on a daemon thread so startup
+        doesn't wait for the snapshot; entries set by live traffic meanwhile
+        are never overwritten by older snapshot data.
+        """
+        if not os.path.exists(path):
+            return None
+        if not background:
+            self._load_snapshot(path)
+            return None
+        thread = threading.Thread(target=self._load_snapshot, args=(path,),
+                                  name="cache-snapshot-load", daemon=True)
+        thread.start()
+        return thread
+
+    def _load_snapshot(self, path: str) -> int:
+        count = 0
+        try:
+            for key, value, expires_in, stale_in in _read_snapshot(path):
+                if self._restore_entry(key, value, expires_in, stale_in):
+                    count += 1
+            logger.info(f"Restored {count} cache entries from {path}")
+        except Exception as e:
+            logger.error(f"Failed to load cache snapshot from {path}: {str(e)}")
+        return count
+
+    def start_snapshotting(self, path: str, interval: int = 300) -> threading.Thread:
+        """Save a snapshot every interval seconds and once more at interpreter exit"""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.save_snapshot(path)
 
-    def is_expired(self) -> bool:
-        return datetime.now() - self.timestamp > timedelta(seconds=self.ttl)
+        def on_exit():
+            stop.set()
+            self.save_snapshot(path)
 
-class Cache:
-    def __init__(self, ttl_seconds: int = 3600, max_size: int = 1000, prefix: str = ""):
-        self._cache: OrderedDict[str, CacheEntry] = OrderedDict()
+        thread = threading.Thread(target=run, name="cache-snapshot", daemon=True)
+        thread.start()
+        atexit.register(on_exit)
+        return thread
+
+class Cache(SnapshotMixin):
+    """TTL + LRU cache over a pluggable storage backend.
+
+    With soft_ttl_seconds set the cache runs in stale-while-revalidate mode:
+    ttl_seconds is the hard TTL after which an entry is dropped, and between
+    the soft and hard TTL get() still returns the stale value while at most
+    one background refresh per key reloads it.
+
+    With max_bytes set the cache is also byte-bounded: each value's size is
+    estimated when stored and LRU entries are evicted until it fits.
+
+    Failures can be remembered with set_negative() in a separate store with
+    its own short TTLs, chosen per error class from negative_ttls (falling
+    back to negative_ttl_seconds; a TTL of 0 means that class is never
+    cached). A successful set() clears any negative entry for the key.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_size: int = 1000, prefix: str = "", backend=None,
+                 soft_ttl_seconds: Optional[int] = None, refresh_workers: int = 2,
+                 max_bytes: Optional[int] = None, negative_ttl_seconds: int = 60,
+                 negative_ttls: Optional[Dict[str, int]] = None, negative_backend=None):
+        self._backend = backend if backend is not None else MemoryBackend()
+        self._negative_backend = negative_backend if negative_backend is not None else MemoryBackend()
+        self._negative_ttl = negative_ttl_seconds
+        self._negative_ttls = dict(negative_ttls or {})
+        self._negative_stats = {
+            "hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "skipped": 0
+        }
+        self._negative_by_class: Dict[str, int] = {}
+        self._max_bytes = max_bytes
         self._default_ttl = ttl_seconds
+        self._soft_ttl = soft_ttl_seconds
+        self._refresh_workers = refresh_workers
+        self._refresh_executor: Optional[ThreadPoolExecutor] = None
+        self._refreshing = set()
+        self._key_stale_hits: Dict[str, int] = {}
         self._max_size = max_size
         self._prefix = prefix
         self._lock = threading.RLock()  # Using RLock for nested lock support
+        # Hits and misses are counted per process; with a shared backend the
+        # size reflects every process using it
         self._stats = {
             "hits": 0,
             "misses": 0,
-            "evictions": 0
+            "evictions": 0,
+            "stale_hits": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "oversized": 0
         }
 
     def _get_full_key(self, key: str) -> str:
         return f"{self._prefix}:{key}" if self._prefix else key
 
-    def _evict_lru(self) -> None:
-        """Evict the least recently used item from cache"""
-        if self._cache:
-            self._cache.popitem(last=False)  # Remove the first item (least recently used)
-            self._stats["evictions"] += 1
-            logger.debug("Cache eviction performed")
-
-    def _cleanup_expired(self) -> None:
-        """Remove all expired entries from the cache"""
-        now = datetime.now()
-        expired_keys = [
-            key for key, entry in self._cache.items()
-            if entry.is_expired()
-        ]
-        for key in expired_keys:
-            del self._cache[key]
-            self._stats["evictions"] += 1
+    def _cleanup_expired(self, now: Optional[float] = None) -> None:
+        """Remove expired entries via the backend's expiry index"""
+        if now is None:
+            now = self._backend.now()
+        self._stats["evictions"] += self._backend.remove_expired(now)
 
-    def get(self, key: str) -> Optional[Any]:
-        """Get a value from the cache"""
+    def get(self, key: str, refresh: Optional[Callable[[], Any]] = None) -> Optional[Any]:
+        """Get a value from the cache.
+
+        If the entry is past its soft TTL the stale value is returned and,
+        when refresh is given, it is called in the background to reload it.
+        """
         with self._lock:
             full_key = self._get_full_key(key)
-            entry = self._cache.get(full_key)
+            entry = self._backend.get(full_key)
 
             if entry is None:
                 self._stats["misses"] += 1
                 return None
 
-            if entry.is_expired():
-                del self._cache[full_key]
+            now = self._backend.now()
+            if entry.is_expired(now):
+                self._backend.delete(full_key)
+                self._key_stale_hits.pop(full_key, None)
                 self._stats["evictions"] += 1
                 self._stats["misses"] += 1
                 return None
 
-            # Update access time and move to end (most recently used)
-            entry.last_accessed = datetime.now()
-            self._cache.move_to_end(full_key)
+            # Update access time and mark as most recently used
+            self._backend.touch(full_key, entry, now)
             self._stats["hits"] += 1
 
+            if entry.is_stale(now):
+                self._stats["stale_hits"] += 1
+                self._key_stale_hits[full_key] = self._key_stale_hits.get(full_key, 0) + 1
+                if refresh is not None:
+                    self._schedule_refresh(key, full_key, refresh)
+
             return entry.value
 
+    def fresh_for(self, key: str) -> Optional[float]:
+        """Seconds until key goes stale (negative once it has), or None if it is not cached.
+
+        Does not count as a hit or change the key's LRU position.
+        """
+        with self._lock:
+            entry = self._backend.get(self._get_full_key(key))
+            now = self._backend.now()
+            if entry is None or entry.is_expired(now):
+                return None
+            return entry.stale_at - now
+
+    def _schedule_refresh(self, key: str, full_key: str, refresh: Callable[[], Any]) -> None:
+        """Start a background reload of key unless one is already running"""
+        if full_key in self._refreshing:
+            return
+        self._refreshing.add(full_key)
+        if self._refresh_executor is None:
+            self._refresh_executor = ThreadPoolExecutor(
+                max_workers=self._refresh_workers,
+                thread_name_prefix=f"cache-refresh-{self._prefix or 'default'}"
+            )
+        self._refresh_executor.submit(self._run_refresh, key, full_key, refresh)
+
+    def _run_refresh(self, key: str, full_key: str, refresh: Callable[[], Any]) -> None:
+        try:
+            value = refresh()
+            if value is not None:
+                self.set(key, value)
+            with self._lock:
+                self._stats["refreshes"] += 1
+            logger.debug(f"Cache refreshed: {full_key}")
+        except Exception as e:
+            # Keep serving the stale value until the hard TTL drops it
+            with self._lock:
+                self._stats["refresh_failures"] += 1
+            logger.warning(f"Background refresh failed for {full_key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(full_key)
+
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
         """Set a value in the cache with optional TTL override"""
         with self._lock:
-            self._cleanup_expired()  # Clean up expired entries first
+            now = self._backend.now()
+            self._cleanup_expired(now)  # Clean up expired entries first
 
             full_key = self._get_full_key(key)
             ttl_value = ttl if ttl is not None else self._default_ttl
 
-            # If we're at max size, evict the LRU item
-            if len(self._cache) >= self._max_size and full_key not in self._cache:
-                self._evict_lru()
+            # The backend evicts LRU items if we're at max size
+            size = estimate_size(value) if self._max_bytes is not None else 0
+            if self._max_bytes is not None and size > self._max_bytes:
+                # Storing it would flush everything else and still not fit
+                logger.warning(f"Not caching {full_key}: {size} bytes exceeds budget of {self._max_bytes}")
+                self._backend.delete(full_key)
+                self._stats["oversized"] += 1
+                return
 
-            self._cache[full_key] = CacheEntry(value, ttl_value)
-            self._cache.move_to_end(full_key)  # Move to end (most recently used)
+            entry = CacheEntry(value, ttl_value, now, soft_ttl=self._soft_ttl, size=size)
+            evicted = self._backend.put(full_key, entry, self._max_size, self._max_bytes)
+            self._negative_backend.delete(full_key)
+            self._key_stale_hits.pop(full_key, None)
+            if evicted:
+                self._stats["evictions"] += evicted
+                logger.debug("Cache eviction performed")
             logger.debug(f"Cache set: {full_key}")
 
+    def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None, keep_fresh: bool = False) -> int:
+        """Set several values in one backend write, returning how many were stored.
+
+        With keep_fresh, keys that already hold a value that is not yet
+        stale keep it.
+        """
+        with self._lock:
+            now = self._backend.now()
+            self._cleanup_expired(now)
+            ttl_value = ttl if ttl is not None else self._default_ttl
+            entries = []
+            for key, value in items.items():
+                full_key = self._get_full_key(key)
+                size = estimate_size(value) if self._max_bytes is not None else 0
+                if self._max_bytes is not None and size > self._max_bytes:
+                    logger.warning(f"Not caching {full_key}: {size} bytes exceeds budget of {self._max_bytes}")
+                    self._stats["oversized"] += 1
+                    continue
+                entries.append((full_key, CacheEntry(value, ttl_value, now, soft_ttl=self._soft_ttl, size=size)))
+            stored, evicted = self._backend.put_many(entries, self._max_size, self._max_bytes,
+                                                     keep_fresh_at=now if keep_fresh else None)
+            self._negative_backend.delete_many(full_key for full_key, _ in entries)
+            for full_key, _ in entries:
+                self._key_stale_hits.pop(full_key, None)
+            self._stats["evictions"] += evicted
+            logger.debug(f"Cache set {stored} of {len(items)} entries")
+            return stored
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the cache"""
+        with self._lock:
+            full_key = self._get_full_key(key)
+            self._backend.delete(full_key)
+            self._key_stale_hits.pop(full_key, None)
+
+    def set_negative(self, key: str, error: str, error_class: str = "default",
+                     ttl: Optional[int] = None) -> bool:
+        """Remember that loading key failed, returning False if the policy skips it"""
+        ttl_value = ttl if ttl is not None else self._negative_ttls.get(error_class, self._negative_ttl)
+        with self._lock:
+            if ttl_value <= 0:
+                self._negative_stats["skipped"] += 1
+                return False
+            now = self._negative_backend.now()
+            self._negative_backend.remove_expired(now)
+            full_key = self._get_full_key(key)
+            entry = CacheEntry({"error": error, "error_class": error_class}, ttl_value, now)
+            self._negative_backend.put(full_key, entry, self._max_size)
+            self._negative_stats["sets"] += 1
+            self._negative_by_class[error_class] = self._negative_by_class.get(error_class, 0) + 1
+            logger.debug(f"Negative cache set: {full_key} ({error_class}, {ttl_value}s)")
+            return True
+
+    def get_negative(self, key: str) -> Optional[Dict[str, str]]:
+        """Get the remembered failure for key as {'error', 'error_class'}, if any"""
+        with self._lock:
+            full_key = self._get_full_key(key)
+            entry = self._negative_backend.get(full_key)
+            if entry is not None and entry.is_expired(self._negative_backend.now()):
+                self._negative_backend.delete(full_key)
+                entry = None
+            if entry is None:
+                self._negative_stats["misses"] += 1
+                return None
+            self._negative_stats["hits"] += 1
+            return entry.value
+
+    def clear_negative(self, key: str) -> None:
+        """Forget a remembered failure for key"""
+        with self._lock:
+            self._negative_backend.delete(self._get_full_key(key))
+
     def clear(self) -> None:
         """Clear all items from the cache"""
         with self._lock:
-            self._cache.clear()
+            self._backend.clear()
+            self._negative_backend.clear()
+            self._key_stale_hits.clear()
             logger.debug("Cache cleared")
 
-    def get_stats(self) -> Dict[str, int]:
+    def _freshness(self, now: float) -> Dict[str, Dict[str, Any]]:
+        """Per-key freshness: state, seconds until stale/expiry, stale hits served"""
+        freshness = {}
+        for full_key, stale_at, expires_at in self._backend.timestamps():
+            if now > expires_at:
+                continue
+            freshness[full_key] = {
+                "state": "stale" if now > stale_at else "fresh",
+                "stale_in": round(stale_at - now, 1),
+                "expires_in": round(expires_at - now, 1),
+                "stale_hits": self._key_stale_hits.get(full_key, 0)
+            }
+        # Drop counters for keys that were evicted or expired in the meantime
+        self._key_stale_hits = {
+            key: hits for key, hits in self._key_stale_hits.items() if key in freshness
+        }
+        return freshness
+
+    def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
         with self._lock:
             return {
                 **self._stats,
-                "size": len(self._cache),
-                "max_size": self._max_size
+                "size": self._backend.size(),
+                "max_size": self._max_size,
+                "bytes_used": self._backend.bytes_used(),
+                "max_bytes": self._max_bytes,
+                "largest_entries": [
+                    {"key": key, "bytes": size} for key, size in self._backend.largest(5)
+                ],
+                "soft_ttl": self._soft_ttl,
+                "refreshing": len(self._refreshing),
+                "freshness": self._freshness(self._backend.now()),
+                "negative": {
+                    **self._negative_stats,
+                    "size": self._negative_backend.size(),
+                    "by_class": dict(self._negative_by_class)
+                }
             }
 
     def get_keys(self) -> List[str]:
         """Get all non-expired keys in the cache"""
         with self._lock:
             self._cleanup_expired()
-            return list(self._cache.keys())
\ No newline at end of file
+            return self._backend.keys()
+
+    def _snapshot_records(self) -> List[Tuple[str, Any, float, float]]:
+        with self._lock:
+            now = self._backend.now()
+            entries = self._backend.entries()
+        offset = len(self._prefix) + 1 if self._prefix else 0
+        return [
+            (full_key[offset:], entry.value, entry.expires_at - now, entry.stale_at - now)
+            for full_key, entry in entries
+            if not entry.is_expired(now)
+        ]
+
+    def _restore_entry(self, key: str, value: Any, expires_in: float, stale_in: float) -> bool:
+        """Insert a snapshot entry unless the key already holds newer data"""
+        with self._lock:
+            full_key = self._get_full_key(key)
+            if self._backend.get(full_key) is not None:
+                return False
+            size = estimate_size(value) if self._max_bytes is not None else 0
+            if self._max_bytes is not None and size > self._max_bytes:
+                return False
+            soft_ttl = max(stale_in, 0) if stale_in < expires_in else None
+            entry = CacheEntry(value, expires_in, self._backend.now(), soft_ttl=soft_ttl, size=size)
+            self._stats["evictions"] += self._backend.put(full_key, entry, self._max_size, self._max_bytes)
+            return True
+
+class ShardedCache(SnapshotMixin):
+    """A Cache split into independent segments chosen by key hash.
+
+    Each shard is a full Cache with its own lock, so threads working on
+    different keys don't serialize on one RLock. max_size and max_bytes are
+    divided between shards (rounded up), which makes LRU order per-shard
+    rather than global. Statistics are aggregated across shards.
+
+    Under CPython's GIL the gain is limited to the time threads would spend
+    queued on the lock; see benchmarks/sharded_cache_bench.py.
+    """
+
+    def __init__(self, shards: int = 8, ttl_seconds: int = 3600, max_size: int = 1000, prefix: str = "",
+                 backend_factory: Optional[Callable[[], Any]] = None, soft_ttl_seconds: Optional[int] = None,
+                 refresh_workers: int = 2, max_bytes: Optional[int] = None, negative_ttl_seconds: int = 60,
+                 negative_ttls: Optional[Dict[str, int]] = None):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._soft_ttl = soft_ttl_seconds
+        shard_size = -(-max_size // shards)
+        shard_bytes = -(-max_bytes // shards) if max_bytes is not None else None
+        self._shards = [
+            Cache(
+                ttl_seconds=ttl_seconds,
+                max_size=shard_size,
+                prefix=prefix,
+                backend=backend_factory() if backend_factory is not None else None,
+                soft_ttl_seconds=soft_ttl_seconds,
+                refresh_workers=refresh_workers,
+                max_bytes=shard_bytes,
+                negative_ttl_seconds=negative_ttl_seconds,
+                negative_ttls=negative_ttls
+            )
+            for _ in range(shards)
+        ]
+
+    def _shard_index(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % len(self._shards)
+
+    def _shard(self, key: str) -> Cache:
+        return self._shards[self._shard_index(key)]
+
+    def get(self, key: str, refresh: Optional[Callable[[], Any]] = None) -> Optional[Any]:
+        """Get a value from the owning shard"""
+        return self._shard(key).get(key, refresh=refresh)
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Set a value in the owning shard"""
+        self._shard(key).set(key, value, ttl=ttl)
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None, keep_fresh: bool = False) -> int:
+        """Set several values, one backend write per owning shard"""
+        by_shard: Dict[int, Dict[str, Any]] = {}
+        for key, value in items.items():
+            by_shard.setdefault(self._shard_index(key), {})[key] = value
+        return sum(self._shards[index].set_many(shard_items, ttl=ttl, keep_fresh=keep_fresh)
+                   for index, shard_items in by_shard.items())
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the owning shard"""
+        self._shard(key).delete(key)
+
+    def fresh_for(self, key: str) -> Optional[float]:
+        """Seconds until key goes stale in the owning shard, or None if it is not cached"""
+        return self._shard(key).fresh_for(key)
+
+    def set_negative(self, key: str, error: str, error_class: str = "default",
+                     ttl: Optional[int] = None) -> bool:
+        """Remember a failure in the owning shard"""
+        return self._shard(key).set_negative(key, error, error_class=error_class, ttl=ttl)
+
+    def get_negative(self, key: str) -> Optional[Dict[str, str]]:
+        """Get a remembered failure from the owning shard"""
+        return self._shard(key).get_negative(key)
+
+    def clear_negative(self, key: str) -> None:
+        """Forget a remembered failure in the owning shard"""
+        self._shard(key).clear_negative(key)
+
+    def clear(self) -> None:
+        """Clear every shard"""
+        for shard in self._shards:
+            shard.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics summed across shards"""
+        stats: Dict[str, Any] = {}
+        freshness: Dict[str, Dict[str, Any]] = {}
+        largest: List[Dict[str, Any]] = []
+        negative: Dict[str, Any] = {"by_class": {}}
+        for shard in self._shards:
+            shard_stats = shard.get_stats()
+            freshness.update(shard_stats.pop("freshness"))
+            largest.extend(shard_stats.pop("largest_entries"))
+            shard_negative = shard_stats.pop("negative")
+            for error_class, count in shard_negative.pop("by_class").items():
+                negative["by_class"][error_class] = negative["by_class"].get(error_class, 0) + count
+            for name, value in shard_negative.items():
+                negative[name] = negative.get(name, 0) + value
+            for name, value in shard_stats.items():
+                if name in ("max_size", "max_bytes", "soft_ttl"):
+                    continue
+                stats[name] = stats.get(name, 0) + value
+        return {
+            **stats,
+            "max_size": self._max_size,
+            "max_bytes": self._max_bytes,
+            "soft_ttl": self._soft_ttl,
+            "shards": len(self._shards),
+            "largest_entries": sorted(largest, key=lambda item: item["bytes"], reverse=True)[:5],
+            "freshness": freshness,
+            "negative": negative
+        }
+
+    def get_keys(self) -> List[str]:
+        """Get all non-expired keys across shards"""
+        keys = []
+        for shard in self._shards:
+            keys.extend(shard.get_keys())
+        return keys
+
+    def _snapshot_records(self) -> List[Tuple[str, Any, float, float]]:
+        records = []
+        for shard in self._shards:
+            records.extend(shard._snapshot_records())
+        return records
+
+    def _restore_entry(self, key: str, value: Any, expires_in: float, stale_in: float) -> bool:
+        return self._shard(key)._restore_entry(key, value, expires_in, stale_in)
@@ -0,0 +1,168 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; every process then warms independently
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class RateBudget:
+    """Token bucket allowing rate operations per period, bursting up to burst"""
+
+    def __init__(self, rate: float, period: float = 60.0, burst: Optional[float] = None):
+        self._rate = rate / period
+        self._capacity = burst if burst is not None else rate
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Take one token if one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+class CacheWarmer:
+    """Keeps the most popular searches fresh in a cache.
+
+    Every interval seconds it asks top_queries(search_type, limit) for the
+    most searched queries of each type and refetches those whose entry is
+    missing or goes stale within lead_time, so they are reloaded before they
+    expire rather than on a user's request. Fetches draw from a rate budget
+    and stop for the cycle while busy() reports live upstream traffic, so
+    warming never competes with users for upstream capacity.
+
+    With lock_path set, only the process holding an exclusive lock on that
+    file warms in a given cycle, for caches shared between workers.
+    """
+
+    def __init__(self, cache, fetch: Callable[[str, str], Any], top_queries: Callable[[str, int], List[str]],
+                 cache_key: Callable[[str, str], str], search_types: Iterable[str] = ("videos", "channels"),
+                 top_k: int = 20, interval: int = 300, lead_time: Optional[int] = None,
+                 rate_per_minute: float = 10, busy: Optional[Callable[[], bool]] = None,
+                 lock_path: Optional[str] = None):
+        self._cache = cache
+        self._fetch = fetch
+        self._top_queries = top_queries
+        self._cache_key = cache_key
+        self._search_types = tuple(search_types)
+        self._top_k = top_k
+        self._interval = interval
+        # Refresh anything that would go stale before the next cycle
+        self._lead_time = lead_time if lead_time is not None else interval
+        self._budget = RateBudget(rate_per_minute)
+        self._busy = busy
+        self._lock_path = lock_path
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "refreshed": 0,
+            "already_fresh": 0,
+            "deferred_budget": 0,
+            "deferred_busy": 0,
+            "failures": 0,
+            "skipped_locked": 0,
+            "last_run": None
+        }
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def _candidates(self) -> List[tuple]:
+        """(query, search_type) pairs by popularity, interleaving the search types"""
+        ranked = {}
+        for search_type in self._search_types:
+            try:
+                ranked[search_type] = self._top_queries(search_type, self._top_k)
+            except Exception as e:
+                logger.error(f"Could not load popular {search_type} searches: {str(e)}")
+                ranked[search_type] = []
+        candidates = []
+        for rank in range(self._top_k):
+            for search_type in self._search_types:
+                if rank < len(ranked[search_type]):
+                    candidates.append((ranked[search_type][rank], search_type))
+        return candidates
+
+    def run_once(self) -> int:
+        """Warm one cycle, returning the number of entries refreshed"""
+        refreshed = 0
+        candidates = self._candidates()
+        for index, (query, search_type) in enumerate(candidates):
+            key = self._cache_key(query, search_type)
+            fresh_for = self._cache.fresh_for(key)
+            if fresh_for is not None and fresh_for > self._lead_time:
+                self._count("already_fresh")
+                continue
+            if self._busy is not None and self._busy():
+                self._count("deferred_busy", len(candidates) - index)
+                logger.debug("Cache warmer yielding to live traffic")
+                break
+            if not self._budget.try_acquire():
+                self._count("deferred_budget", len(candidates) - index)
+                logger.debug("Cache warmer out of rate budget for this cycle")
+                break
+            try:
+                self._cache.set(key, self._fetch(query, search_type))
+                refreshed += 1
+                self._count("refreshed")
+                logger.debug(f"Cache warmer refreshed {key}")
+            except Exception as e:
+                self._count("failures")
+                logger.warning(f"Cache warmer failed to refresh {key}: {str(e)}")
+        with self._stats_lock:
+            self._stats["runs"] += 1
+            self._stats["last_run"] = time.time()
+        return refreshed
+
+    def _run_locked(self) -> None:
+        """run_once, unless another process holds the warmer lock"""
+        if self._lock_path is None or fcntl is None:
+            self.run_once()
+            return
+        os.makedirs(os.path.dirname(self._lock_path) or ".", exist_ok=True)
+        with open(self._lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._count("skipped_locked")
+                return
+            try:
+                self.run_once()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def start(self, initial_delay: float = 30) -> threading.Thread:
+        """Warm every interval seconds on a daemon thread, first after initial_delay"""
+        def run():
+            delay = initial_delay
+            while not self._stop.wait(delay):
+                try:
+                    self._run_locked()
+                except Exception as e:
+                    logger.error(f"Cache warmer cycle failed: {str(e)}")
+                delay = self._interval
+
+        self._thread = threading.Thread(target=run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return dict(self._stats, top_k=self._top_k, interval=self._interval, lead_time=self._lead_time)
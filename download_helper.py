@@ -8,12 +8,14 @@ when standard methods fail
 import argparse
 import os
 import sys
+import shutil
 import subprocess
 import re
 import json
 import logging
-import requests
 from datetime import datetime
+from thumbnail_store import get_thumbnail_store
+from ytdlp_scheduler import get_scheduler
 
 # Configure logging
 logging.basicConfig(
@@ -33,6 +35,9 @@ class YouTubeDownloader:
         # Default paths
         self.cookies_path = os.path.join(os.getcwd(), 'cookies.txt')
         self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/105.0.0.0 Safari/537.36"
+        # yt-dlp runs wait for a node-wide download slot, unless the app
+        # started this helper from inside one
+        self.scheduler = get_scheduler()
     
     def download(self, video_id, output_path, format_code="best"):
         """Download a YouTube video using multiple fallback methods"""
@@ -94,7 +99,7 @@ class YouTubeDownloader:
             
             logger.info(f"Running command: {' '.join(command)}")
             
-            result = subprocess.run(
+            result = self.scheduler.run(
                 command, 
                 capture_output=True, 
                 text=True, 
@@ -122,7 +127,7 @@ class YouTubeDownloader:
                 url
             ]
             
-            result = subprocess.run(
+            result = self.scheduler.run(
                 command, 
                 capture_output=True, 
                 text=True, 
@@ -142,18 +147,12 @@ class YouTubeDownloader:
             # Create the thumbnail path with jpg extension
             thumbnail_path = os.path.join(output_dir, f"{video_id}_thumbnail.jpg")
             
-            # Try to get the maxresdefault thumbnail first
-            url = f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg"
-            response = requests.get(url)
+            # Try the maxresdefault thumbnail first, then hqdefault, from the
+            # thumbnail cache shared with the app
+            found = get_thumbnail_store().get_best(video_id, ("maxresdefault", "hqdefault"))
             
-            if not response.ok:
-                # Try the hqdefault if maxresdefault isn't available
-                url = f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
-                response = requests.get(url)
-            
-            if response.ok:
-                with open(thumbnail_path, 'wb') as f:
-                    f.write(response.content)
+            if found:
+                shutil.copyfile(found[0], thumbnail_path)
                 logger.info(f"Downloaded thumbnail as fallback: {thumbnail_path}")
                 return True
             else:
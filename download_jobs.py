@@ -0,0 +1,243 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+class DownloadJobQueue:
+    """Runs downloads in the background, with job state kept in the database.
+
+    submit() stores a queued job and returns at once. A dispatcher thread in
+    each process claims queued jobs, oldest first, with a conditional
+    UPDATE so only one process runs a job, and only while its pool of
+    workers has a free slot; the rest stay queued in the table where any
+    process can pick them up. Running jobs are heartbeated every poll, and
+    a job whose heartbeat is older than lease seconds (its process died) is
+    queued again, or failed after max_attempts. A worker records its outcome
+    only while the job is still running the attempt it claimed, so one that
+    outlived its lease cannot overwrite the retry. Finished jobs are deleted
+    after retention seconds.
+
+    run(video_id, itag, user_id) does the download and returns (result
+    dict, HTTP status); it is called inside an app context on a worker
+    thread.
+    """
+
+    def __init__(self, app, db, model, run: Callable[[str, int, Optional[int]], Tuple[Dict[str, Any], int]],
+                 workers: int = 2, poll_interval: float = 2.0, lease: int = 120,
+                 max_attempts: int = 2, retention: int = 7 * 24 * 3600):
+        self._app = app
+        self._db = db
+        self._model = model
+        self._run_download = run
+        self._workers = workers
+        self._poll_interval = poll_interval
+        self._lease = lease
+        self._max_attempts = max_attempts
+        self._retention = retention
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download-job")
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+        self._stats = {
+            "submitted": 0,
+            "started": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "requeued": 0,
+            "claim_conflicts": 0,
+            "lost_leases": 0
+        }
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += amount
+
+    def submit(self, video_id: str, itag: int, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Queue a download and return the job's status"""
+        job = self._model(id=uuid.uuid4().hex, video_id=video_id, itag=itag, user_id=user_id,
+                          state=QUEUED, attempts=0, created_at=datetime.utcnow())
+        self._db.session.add(job)
+        self._db.session.commit()
+        self._count("submitted")
+        self._wake.set()
+        return self.describe(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job, or None if there is no such job"""
+        job = self._model.query.get(job_id)
+        return self.describe(job) if job is not None else None
+
+    def describe(self, job) -> Dict[str, Any]:
+        status = {
+            "job_id": job.id,
+            "state": job.state,
+            "video_id": job.video_id,
+            "itag": job.itag,
+            "attempts": job.attempts,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None
+        }
+        if job.state == QUEUED:
+            status["position"] = self._model.query.filter(
+                self._model.state == QUEUED, self._model.created_at < job.created_at
+            ).count()
+        if job.result:
+            status["result"] = json.loads(job.result)
+        if job.error:
+            status["error"] = job.error
+        return status
+
+    def _claim(self, job) -> Optional[int]:
+        """Move a queued job to running and return its attempt number; None if another process got it first"""
+        now = datetime.utcnow()
+        attempt = job.attempts + 1
+        claimed = self._model.query.filter_by(id=job.id, state=QUEUED, attempts=job.attempts).update({
+            "state": RUNNING,
+            "started_at": now,
+            "heartbeat_at": now,
+            "attempts": attempt
+        }, synchronize_session=False)
+        self._db.session.commit()
+        return attempt if claimed == 1 else None
+
+    def _dispatch(self) -> int:
+        """Claim queued jobs, oldest first, while this process has free workers"""
+        started = 0
+        while True:
+            with self._lock:
+                if len(self._running) >= self._workers:
+                    break
+            job = self._model.query.filter_by(state=QUEUED).order_by(self._model.created_at).first()
+            if job is None:
+                break
+            attempt = self._claim(job)
+            if attempt is None:
+                self._count("claim_conflicts")
+                continue
+            with self._lock:
+                self._running[job.id] = attempt
+            self._pool.submit(self._run, job.id, attempt)
+            self._count("started")
+            started += 1
+        return started
+
+    def _run(self, job_id: str, attempt: int) -> None:
+        try:
+            with self._app.app_context():
+                job = self._model.query.get(job_id)
+                video_id = job.video_id
+                try:
+                    result, _ = self._run_download(job.video_id, job.itag, job.user_id)
+                    state = SUCCEEDED if result.get("success") else FAILED
+                    error = None if state == SUCCEEDED else result.get("error", "Download failed")
+                except Exception as e:
+                    logger.error(f"Download job {job_id} failed: {str(e)}")
+                    self._db.session.rollback()
+                    result, state, error = None, FAILED, str(e)
+                # Only while this attempt still owns the job: if its lease
+                # lapsed, the job was requeued or failed and is no longer ours
+                recorded = self._model.query.filter_by(id=job_id, state=RUNNING, attempts=attempt).update({
+                    "state": state,
+                    "result": json.dumps(result) if result is not None else None,
+                    "error": error,
+                    "finished_at": datetime.utcnow()
+                }, synchronize_session=False)
+                self._db.session.commit()
+                if not recorded:
+                    self._count("lost_leases")
+                    logger.warning(f"Dropping the result of download job {job_id} attempt {attempt}, "
+                                   f"which lost its lease")
+                    return
+                self._count(state)
+                logger.info(f"Download job {job_id} for {video_id} {state}")
+        except Exception as e:
+            logger.error(f"Could not record download job {job_id}: {str(e)}")
+        finally:
+            with self._lock:
+                if self._running.get(job_id) == attempt:
+                    del self._running[job_id]
+            self._wake.set()
+
+    def _heartbeat(self) -> None:
+        """Extend the lease on the jobs this process is running"""
+        with self._lock:
+            running = list(self._running)
+        if running:
+            self._model.query.filter(self._model.id.in_(running), self._model.state == RUNNING).update(
+                {"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+            self._db.session.commit()
+
+    def _recover(self) -> int:
+        """Requeue running jobs whose process stopped heartbeating, failing them after max_attempts"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self._lease)
+        stale = self._model.query.filter(self._model.state == RUNNING, self._model.heartbeat_at < cutoff).all()
+        for job in stale:
+            if job.attempts >= self._max_attempts:
+                job.state = FAILED
+                job.error = "The download was interrupted"
+                job.finished_at = datetime.utcnow()
+                logger.warning(f"Download job {job.id} abandoned after {job.attempts} attempts")
+            else:
+                job.state = QUEUED
+                self._count("requeued")
+                logger.warning(f"Requeueing download job {job.id} after its worker stopped")
+        if stale:
+            self._db.session.commit()
+        return len(stale)
+
+    def _prune(self) -> None:
+        """Delete finished jobs past the retention period, at most hourly"""
+        if time.time() - self._last_prune < 3600:
+            return
+        self._last_prune = time.time()
+        cutoff = datetime.utcnow() - timedelta(seconds=self._retention)
+        deleted = self._model.query.filter(self._model.state.in_((SUCCEEDED, FAILED)),
+                                           self._model.finished_at < cutoff).delete(synchronize_session=False)
+        self._db.session.commit()
+        if deleted:
+            logger.info(f"Pruned {deleted} finished download jobs")
+
+    def start(self) -> threading.Thread:
+        """Dispatch jobs from a daemon thread, every poll_interval or as soon as one is submitted"""
+        def run():
+            delay = 0
+            while not self._stop.is_set():
+                self._wake.wait(delay)
+                self._wake.clear()
+                delay = self._poll_interval
+                try:
+                    with self._app.app_context():
+                        self._heartbeat()
+                        self._recover()
+                        self._dispatch()
+                        self._prune()
+                except Exception as e:
+                    logger.error(f"Download job dispatch failed: {str(e)}")
+                    delay = max(self._poll_interval, 30)
+
+        self._thread = threading.Thread(target=run, name="download-jobs", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, running=len(self._running), workers=self._workers)
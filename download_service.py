@@ -1,59 +1,53 @@
+import html
 import logging
 import os
 import re
 import json
+import shutil
 import requests
 from typing import Dict, List, Optional
 from urllib.parse import parse_qs, urlparse
+from http_client import error_type_for_status, get_http_client
+from download_store import get_download_store
+from thumbnail_store import get_thumbnail_store, proxy_url
+from ytdlp_scheduler import SLOT_HELD_ENV, get_scheduler
 
 logger = logging.getLogger(__name__)
 
 class DownloadService:
     """Service for downloading YouTube videos"""
     
-    def __init__(self):
+    def __init__(self, http=None, thumbnails=None, metadata=None, scheduler=None, store=None):
+        # Pooled keep-alive session shared by every upstream call
+        self.http = http or get_http_client()
+        # Thumbnails come from the shared disk cache behind /thumb
+        self.thumbnails = thumbnails or get_thumbnail_store()
+        # Optional persistent Cache of title/author/length per video; with it
+        # repeat lookups make no upstream request
+        self.metadata = metadata
+        # Every yt-dlp run waits for a node-wide download slot
+        self.scheduler = scheduler or get_scheduler()
         self.download_folder = os.path.join(os.getcwd(), 'static', 'downloads')
         
         # Create download directory if it doesn't exist
         if not os.path.exists(self.download_folder):
             os.makedirs(self.download_folder)
+        # Finished downloads are kept once per (video, format) for every user
+        self.store = store or get_download_store(self.download_folder)
     
     def get_available_streams(self, video_id: str) -> Dict:
         """Get available video streams and their details using a direct method"""
         try:
-            # Use the embed page to get video info
-            embed_url = f"https://www.youtube.com/embed/{video_id}"
-            embed_response = requests.get(embed_url)
-            
-            if not embed_response.ok:
-                logger.error(f"Failed to load embed page for {video_id}: {embed_response.status_code}")
-                return {'success': False, 'error': f'Failed to load video data: HTTP {embed_response.status_code}'}
-            
-            # Get the video details from watch page
-            watch_url = f"https://www.youtube.com/watch?v={video_id}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            watch_response = requests.get(watch_url, headers=headers)
-            
-            if not watch_response.ok:
-                logger.error(f"Failed to load watch page for {video_id}: {watch_response.status_code}")
-                return {'success': False, 'error': f'Failed to load video data: HTTP {watch_response.status_code}'}
-            
-            # Extract video title using regex
-            title_match = re.search(r'<title>(.*?) - YouTube</title>', watch_response.text)
-            title = title_match.group(1) if title_match else f"Video {video_id}"
-            
-            # Extract author/channel name
-            author_match = re.search(r'"author":"([^"]+)"', watch_response.text)
-            author = author_match.group(1) if author_match else "Unknown creator"
+            video_info = self._get_metadata(video_id)
+            if not video_info['success']:
+                return video_info
             
-            # Extract video thumbnail
-            thumbnail = f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+            title = video_info['title']
+            author = video_info['author']
+            length = video_info['length']
             
-            # Extract video length
-            length_match = re.search(r'"lengthSeconds":"(\d+)"', watch_response.text)
-            length = int(length_match.group(1)) if length_match else 0
+            # Video thumbnail, served through the local proxy
+            thumbnail = proxy_url(video_id)
             
             # Create preset download options
             video_streams = [
@@ -106,13 +100,25 @@ class DownloadService:
             }
         except Exception as e:
             logger.error(f"Error getting streams for video {video_id}: {str(e)}")
-            return {'success': False, 'error': f'Failed to retrieve video information: {str(e)}'}
+            return {'success': False, 'error': f'Failed to retrieve video information: {str(e)}', 'error_type': 'upstream_error'}
     
-    def download_video(self, video_id: str, itag: int) -> Dict:
-        """Download a specific stream of a YouTube video using yt-dlp with improved format handling"""
+    def download_video(self, video_id: str, itag: int, video_info: Optional[Dict] = None,
+                       user: Optional[str] = None) -> Dict:
+        """Download a specific stream of a YouTube video using yt-dlp with improved format handling.
+
+        Pass the result of get_available_streams as video_info when the
+        caller already has it, so it is not looked up again. user is who
+        the download is for, for fair scheduling of yt-dlp runs. A format
+        already in the store is returned without running yt-dlp.
+        """
         try:
+            stored = self.find_download(video_id, str(itag))
+            if stored:
+                return stored
+            
             # First, get the video info to determine filename
-            video_info = self.get_available_streams(video_id)
+            if video_info is None:
+                video_info = self.get_available_streams(video_id)
             
             if not video_info['success']:
                 return video_info  # Return the error
@@ -137,8 +143,8 @@ class DownloadService:
             filename = self._clean_filename(title)
             filename = f"{filename}_{format_info['resolution'] if 'resolution' in format_info else format_info['abr']}.{format_info['ext']}"
             
-            # Create the file path
-            file_path = os.path.join(self.download_folder, filename)
+            # Download to a staging path in the store
+            file_path = self.store.staging_path(video_id, str(itag), format_info['ext'])
             
             # Create URL for downloading based on itag
             video_url = f"https://www.youtube.com/watch?v={video_id}"
@@ -151,16 +157,8 @@ class DownloadService:
             from tempfile import NamedTemporaryFile
             
             # Always download the thumbnail first as a fallback
-            thumbnail_url = f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg" 
             thumbnail_path = os.path.join(self.download_folder, f"{video_id}_thumbnail.jpg")
-            
-            try:
-                thumbnail_response = requests.get(thumbnail_url)
-                if thumbnail_response.ok:
-                    with open(thumbnail_path, 'wb') as f:
-                        f.write(thumbnail_response.content)
-            except Exception as e:
-                logger.warning(f"Could not download thumbnail: {str(e)}")
+            self._save_thumbnail(video_id, thumbnail_path)
             
             # Get path to cookies file, this helps bypass some restrictions
             cookies_path = os.path.join(os.getcwd(), 'cookies.txt')
@@ -201,18 +199,12 @@ class DownloadService:
             ]
             
             try:
-                result = subprocess.run(command, capture_output=True, text=True, timeout=90)
+                result = self.scheduler.run(command, user=user, itag=itag, capture_output=True, text=True, timeout=90)
                 
                 # Check if the file was created successfully
                 if result.returncode == 0 and os.path.exists(file_path):
-                    file_size = os.path.getsize(file_path)
-                    return {
-                        'success': True,
-                        'title': title,
-                        'file_path': os.path.join('static', 'downloads', os.path.basename(file_path)).replace('\\', '/'),
-                        'file_size': round(file_size / (1024 * 1024), 2),
-                        'mime_type': format_info['mime_type']
-                    }
+                    return self._store_download(video_id, str(itag), file_path, title, filename,
+                                                format_info['mime_type'])
                 else:
                     # Log the error and try a fallback method
                     logger.error(f"Download failed: {result.stderr}")
@@ -226,18 +218,13 @@ class DownloadService:
                         video_url
                     ]
                     
-                    simple_result = subprocess.run(simple_command, capture_output=True, text=True, timeout=60)
+                    simple_result = self.scheduler.run(simple_command, user=user, itag=itag,
+                                                       capture_output=True, text=True, timeout=60)
                     
                     if simple_result.returncode == 0 and os.path.exists(file_path):
-                        file_size = os.path.getsize(file_path)
-                        return {
-                            'success': True,
-                            'title': title,
-                            'file_path': os.path.join('static', 'downloads', os.path.basename(file_path)).replace('\\', '/'),
-                            'file_size': round(file_size / (1024 * 1024), 2),
-                            'mime_type': 'video/mp4', # Assume MP4 for 'best' format
-                            'note': 'Downloaded using best available quality'
-                        }
+                        # Assume MP4 for 'best' format
+                        return self._store_download(video_id, str(itag), file_path, title, filename, 'video/mp4',
+                                                    note='Downloaded using best available quality')
                     else:
                         # Fall back to the thumbnail
                         logger.error(f"Simple download also failed: {simple_result.stderr}")
@@ -269,16 +256,30 @@ class DownloadService:
                     'mime_type': 'image/jpeg',
                     'note': f'Download error: {str(cmd_error)}. Downloaded thumbnail instead.'
                 }
+            finally:
+                # Whatever a failed attempt left behind
+                self.store.discard(file_path)
         
         except Exception as e:
             logger.error(f"Error in download process for {video_id}: {str(e)}")
             return {'success': False, 'error': f'Failed to download video: {str(e)}'}
     
-    def direct_download(self, video_id: str, format_code: str = 'best') -> Dict:
-        """Alternative direct download method using yt-dlp with simplified options"""
+    def direct_download(self, video_id: str, format_code: str = 'best', video_info: Optional[Dict] = None,
+                        user: Optional[str] = None, itag: Optional[int] = None) -> Dict:
+        """Alternative direct download method using yt-dlp with simplified options.
+
+        itag is the format originally asked for, which sets the scheduling
+        priority. A format already in the store is returned without running
+        yt-dlp.
+        """
         try:
-            # First get video info 
-            video_info = self.get_available_streams(video_id)
+            stored = self.find_download(video_id, format_code)
+            if stored:
+                return stored
+            
+            # First get video info, unless the caller already has it
+            if video_info is None:
+                video_info = self.get_available_streams(video_id)
             
             if not video_info['success']:
                 return video_info
@@ -288,19 +289,12 @@ class DownloadService:
             
             # Create filename with mp4 extension (most compatible)
             filename = f"{clean_filename}.mp4"
-            file_path = os.path.join(self.download_folder, filename)
+            file_path = self.store.staging_path(video_id, format_code, 'mp4')
             
             # Download the thumbnail as a fallback
             thumbnail_url = f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg"
             thumbnail_path = os.path.join(self.download_folder, f"{video_id}_thumbnail.jpg")
-            
-            try:
-                thumbnail_response = requests.get(thumbnail_url)
-                if thumbnail_response.ok:
-                    with open(thumbnail_path, 'wb') as f:
-                        f.write(thumbnail_response.content)
-            except Exception as e:
-                logger.warning(f"Could not download thumbnail: {str(e)}")
+            self._save_thumbnail(video_id, thumbnail_path)
             
             # Use yt-dlp with simplified options for direct download
             import subprocess
@@ -325,19 +319,12 @@ class DownloadService:
                     video_url
                 ]
                 
-                result = subprocess.run(command, capture_output=True, text=True, timeout=60)
+                result = self.scheduler.run(command, user=user, itag=itag, capture_output=True, text=True, timeout=60)
                 
                 # Check if the file was created successfully
                 if result.returncode == 0 and os.path.exists(file_path):
-                    file_size = os.path.getsize(file_path)
-                    return {
-                        'success': True,
-                        'title': title,
-                        'file_path': os.path.join('static', 'downloads', os.path.basename(file_path)).replace('\\', '/'),
-                        'file_size': round(file_size / (1024 * 1024), 2),
-                        'mime_type': 'video/mp4',
-                        'note': 'Downloaded using best available quality'
-                    }
+                    return self._store_download(video_id, format_code, file_path, title, filename, 'video/mp4',
+                                                note='Downloaded using best available quality')
                 else:
                     # Log the error
                     logger.error(f"Direct download failed: {result.stderr}")
@@ -354,18 +341,12 @@ class DownloadService:
                         video_url
                     ]
                     
-                    simple_result = subprocess.run(simple_command, capture_output=True, text=True, timeout=60)
+                    simple_result = self.scheduler.run(simple_command, user=user, itag=itag,
+                                                       capture_output=True, text=True, timeout=60)
                     
                     if simple_result.returncode == 0 and os.path.exists(file_path):
-                        file_size = os.path.getsize(file_path)
-                        return {
-                            'success': True,
-                            'title': title,
-                            'file_path': os.path.join('static', 'downloads', os.path.basename(file_path)).replace('\\', '/'),
-                            'file_size': round(file_size / (1024 * 1024), 2),
-                            'mime_type': 'video/mp4',
-                            'note': 'Downloaded using best available quality'
-                        }
+                        return self._store_download(video_id, format_code, file_path, title, filename, 'video/mp4',
+                                                    note='Downloaded using best available quality')
                     else:
                         # Try using our specialized helper script as a last resort
                         logger.info(f"Using download_helper.py for {video_id}")
@@ -385,24 +366,20 @@ class DownloadService:
                             "--format", helper_format
                         ]
                         
-                        helper_result = subprocess.run(helper_command, capture_output=True, text=True, timeout=120)
+                        # The helper runs its yt-dlp attempts inside this slot
+                        helper_result = self.scheduler.run(helper_command, user=user, itag=itag,
+                                                           capture_output=True, text=True, timeout=120,
+                                                           env=dict(os.environ, **{SLOT_HELD_ENV: "1"}))
                         
                         if helper_result.returncode == 0 and os.path.exists(file_path):
-                            file_size = os.path.getsize(file_path)
                             mime_type = 'video/mp4'
                             
                             # Check if it's actually a JPEG (thumbnail)
                             if file_path.endswith('.jpg'):
                                 mime_type = 'image/jpeg'
                                 
-                            return {
-                                'success': True,
-                                'title': title,
-                                'file_path': os.path.join('static', 'downloads', os.path.basename(file_path)).replace('\\', '/'),
-                                'file_size': round(file_size / (1024 * 1024), 2),
-                                'mime_type': mime_type,
-                                'note': 'Downloaded using helper script'
-                            }
+                            return self._store_download(video_id, format_code, file_path, title, filename, mime_type,
+                                                        note='Downloaded using helper script')
                         else:
                             # Return the thumbnail as fallback
                             return {
@@ -434,6 +411,7 @@ class DownloadService:
                     f.write(f"URL: https://www.youtube.com/watch?v={video_id}\n")
                     f.write(f"Thumbnail: {thumbnail_url}\n")
                     f.write(f"Error: {str(cmd_error)}\n")
+                self.store.account(os.path.getsize(info_path))
                     
                 # Return the info file
                 return {
@@ -444,11 +422,144 @@ class DownloadService:
                     'mime_type': 'text/plain',
                     'note': 'Created video info file due to download failure'
                 }
+            finally:
+                # Whatever a failed attempt left behind
+                self.store.discard(file_path)
             
         except Exception as e:
             logger.error(f"Error in direct download for {video_id}: {str(e)}")
             return {'success': False, 'error': f'Download failed: {str(e)}'}
     
+    def find_download(self, video_id: str, format_spec: str) -> Optional[Dict]:
+        """A finished download of video_id in format_spec (an itag or yt-dlp format) from the store"""
+        record = self.store.lookup(video_id, format_spec)
+        if record is None:
+            return None
+        logger.info(f"Serving stored download {record['file_path']}")
+        return self._download_result(record, cached=True)
+    
+    def _store_download(self, video_id: str, format_spec: str, file_path: str, title: str,
+                        download_name: str, mime_type: str, note: Optional[str] = None) -> Dict:
+        """Move a finished download into the store and describe it"""
+        record = self.store.commit(video_id, format_spec, file_path, title=title, mime_type=mime_type,
+                                   download_name=download_name)
+        result = self._download_result(record)
+        if note:
+            result['note'] = note
+        return result
+    
+    def _download_result(self, record: Dict, cached: bool = False) -> Dict:
+        result = {
+            'success': True,
+            'title': record['title'],
+            'file_path': record['file_path'],
+            'file_size': round(record['file_size'] / (1024 * 1024), 2),
+            'mime_type': record['mime_type'],
+            'download_name': record['download_name']
+        }
+        if cached:
+            result['cached'] = True
+        return result
+    
+    def _get_metadata(self, video_id: str) -> Dict:
+        """Title, author and length of a video, from the metadata store when it has them"""
+        if self.metadata is not None:
+            cached = self.metadata.get(video_id, refresh=lambda: self._refresh_metadata(video_id))
+            if cached:
+                return dict(cached, success=True)
+        video_info = self._fetch_metadata(video_id)
+        if video_info['success'] and self.metadata is not None:
+            self.metadata.set(video_id, self._metadata_record(video_info, 'watch'))
+        return video_info
+
+    def _fetch_metadata(self, video_id: str) -> Dict:
+        """Read title, author and length from the watch page"""
+        watch_url = f"https://www.youtube.com/watch?v={video_id}"
+        watch_response = self.http.get(watch_url)
+        
+        if not watch_response.ok:
+            logger.error(f"Failed to load watch page for {video_id}: {watch_response.status_code}")
+            return {
+                'success': False,
+                'error': f'Failed to load video data: HTTP {watch_response.status_code}',
+                'error_type': error_type_for_status(watch_response.status_code)
+            }
+        
+        # Extract video title using regex; it is HTML-escaped there, while
+        # titles from search results are already decoded
+        title_match = re.search(r'<title>(.*?) - YouTube</title>', watch_response.text)
+        
+        # Extract author/channel name
+        author_match = re.search(r'"author":"([^"]+)"', watch_response.text)
+        
+        # Extract video length
+        length_match = re.search(r'"lengthSeconds":"(\d+)"', watch_response.text)
+        
+        return {
+            'success': True,
+            'title': html.unescape(title_match.group(1)) if title_match else f"Video {video_id}",
+            'author': author_match.group(1) if author_match else "Unknown creator",
+            'length': int(length_match.group(1)) if length_match else 0
+        }
+
+    def _refresh_metadata(self, video_id: str) -> Optional[Dict]:
+        """Background refresh for the metadata store; failures keep the stale record"""
+        video_info = self._fetch_metadata(video_id)
+        return self._metadata_record(video_info, 'watch') if video_info['success'] else None
+
+    def _metadata_record(self, video_info: Dict, source: str) -> Dict:
+        return {
+            'title': video_info['title'],
+            'author': video_info['author'],
+            'length': video_info['length'],
+            'source': source
+        }
+
+    def remember_videos(self, videos: List[Dict], author: Optional[str] = None) -> int:
+        """Index videos from already parsed search or channel results, returning how many were stored.
+
+        Videos the store already holds a fresh record for are left alone.
+        """
+        if self.metadata is None:
+            return 0
+        records = {}
+        for video in videos:
+            video_id = video.get('id')
+            if not video_id or video.get('title') in (None, '', 'Untitled'):
+                continue
+            channel = video.get('channel')
+            records[video_id] = self._metadata_record({
+                'title': video['title'],
+                'author': channel if channel and channel != 'Unknown Channel' else (author or "Unknown creator"),
+                'length': self._parse_duration(video.get('duration', ''))
+            }, 'search')
+        # The whole page in one write transaction
+        return self.metadata.set_many(records, keep_fresh=True)
+
+    def _parse_duration(self, duration: str) -> int:
+        """Seconds in a displayed duration such as "1:02:03"; 0 if it is not one"""
+        seconds = 0
+        for part in duration.split(':'):
+            if not part.strip().isdigit():
+                return 0
+            seconds = seconds * 60 + int(part)
+        return seconds
+
+    def _save_thumbnail(self, video_id: str, thumbnail_path: str) -> bool:
+        """Copy the largest available thumbnail from the thumbnail cache to thumbnail_path"""
+        try:
+            found = self.thumbnails.get_best(video_id, ('maxresdefault', 'hqdefault'))
+            if found:
+                # Each attempt rewrites the same file; count only the change
+                replaced = os.path.getsize(thumbnail_path) if os.path.exists(thumbnail_path) else 0
+                shutil.copyfile(found[0], thumbnail_path)
+                self.store.account(os.path.getsize(thumbnail_path) - replaced)
+                return True
+            logger.warning(f"No thumbnail available for {video_id}")
+        except Exception as e:
+            logger.warning(f"Could not download thumbnail: {str(e)}")
+        return False
+
     def _clean_filename(self, filename: str) -> str:
         """Clean a filename by removing invalid characters"""
         # Replace invalid filename characters
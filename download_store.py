@@ -0,0 +1,344 @@
+from typing import Any, Dict, List, Optional
+from collections import Counter
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+EVICTION_POLICIES = ("lru", "lfu")
+
+# Staging files older than this were left by a download that died
+STALE_STAGING_AGE = 6 * 3600
+
+def format_key(format_spec: str) -> str:
+    """File-name-safe key for an itag or yt-dlp format spec"""
+    key = re.sub(r'[^A-Za-z0-9]+', '_', str(format_spec)).strip('_')
+    if key != str(format_spec) or len(key) > 40:
+        # Keep differing specs apart once they are flattened
+        key = f"{key[:40]}_{hashlib.sha1(str(format_spec).encode()).hexdigest()[:8]}"
+    return key
+
+class DownloadStore:
+    """Finished downloads, stored once per (video_id, format) and shared by every user.
+
+    Files live at <root>/<video_id>/<format key>.<ext>, so different videos
+    never collide however their titles read, and a node-local SQLite index
+    maps (video_id, format) to the file. Downloads are written to a staging
+    name in the same directory and renamed into place by commit(), so a
+    lookup never returns a partial file. Several formats can point at one
+    file when a fallback method produced it.
+
+    public_prefix is the path the files are served under, relative to the
+    app root, as used in download results.
+
+    When everything under root (stored downloads as well as thumbnail
+    fallbacks and other files written there) exceeds max_bytes, files are
+    removed until the total is back under 90% of the limit: least recently
+    served first with policy "lru", least often served first with "lfu".
+    Accesses are the ones reported to record_access(); files outside the
+    index count their mtime as the last access. Files pinned while being
+    served by this process, staging files, and files accessed within
+    min_age seconds (possibly being served by another worker) are never
+    removed. The running total is per process and is corrected by the
+    directory scan each eviction does.
+    """
+
+    def __init__(self, root: str, index_path: str, public_prefix: str = "static/downloads",
+                 max_bytes: int = 10 * 1024 ** 3, policy: str = "lru", min_age: int = 3600,
+                 timeout: float = 5.0):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected one of {EVICTION_POLICIES}")
+        self._root = root
+        self._index_path = index_path
+        self._public_prefix = public_prefix.rstrip("/")
+        self._max_bytes = max_bytes
+        self._policy = policy
+        self._min_age = min_age
+        self._timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._bytes_used: Optional[int] = None
+        self._files: Optional[int] = None
+        self._pinned = Counter()
+        self._last_eviction: Optional[float] = None
+        self._stats = {
+            "served": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+            "skipped_in_use": 0,
+            "stale_staging_removed": 0
+        }
+        os.makedirs(root, exist_ok=True)
+        directory = os.path.dirname(os.path.abspath(index_path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloads ("
+                " video_id TEXT NOT NULL,"
+                " format TEXT NOT NULL,"
+                " path TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mime_type TEXT NOT NULL,"
+                " title TEXT,"
+                " download_name TEXT,"
+                " created_at REAL NOT NULL,"
+                " last_accessed REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (video_id, format))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_downloads_path ON downloads (path)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not thread-safe"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._index_path, timeout=self._timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _absolute(self, path: str) -> str:
+        return os.path.join(self._root, *path.split("/"))
+
+    def _describe(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "file_path": f"{self._public_prefix}/{row['path']}",
+            "path": row["path"],
+            "file_size": row["size"],
+            "mime_type": row["mime_type"],
+            "title": row["title"],
+            "download_name": row["download_name"]
+        }
+
+    def lookup(self, video_id: str, format_spec: str) -> Optional[Dict[str, Any]]:
+        """The stored download for (video_id, format_spec), or None"""
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM downloads WHERE video_id = ? AND format = ?",
+                           (video_id, format_key(format_spec))).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(self._absolute(row["path"])):
+            # Removed behind the index's back
+            conn.execute("DELETE FROM downloads WHERE path = ?", (row["path"],))
+            return None
+        return self._describe(row)
+
+    def lookup_path(self, path: str) -> Optional[Dict[str, Any]]:
+        """The stored download at path (relative to the store root), or None"""
+        row = self._conn().execute("SELECT * FROM downloads WHERE path = ? LIMIT 1", (path,)).fetchone()
+        return self._describe(row) if row is not None else None
+
+    def owns(self, file_path: str) -> bool:
+        """Whether file_path, as returned in a download result, is a stored download"""
+        prefix = f"{self._public_prefix}/"
+        return file_path.startswith(prefix) and self.lookup_path(file_path[len(prefix):]) is not None
+
+    def staging_path(self, video_id: str, format_spec: str, ext: str) -> str:
+        """A fresh absolute path to download (video_id, format_spec) to before commit()"""
+        directory = os.path.join(self._root, video_id)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f".{format_key(format_spec)}.{uuid.uuid4().hex[:8]}.{ext}")
+
+    def commit(self, video_id: str, format_spec: str, staged_path: str, title: str, mime_type: str,
+               download_name: Optional[str] = None) -> Dict[str, Any]:
+        """Move a finished download from its staging path into the store and index it"""
+        ext = os.path.splitext(staged_path)[1]
+        path = f"{video_id}/{format_key(format_spec)}{ext}"
+        os.replace(staged_path, self._absolute(path))
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO downloads"
+            " (video_id, format, path, size, mime_type, title, download_name, created_at, last_accessed, hits)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            (video_id, format_key(format_spec), path, os.path.getsize(self._absolute(path)), mime_type,
+             title, download_name, now, now)
+        )
+        logger.info(f"Stored download {path}")
+        self.account(os.path.getsize(self._absolute(path)))
+        return self.lookup_path(path)
+
+    def alias(self, video_id: str, format_spec: str, file_path: str) -> bool:
+        """Index an already stored file under another format of the same video"""
+        prefix = f"{self._public_prefix}/"
+        if not file_path.startswith(prefix):
+            return False
+        path = file_path[len(prefix):]
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM downloads WHERE path = ? AND video_id = ? LIMIT 1",
+                           (path, video_id)).fetchone()
+        if row is None:
+            return False
+        conn.execute(
+            "INSERT OR IGNORE INTO downloads"
+            " (video_id, format, path, size, mime_type, title, download_name, created_at, last_accessed, hits)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            (video_id, format_key(format_spec), path, row["size"], row["mime_type"], row["title"],
+             row["download_name"], time.time(), time.time())
+        )
+        return True
+
+    def discard(self, staged_path: str) -> None:
+        """Remove what a failed attempt left at its staging path"""
+        try:
+            os.unlink(staged_path)
+        except OSError:
+            pass
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Every indexed download"""
+        return [self._describe(row) for row in self._conn().execute("SELECT * FROM downloads")]
+
+    def record_access(self, path: str) -> None:
+        """Note that path (relative to the store root) was served, for the eviction order"""
+        updated = self._conn().execute(
+            "UPDATE downloads SET last_accessed = ?, hits = hits + 1 WHERE path = ?", (time.time(), path)
+        ).rowcount
+        if not updated:
+            try:
+                os.utime(self._absolute(path))
+            except OSError:
+                pass
+        self._count("served")
+
+    def pin(self, path: str) -> None:
+        """Keep path from being evicted until unpin(path)"""
+        with self._lock:
+            self._pinned[path] += 1
+
+    def unpin(self, path: str) -> None:
+        with self._lock:
+            self._pinned[path] -= 1
+            if self._pinned[path] <= 0:
+                del self._pinned[path]
+
+    def account(self, added: int) -> None:
+        """Count bytes written under root, evicting if that takes the total over max_bytes"""
+        with self._lock:
+            if self._bytes_used is None:
+                self._bytes_used = sum(size for _, size, _ in self._scan())
+            else:
+                self._bytes_used += added
+            if self._bytes_used <= self._max_bytes:
+                return
+            self._evict()
+
+    def _scan(self):
+        """(path, size, mtime) of every file under root, removing stale staging files; caller holds the lock"""
+        entries = []
+        now = time.time()
+        for directory, _, names in os.walk(self._root):
+            for name in names:
+                full = os.path.join(directory, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                if name.startswith("."):
+                    # A download in progress, unless it is long dead
+                    if now - st.st_mtime > STALE_STAGING_AGE:
+                        try:
+                            os.unlink(full)
+                            self._stats["stale_staging_removed"] += 1
+                        except OSError:
+                            pass
+                    continue
+                entries.append((os.path.relpath(full, self._root).replace(os.sep, "/"), st.st_size, st.st_mtime))
+        self._files = len(entries)
+        return entries
+
+    def _evict(self) -> None:
+        """Remove files by the eviction policy until under 90% of max_bytes; caller holds the lock"""
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        conn = self._conn()
+        usage = {path: (last_accessed, hits) for path, last_accessed, hits in conn.execute(
+            "SELECT path, MAX(last_accessed), SUM(hits) FROM downloads GROUP BY path")}
+        now = time.time()
+        candidates = []
+        for path, size, mtime in entries:
+            last_accessed, hits = usage.get(path, (mtime, 0))
+            if path in self._pinned or now - last_accessed < self._min_age:
+                continue
+            rank = (last_accessed, hits) if self._policy == "lru" else (hits, last_accessed)
+            candidates.append((rank, path, size))
+        candidates.sort()
+
+        target = self._max_bytes * 0.9
+        evicted = freed = 0
+        for _, path, size in candidates:
+            if total <= target:
+                break
+            try:
+                os.unlink(self._absolute(path))
+            except OSError:
+                continue
+            conn.execute("DELETE FROM downloads WHERE path = ?", (path,))
+            directory = os.path.dirname(self._absolute(path))
+            if directory != os.path.normpath(self._root):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass  # not empty
+            total -= size
+            freed += size
+            evicted += 1
+        if total > target:
+            # Whatever is left over the target is in use
+            self._stats["skipped_in_use"] += len(entries) - len(candidates)
+            logger.warning(f"Download store still holds {total} bytes, over {int(target)}; "
+                           f"{len(entries) - len(candidates)} files are in use")
+        self._bytes_used = total
+        self._files = len(entries) - evicted
+        self._last_eviction = now
+        self._stats["evictions"] += evicted
+        self._stats["evicted_bytes"] += freed
+        if evicted:
+            logger.info(f"Evicted {evicted} downloads ({freed} bytes), {total} bytes stored")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Store size against its quota, free disk space and eviction counts"""
+        disk = shutil.disk_usage(self._root)
+        with self._lock:
+            return dict(
+                self._stats,
+                policy=self._policy,
+                bytes_used=self._bytes_used,
+                max_bytes=self._max_bytes,
+                files=self._files,
+                pinned=len(self._pinned),
+                last_eviction=self._last_eviction,
+                disk_total=disk.total,
+                disk_free=disk.free
+            )
+
+_default_store: Optional[DownloadStore] = None
+_default_lock = threading.Lock()
+
+def get_download_store(root: Optional[str] = None) -> DownloadStore:
+    """The process-wide store, configured from DOWNLOAD_* environment variables"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = DownloadStore(
+                root or os.path.join(os.getcwd(), "static", "downloads"),
+                os.environ.get("DOWNLOAD_INDEX_PATH", os.path.join(os.getcwd(), "instance", "downloads.sqlite3")),
+                max_bytes=int(os.environ.get("DOWNLOAD_STORE_MAX_BYTES", 10 * 1024 ** 3)),
+                policy=os.environ.get("DOWNLOAD_EVICTION_POLICY", "lru"),
+                min_age=int(os.environ.get("DOWNLOAD_STORE_MIN_AGE", 3600))
+            )
+        return _default_store
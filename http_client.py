@@ -0,0 +1,158 @@
+from typing import Dict, Iterator, Optional
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+import os
+import threading
+import logging
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Requests per host made inside the innermost count_requests() block
+_request_counts: ContextVar[Optional[Counter]] = ContextVar("upstream_request_counts", default=None)
+
+@contextmanager
+def count_requests() -> Iterator[Counter]:
+    """Count the requests each host receives from this thread inside the block.
+
+    Yields a Counter keyed by host name that fills in as requests are sent.
+    Work handed to other threads is not counted.
+    """
+    counts = Counter()
+    token = _request_counts.set(counts)
+    try:
+        yield counts
+    finally:
+        _request_counts.reset(token)
+
+def error_type_for_status(status_code: Optional[int]) -> str:
+    """Classify an upstream HTTP failure for negative caching"""
+    if status_code in (400, 404, 410):
+        return 'not_found'
+    if status_code == 429:
+        return 'rate_limited'
+    return 'upstream_error'
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9'
+}
+
+# Only idempotent requests are retried, on these statuses or a connection error
+RETRY_METHODS = frozenset(('GET', 'HEAD'))
+RETRY_STATUSES = frozenset((500, 502, 503, 504))
+
+class HttpClient:
+    """Shared keep-alive HTTP client for all upstream calls.
+
+    Wraps one requests.Session whose connection pools are reused across
+    threads, so repeat calls to youtube.com and i.ytimg.com skip the TCP and
+    TLS handshakes. Idempotent requests are retried with exponential backoff
+    on connection errors, timeouts and 5xx responses, at most per_host_limit
+    requests run concurrently against one host, and default headers are set
+    once on the session. The backoff sleeps happen outside the per-host limit,
+    so a failing request does not hold a slot other requests to the host
+    could use. A 429 is returned to the caller rather than retried: its
+    Retry-After can be minutes, and callers negative-cache it instead.
+    Cookies are not persisted, matching the previous stateless requests.get
+    calls and keeping the shared session free of per-request state.
+    """
+
+    def __init__(self, pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.3,
+                 per_host_limit: int = 8, per_host_limits: Optional[Dict[str, int]] = None,
+                 timeout: float = 15.0, headers: Optional[Dict[str, str]] = None):
+        self._timeout = timeout
+        self._per_host_limit = per_host_limit
+        self._per_host_limits = dict(per_host_limits or {})
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+
+        # Retries are done by request(), outside the per-host semaphore
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+
+        self._session = requests.Session()
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.headers.update(headers or DEFAULT_HEADERS)
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                limit = self._per_host_limits.get(host, self._per_host_limit)
+                semaphore = threading.BoundedSemaphore(limit)
+                self._host_semaphores[host] = semaphore
+            return semaphore
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the shared session, honoring the per-host limit"""
+        kwargs.setdefault('timeout', self._timeout)
+        host = urlparse(url).hostname or ''
+        counts = _request_counts.get()
+        if counts is not None:
+            counts[host] += 1
+        retries = self._retries if method.upper() in RETRY_METHODS else 0
+        with self._lock:
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    with self._host_semaphore(url):
+                        response = self._session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == retries:
+                        raise
+                    logger.debug(f"Retrying {method} {url} after {type(e).__name__}")
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == retries:
+                        return response
+                    response.close()
+                    logger.debug(f"Retrying {method} {url} after HTTP {response.status_code}")
+                time.sleep(self._backoff_factor * (2 ** attempt))
+        finally:
+            with self._lock:
+                self._in_flight[host] -= 1
+
+    def in_flight(self, host: Optional[str] = None) -> int:
+        """Requests currently running or waiting, for one host or in total"""
+        with self._lock:
+            if host is not None:
+                return self._in_flight.get(host, 0)
+            return sum(self._in_flight.values())
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+_default_client: Optional[HttpClient] = None
+_default_lock = threading.Lock()
+
+def get_http_client() -> HttpClient:
+    """The process-wide client, configured from HTTP_* environment variables"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient(
+                pool_size=int(os.environ.get("HTTP_POOL_SIZE", 10)),
+                retries=int(os.environ.get("HTTP_RETRIES", 3)),
+                backoff_factor=float(os.environ.get("HTTP_BACKOFF", 0.3)),
+                per_host_limit=int(os.environ.get("HTTP_PER_HOST_LIMIT", 8)),
+                timeout=float(os.environ.get("HTTP_TIMEOUT", 15))
+            )
+        return _default_client
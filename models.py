@@ -25,6 +25,7 @@ class User(UserMixin, db.Model):
 class SearchHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     query = db.Column(db.String(200), nullable=False)
+    search_type = db.Column(db.String(20), nullable=True)  # 'videos' or 'channels'; NULL for older rows
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     results_count = db.Column(db.Integer)
     
@@ -66,3 +67,21 @@ class UserVideo(db.Model):
     
     def __repr__(self):
         return f'<UserVideo {self.user_id}:{self.video_id}>'
+
+class DownloadJob(db.Model):
+    """A background download; state is managed by download_jobs.DownloadJobQueue"""
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    video_id = db.Column(db.String(20), nullable=False)
+    itag = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    state = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.Text, nullable=True)  # JSON of the download result
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<DownloadJob {self.id} {self.state}>'
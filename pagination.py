@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import hashlib
+import json
+
+# Items returned per page, per result list
+SEARCH_PAGE_SIZES = {'videos': 20, 'channels': 15}
+CHANNEL_PAGE_SIZE = 50
+
+def encode_cursor(continuation: Optional[str], offset: int) -> str:
+    """Opaque cursor for the page starting at offset within a fetched YouTube page.
+
+    continuation is the token that fetched that page, or None for the first one.
+    """
+    payload = json.dumps({'c': continuation, 'o': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], int]:
+    """(continuation, offset) from a cursor; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        continuation, offset = payload['c'], int(payload['o'])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if offset < 0 or not (continuation is None or isinstance(continuation, str)):
+        raise ValueError("Invalid cursor")
+    return continuation, offset
+
+def continuation_key(continuation: Optional[str]) -> str:
+    """Short cache-key suffix for a continuation token"""
+    if continuation is None:
+        return "first"
+    return hashlib.sha1(continuation.encode()).hexdigest()[:16]
+
+def paginate(items: List[Any], continuation: Optional[str], offset: int, page_size: int,
+             next_continuation: Optional[str]) -> Tuple[List[Any], Optional[str]]:
+    """Slice one page out of a fetched YouTube page.
+
+    Returns (page items, next cursor). The next cursor points further into
+    the same fetched page while items remain, then at the page YouTube's
+    continuation token leads to, and is None at the end of the results.
+    """
+    end = offset + page_size
+    if end < len(items):
+        next_cursor = encode_cursor(continuation, end)
+    elif next_continuation:
+        next_cursor = encode_cursor(next_continuation, 0)
+    else:
+        next_cursor = None
+    return items[offset:end], next_cursor
+
+def page_response(results: Dict[str, Any], items_key: str, continuation: Optional[str], offset: int,
+                  page_size: int) -> Dict[str, Any]:
+    """Copy of a cached fetch result reduced to one page, with next_cursor set"""
+    page, next_cursor = paginate(results.get(items_key, []), continuation, offset, page_size,
+                                 results.get('continuation'))
+    response = {key: value for key, value in results.items() if key != 'continuation'}
+    response[items_key] = page
+    response['next_cursor'] = next_cursor
+    return response
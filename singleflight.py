@@ -0,0 +1,73 @@
+from typing import Any, Callable, Dict, Hashable
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    """An in-flight call whose outcome is shared with every waiter"""
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers that arrive while
+    it is running block and receive the same result, or the same exception.
+    Nothing is remembered once the call finishes, so failures are never cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {
+            "calls": 0,
+            "coalesced": 0
+        }
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) unless a call for key is already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["calls"] += 1
+                leader = True
+
+        if not leader:
+            logger.debug(f"Waiting on in-flight call for {key}")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+            if call.waiters:
+                logger.debug(f"Shared result for {key} with {call.waiters} waiting callers")
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get call and coalescing counters"""
+        with self._lock:
+            return {
+                **self._stats,
+                "in_flight": len(self._calls)
+            }
@@ -8,6 +8,9 @@ function onYouTubeIframeAPIReady() {
 // Video download functionality
 let downloadModal;
 
+// Thumbnail widths the /thumb proxy precomputes (RESIZE_WIDTHS in thumbnail_store.py)
+const THUMBNAIL_WIDTHS = [120, 240, 360, 480];
+
 // Initialize modals and toasts when document is ready
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize download modal if not already defined in download_modal.html
@@ -199,8 +202,7 @@ function downloadStream(videoId, itag) {
     downloadError.classList.add('d-none');
     
     // Start download
-    fetch(`/video/download/${videoId}?itag=${itag}`)
-        .then(response => response.json())
+    runDownloadJob(videoId, itag)
         .then(data => {
             // Hide loading
             downloadLoading.classList.add('d-none');
@@ -228,8 +230,9 @@ function downloadStream(videoId, itag) {
                 // Update download link
                 const downloadLink = document.getElementById('downloadLink');
                 if (downloadLink) {
-                    downloadLink.href = '/' + data.file_path;
-                    downloadLink.download = data.file_path.split('/').pop();
+                    downloadLink.href = data.download_url || '/' + data.file_path;
+                    downloadLink.download = data.download_name || data.file_path.split('/').pop();
+                    downloadLink.dataset.filePath = data.file_path;
                 }
             } else {
                 // If success element doesn't exist, show a notification toast
@@ -268,6 +271,37 @@ function downloadStream(videoId, itag) {
         });
 }
 
+// Queue a download on the server and poll its job until it finishes,
+// resolving with the download result
+function runDownloadJob(videoId, itag, pollMs = 2000) {
+    return fetch(`/video/download/${videoId}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ itag: itag })
+    })
+        .then(response => response.json())
+        .then(job => {
+            if (!job.job_id) {
+                return { success: false, error: job.error || 'Download failed' };
+            }
+            return new Promise((resolve, reject) => {
+                const poll = () => {
+                    fetch(job.status_url)
+                        .then(response => response.json())
+                        .then(status => {
+                            if (status.state === 'succeeded' || status.state === 'failed') {
+                                resolve(status.result || { success: false, error: status.error || 'Download failed' });
+                            } else {
+                                setTimeout(poll, pollMs);
+                            }
+                        })
+                        .catch(reject);
+                };
+                poll();
+            });
+        });
+}
+
 // Play video function using privacy-enhanced mode
 // Function to save video to user collection
 function saveVideo(videoId, title, thumbnail) {
@@ -453,6 +487,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const loadingSpinner = document.getElementById('loadingSpinner');
     const videoPlayer = document.getElementById('videoPlayer');
 
+    // Query behind the results on screen, for fetching further pages
+    let lastQuery = '';
+    let lastSearchType = '';
+
     // Loading screen quotes
     const loadingQuotes = [
         "Great videos take time to find, just like hidden treasures.",
@@ -576,10 +614,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(data.error || 'Search failed');
             }
 
+            lastQuery = query;
+            lastSearchType = currentSearchType;
             if (data.search_type === 'channels' && data.channels) {
                 displayChannelResults(data.channels, data.total_results);
+                renderLoadMore(data.next_cursor);
             } else if (data.search_type === 'videos' && data.results) {
                 displaySearchResults(data.results, data.total_results);
+                renderLoadMore(data.next_cursor);
             } else {
                 showError('No results found for your search.');
             }
@@ -590,6 +632,40 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // Button that appends the next page of results for the current query
+    function renderLoadMore(nextCursor) {
+        const existing = document.getElementById('loadMoreResults');
+        if (existing) existing.remove();
+        if (!nextCursor) return;
+
+        searchResults.insertAdjacentHTML('beforeend', `
+            <div class="col-12 text-center mt-2 mb-5" id="loadMoreResults">
+                <button type="button" class="btn btn-outline-primary">
+                    <i class="bi bi-arrow-down-circle"></i> Load more
+                </button>
+            </div>
+        `);
+        const container = document.getElementById('loadMoreResults');
+        const button = container.querySelector('button');
+        button.addEventListener('click', async function() {
+            button.disabled = true;
+            try {
+                const response = await fetch(`/search?q=${encodeURIComponent(lastQuery)}&type=${lastSearchType}&cursor=${encodeURIComponent(nextCursor)}`);
+                const data = await response.json();
+                if (!response.ok) {
+                    throw new Error(data.error || 'Failed to load more results');
+                }
+                const items = data.search_type === 'channels' ? data.channels : data.results;
+                const cards = (items || []).map(data.search_type === 'channels' ? channelCard : videoCard).join('');
+                container.insertAdjacentHTML('beforebegin', cards);
+                renderLoadMore(data.next_cursor);
+            } catch (error) {
+                button.disabled = false;
+                showError(error.message);
+            }
+        });
+    }
+
     // Display search results with enhanced channel information
     function displaySearchResults(results, totalResults) {
         if (results.length === 0) {
@@ -624,16 +700,23 @@ document.addEventListener('DOMContentLoaded', function() {
             `;
         }
         
-        searchResults.innerHTML = resultsHTML + results.map(video => `
+        searchResults.innerHTML = resultsHTML + results.map(videoCard).join('');
+    }
+
+    function videoCard(video) {
+        const thumbnail = `/thumb/${video.id}/hqdefault`;
+        const srcset = THUMBNAIL_WIDTHS.map(width => `${thumbnail}?w=${width} ${width}w`).join(', ');
+        return `
             <div class="col-md-4 mb-4">
                 <div class="card h-100">
                     <div class="search-result" 
                          onclick="playVideo('${video.id}')"
                          data-video-id="${video.id}"
                          data-title="${video.title.replace(/"/g, '&quot;')}"
-                         data-thumbnail="${video.thumbnail.replace(/"/g, '&quot;')}">
+                         data-thumbnail="${thumbnail}">
                         <div class="thumbnail-container">
-                            <img src="${video.thumbnail}" class="card-img-top" alt="${video.title}"
+                            <img src="${thumbnail}"
+                                 srcset="${srcset}" sizes="(min-width: 768px) 33vw, 100vw" class="card-img-top" alt="${video.title}"
                                  onerror="this.src='https://via.placeholder.com/480x360.png?text=Thumbnail+Unavailable'">
                             <span class="duration-badge">${video.duration}</span>
                         </div>
@@ -665,7 +748,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     </div>
                 </div>
             </div>
-        `).join('');
+        `;
     }
     
     // Display channel search results
@@ -702,7 +785,11 @@ document.addEventListener('DOMContentLoaded', function() {
             `;
         }
         
-        searchResults.innerHTML = resultsHTML + channels.map(channel => `
+        searchResults.innerHTML = resultsHTML + channels.map(channelCard).join('');
+    }
+
+    function channelCard(channel) {
+        return `
             <div class="col-md-4 mb-4">
                 <div class="card h-100">
                     <div class="channel-result">
@@ -724,6 +811,6 @@ document.addEventListener('DOMContentLoaded', function() {
                     </div>
                 </div>
             </div>
-        `).join('');
+        `;
     }
 });
\ No newline at end of file
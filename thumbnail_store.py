@@ -0,0 +1,359 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from http_client import get_http_client
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency; without it thumbnails are served at source size
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_HOST = "https://i.ytimg.com"
+
+# Image names i.ytimg.com serves for every video, smallest first
+THUMBNAIL_VARIANTS = ("default", "mqdefault", "hqdefault", "sddefault", "maxresdefault")
+
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+# How long a missing image (maxresdefault often is) is remembered
+NOT_FOUND_TTL = 3600
+
+# Widths precomputed for every thumbnail, each as WebP and JPEG; a width
+# beyond the source image is a re-encode at source size. A WebP at the
+# source's own width is also made, named "full", for requests without ?w=
+RESIZE_WIDTHS = (120, 240, 360, 480)
+FULL_WIDTH = "full"
+RESIZE_FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+
+def proxy_url(video_id: str, variant: str = "hqdefault") -> str:
+    """Path of a thumbnail on the local /thumb proxy"""
+    return f"/thumb/{video_id}/{variant}"
+
+def proxy_srcset(video_id: str, variant: str = "hqdefault") -> str:
+    """srcset offering every precomputed width of a thumbnail"""
+    return ", ".join(f"{proxy_url(video_id, variant)}?w={width} {width}w" for width in RESIZE_WIDTHS)
+
+def render_renditions(source_path: str, prefix: str, widths: Iterable[int], quality: int = 75) -> int:
+    """Write each width of source_path as prefix-<width>.<ext> in every format, returning bytes written.
+
+    Also writes prefix-full.webp at the source's width; the JPEG at that
+    width is the source itself. Runs in a worker process. Outputs that
+    already exist are skipped, and each is written to a temporary file
+    renamed into place.
+    """
+    written = 0
+    directory = os.path.dirname(prefix)
+    with Image.open(source_path) as source:
+        source = source.convert("RGB")
+        for width in (*widths, FULL_WIDTH):
+            target = source.width if width == FULL_WIDTH else min(width, source.width)
+            image = source
+            if target < source.width:
+                image = source.resize((target, round(source.height * target / source.width)), Image.LANCZOS)
+            for ext, (image_format, _) in RESIZE_FORMATS.items():
+                path = f"{prefix}-{width}.{ext}"
+                if (width == FULL_WIDTH and ext == "jpg") or os.path.exists(path):
+                    continue
+                options = {"optimize": True, "progressive": True} if image_format == "JPEG" else {"method": 4}
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        image.save(f, format=image_format, quality=quality, **options)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
+                written += os.path.getsize(path)
+    return written
+
+class ThumbnailStore:
+    """Content-addressed on-disk cache of YouTube thumbnails.
+
+    Images are stored once per content hash under objects/, and a small ref
+    file per (video_id, variant) under refs/ names the hash it resolved to.
+    Both live on disk, so every worker and the download helper subprocess
+    share the same cache and each thumbnail is fetched from upstream once.
+    Downloads stream into a temporary file that is renamed into place, so a
+    reader never sees a partial image. A ref older than ttl seconds is
+    refetched; an empty ref records an upstream 404.
+
+    Smaller WebP and JPEG renditions of each image are produced once, in a
+    pool of resize_workers processes, the first time one is asked for, and
+    stored next to it; until they exist the source image is served. This
+    needs Pillow and is off without it or with resize_workers=0.
+
+    When the stored images exceed max_bytes, the least recently served ones
+    are removed until the total is back under 90% of the limit. The running
+    total is per process and is corrected by the directory scan each
+    eviction does.
+    """
+
+    def __init__(self, root: str, http=None, max_bytes: int = 256 * 1024 * 1024,
+                 ttl: int = 7 * 24 * 3600, resize_workers: int = 2,
+                 widths: Iterable[int] = RESIZE_WIDTHS):
+        self._objects = os.path.join(root, "objects")
+        self._refs = os.path.join(root, "refs")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._refs, exist_ok=True)
+        self._http = http or get_http_client()
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._bytes_used: Optional[int] = None
+        self._widths = tuple(sorted(widths))
+        self._resize_workers = resize_workers if Image is not None else 0
+        if Image is None and resize_workers:
+            logger.info("Pillow is not installed; thumbnails are served at source size")
+        self._resize_pool: Optional[ProcessPoolExecutor] = None
+        self._pending_resizes = set()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "not_found": 0,
+            "fetched_bytes": 0,
+            "evictions": 0,
+            "resized": 0,
+            "resized_bytes": 0,
+            "resize_failures": 0
+        }
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _ref_path(self, video_id: str, variant: str) -> str:
+        return os.path.join(self._refs, f"{video_id}.{variant}")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._objects, digest[:2], f"{digest}.jpg")
+
+    def _read_ref(self, video_id: str, variant: str):
+        """The stored (path, digest), False for a remembered 404, or None if unknown or expired"""
+        ref_path = self._ref_path(video_id, variant)
+        try:
+            age = time.time() - os.stat(ref_path).st_mtime
+            with open(ref_path) as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        if not digest:
+            return False if age < NOT_FOUND_TTL else None
+        if age > self._ttl:
+            return None
+        path = self._object_path(digest)
+        try:
+            # Serving an image marks it recently used for eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return path, digest
+
+    def _write_ref(self, video_id: str, variant: str, digest: str) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self._refs, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(digest)
+        os.replace(tmp_path, self._ref_path(video_id, variant))
+
+    def get(self, video_id: str, variant: str = "hqdefault") -> Optional[Tuple[str, str]]:
+        """(file path, content hash) of a thumbnail, fetching it on a miss; None if upstream has none"""
+        found = self._read_ref(video_id, variant)
+        if found is False:
+            self._count("not_found")
+            return None
+        if found:
+            self._count("hits")
+            return found
+        self._count("misses")
+        return self._fetch(video_id, variant)
+
+    def get_best(self, video_id: str, variants: Iterable[str] = ("maxresdefault", "hqdefault")) -> Optional[Tuple[str, str]]:
+        """The first of variants that exists"""
+        for variant in variants:
+            found = self.get(video_id, variant)
+            if found:
+                return found
+        return None
+
+    def _fetch(self, video_id: str, variant: str) -> Optional[Tuple[str, str]]:
+        url = f"{THUMBNAIL_HOST}/vi/{video_id}/{variant}.jpg"
+        response = self._http.get(url, stream=True)
+        try:
+            if response.status_code == 404:
+                self._write_ref(video_id, variant, "")
+                self._count("not_found")
+                return None
+            response.raise_for_status()
+
+            hasher = hashlib.sha256()
+            size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=self._objects, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        hasher.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                digest = hasher.hexdigest()
+                path = self._object_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.exists(path):
+                    # Same image as another video or variant; keep the stored copy
+                    os.unlink(tmp_path)
+                    size = 0
+                else:
+                    os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        finally:
+            response.close()
+
+        self._write_ref(video_id, variant, digest)
+        self._count("fetched_bytes", size)
+        logger.debug(f"Stored thumbnail {video_id}/{variant} as {digest}")
+        self._account(size)
+        return path, digest
+
+    def get_rendition(self, source_path: str, digest: str, width: Optional[int],
+                      ext: str) -> Optional[Tuple[str, str]]:
+        """(file path, content tag) of the smallest precomputed rendition at least width wide.
+
+        With no width, or one wider than every rendition, the image keeps
+        its source width: the WebP rendition made at that width, or for JPEG
+        the source itself. Returns None, and schedules the renditions of
+        this image, when they have not been produced yet.
+        """
+        candidates = [w for w in self._widths if width is not None and w >= width]
+        if not candidates and ext == "jpg":
+            return source_path, digest
+        if not self._resize_workers:
+            return None
+        chosen = candidates[0] if candidates else FULL_WIDTH
+        path = f"{self._rendition_prefix(digest)}-{chosen}.{ext}"
+        try:
+            os.utime(path)
+        except OSError:
+            self._schedule_renditions(source_path, digest)
+            return None
+        return path, os.path.basename(path)
+
+    def _rendition_prefix(self, digest: str) -> str:
+        return os.path.join(self._objects, digest[:2], digest)
+
+    def _schedule_renditions(self, source_path: str, digest: str) -> None:
+        with self._lock:
+            if digest in self._pending_resizes:
+                return
+            self._pending_resizes.add(digest)
+            if self._resize_pool is None:
+                self._resize_pool = ProcessPoolExecutor(max_workers=self._resize_workers)
+            pool = self._resize_pool
+        future = pool.submit(render_renditions, source_path, self._rendition_prefix(digest), self._widths)
+        future.add_done_callback(lambda done: self._renditions_done(digest, done))
+
+    def _renditions_done(self, digest: str, future) -> None:
+        with self._lock:
+            self._pending_resizes.discard(digest)
+        try:
+            written = future.result()
+        except Exception as e:
+            self._count("resize_failures")
+            logger.warning(f"Could not resize thumbnail {digest}: {str(e)}")
+            return
+        self._count("resized")
+        self._count("resized_bytes", written)
+        self._account(written)
+
+    def _account(self, added: int) -> None:
+        with self._lock:
+            if self._bytes_used is None:
+                self._bytes_used = sum(size for _, size, _ in self._scan())
+            else:
+                self._bytes_used += added
+            if self._bytes_used <= self._max_bytes:
+                return
+            self._evict()
+
+    def _scan(self):
+        """(mtime, size, path) of every stored image"""
+        entries = []
+        for prefix in os.listdir(self._objects):
+            directory = os.path.join(self._objects, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        """Remove least recently served images until under 90% of max_bytes; caller holds the lock"""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = self._max_bytes * 0.9
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        self._bytes_used = total
+        self._stats["evictions"] += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} thumbnails, {total} bytes stored")
+        self._prune_refs()
+
+    def _prune_refs(self) -> None:
+        """Drop refs that expired or whose image was evicted"""
+        now = time.time()
+        for name in os.listdir(self._refs):
+            ref_path = os.path.join(self._refs, name)
+            try:
+                expired = now - os.stat(ref_path).st_mtime > self._ttl
+                with open(ref_path) as f:
+                    digest = f.read().strip()
+                if expired or (digest and not os.path.exists(self._object_path(digest))):
+                    os.unlink(ref_path)
+            except OSError:
+                continue
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, bytes_used=self._bytes_used, max_bytes=self._max_bytes,
+                        pending_resizes=len(self._pending_resizes))
+
+_default_store: Optional[ThumbnailStore] = None
+_default_lock = threading.Lock()
+
+def get_thumbnail_store() -> ThumbnailStore:
+    """The process-wide store, configured from THUMBNAIL_* environment variables"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ThumbnailStore(
+                os.environ.get("THUMBNAIL_CACHE_DIR", os.path.join(os.getcwd(), "instance", "thumbnails")),
+                max_bytes=int(os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+                ttl=int(os.environ.get("THUMBNAIL_CACHE_TTL", 7 * 24 * 3600)),
+                resize_workers=int(os.environ.get("THUMBNAIL_RESIZE_WORKERS", 2))
+            )
+        return _default_store
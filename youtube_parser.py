@@ -0,0 +1,159 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ways YouTube assigns the initial data blob in results, channel and watch pages
+INITIAL_DATA_MARKERS = (
+    'var ytInitialData = ',
+    'window["ytInitialData"] = ',
+    "window['ytInitialData'] = ",
+    'ytInitialData = '
+)
+
+VIDEO_RENDERERS = frozenset(('videoRenderer', 'gridVideoRenderer'))
+CHANNEL_RENDERERS = frozenset(('channelRenderer',))
+CONTINUATION_RENDERERS = frozenset(('continuationItemRenderer',))
+
+_decoder = json.JSONDecoder()
+
+def extract_initial_data(html_content: str) -> Optional[Dict[str, Any]]:
+    """Locate the embedded ytInitialData JSON and decode it in one pass.
+
+    raw_decode stops at the end of the object, so the rest of the page is
+    never scanned. Returns None if no marker is followed by a JSON object.
+    """
+    for marker in INITIAL_DATA_MARKERS:
+        start = html_content.find(marker)
+        if start == -1:
+            continue
+        try:
+            data, _ = _decoder.raw_decode(html_content, start + len(marker))
+        except ValueError as e:
+            logger.debug(f"Could not decode ytInitialData after {marker!r}: {str(e)}")
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+def iter_renderers(data: Any, names: Iterable[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (name, node) for every renderer in names, in document order.
+
+    Walks the tree iteratively and does not descend into a matched renderer.
+    """
+    names = frozenset(names)
+    stack = [iter(((None, data),))]
+    while stack:
+        for key, value in stack[-1]:
+            if key in names and isinstance(value, dict):
+                yield key, value
+            elif isinstance(value, dict):
+                stack.append(iter(value.items()))
+                break
+            elif isinstance(value, list):
+                stack.append(((None, item) for item in value))
+                break
+        else:
+            stack.pop()
+
+def get_text(node: Any) -> Optional[str]:
+    """Text of a YouTube text object: {'simpleText': ...} or {'runs': [{'text': ...}]}"""
+    if not isinstance(node, dict):
+        return None
+    if 'simpleText' in node:
+        return node['simpleText']
+    runs = node.get('runs')
+    if runs:
+        return ''.join(run.get('text', '') for run in runs)
+    return None
+
+def _first_thumbnail(node: Dict[str, Any]) -> str:
+    thumbnails = node.get('thumbnail', {}).get('thumbnails') or [{}]
+    url = thumbnails[0].get('url', '')
+    return f"https:{url}" if url.startswith('//') else url
+
+def _browse_endpoint(text_node: Any) -> Dict[str, Any]:
+    """browseEndpoint of the first run of a byline text object"""
+    if not isinstance(text_node, dict):
+        return {}
+    for run in text_node.get('runs') or []:
+        endpoint = run.get('navigationEndpoint', {}).get('browseEndpoint')
+        if endpoint:
+            return endpoint
+    return {}
+
+def parse_video(renderer: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Convert a videoRenderer into the dict shape used by YouTubeService"""
+    video_id = renderer.get('videoId')
+    if not video_id:
+        return None
+    owner = renderer.get('ownerText') or renderer.get('longBylineText') or renderer.get('shortBylineText')
+    description = get_text(renderer.get('descriptionSnippet'))
+    if description is None:
+        snippets = renderer.get('detailedMetadataSnippets') or [{}]
+        description = get_text(snippets[0].get('snippetText'))
+    return {
+        'id': video_id,
+        'title': get_text(renderer.get('title')) or "Untitled",
+        'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        'channel': get_text(owner) or "Unknown Channel",
+        'channel_id': _browse_endpoint(owner).get('browseId', ""),
+        'views': get_text(renderer.get('viewCountText')) or "No view count",
+        'duration': get_text(renderer.get('lengthText')) or "Unknown duration",
+        'publish_time': get_text(renderer.get('publishedTimeText')) or "",
+        'description': description or ""
+    }
+
+def parse_channel(renderer: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Convert a channelRenderer into the dict shape used by YouTubeService"""
+    channel_id = renderer.get('channelId')
+    if not channel_id:
+        return None
+    channel_data = {
+        'id': channel_id,
+        'name': get_text(renderer.get('title')) or "Unknown Channel",
+        'thumbnail': _first_thumbnail(renderer),
+        'subscriber_count': get_text(renderer.get('subscriberCountText')) or "Unknown subscribers",
+        'description': get_text(renderer.get('descriptionSnippet')) or ""
+    }
+    base_url = renderer.get('navigationEndpoint', {}).get('browseEndpoint', {}).get('canonicalBaseUrl', '')
+    if base_url.startswith('/@'):
+        channel_data['handle'] = base_url[1:]
+    return channel_data
+
+def find_continuation(data: Any) -> Optional[str]:
+    """Token of the first continuationItemRenderer, used to request the next page"""
+    for _, renderer in iter_renderers(data, CONTINUATION_RENDERERS):
+        token = renderer.get('continuationEndpoint', {}).get('continuationCommand', {}).get('token')
+        if token:
+            return token
+    return None
+
+def parse_videos(data: Dict[str, Any], limit: int = 60) -> List[Dict[str, str]]:
+    """All distinct videos in a decoded ytInitialData, in page order"""
+    videos = []
+    seen = set()
+    for _, renderer in iter_renderers(data, VIDEO_RENDERERS):
+        video = parse_video(renderer)
+        if video is None or video['id'] in seen:
+            continue
+        seen.add(video['id'])
+        videos.append(video)
+        if len(videos) >= limit:
+            break
+    return videos
+
+def parse_channels(data: Dict[str, Any], limit: int = 30) -> List[Dict[str, str]]:
+    """All distinct channels in a decoded ytInitialData, in page order"""
+    channels = []
+    seen = set()
+    for _, renderer in iter_renderers(data, CHANNEL_RENDERERS):
+        channel = parse_channel(renderer)
+        if channel is None or channel['id'] in seen:
+            continue
+        seen.add(channel['id'])
+        channels.append(channel)
+        if len(channels) >= limit:
+            break
+    return channels
@@ -3,12 +3,30 @@ from urllib.parse import parse_qs, urlparse
 import logging
 import re
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from cache import Cache
+from singleflight import SingleFlight
+from http_client import error_type_for_status, get_http_client
+from youtube_parser import extract_initial_data, find_continuation, parse_videos, parse_channels
 
 logger = logging.getLogger(__name__)
 
-class YouTubeService:
-    def __init__(self):
-        self.base_url = "https://www.youtube.com"
+class YouTubeServiceBase:
+    """URL building and page parsing shared by the blocking and asyncio services"""
+
+    # How long to remember which URL form resolved for a video or channel
+    RESOLUTION_TTL = 7 * 24 * 3600
+
+    # Web client version sent with continuation requests until a page reports its own
+    DEFAULT_CLIENT_VERSION = "2.20240101.00.00"
+
+    def __init__(self, resolution_cache=None, base_url: str = "https://www.youtube.com"):
+        # Maps video/channel IDs to the URL form that worked, so later
+        # lookups go straight to it instead of probing every candidate
+        self._resolutions = resolution_cache if resolution_cache is not None else Cache(
+            ttl_seconds=self.RESOLUTION_TTL, max_size=5000, prefix="resolve"
+        )
+        self.base_url = base_url.rstrip("/")
         self.search_url = f"{self.base_url}/results"
         self.video_url = f"{self.base_url}/embed"
         self.watch_url = f"{self.base_url}/watch"
@@ -17,8 +35,40 @@ class YouTubeService:
             "watch",
             "shorts"
         ]
-
-    def _extract_video_id(self, html_content):
+        # Innertube API key and client version, learned from the last page fetched
+        self._innertube = {'key': None, 'client_version': self.DEFAULT_CLIENT_VERSION}
+
+    def _extract_video_id(self, html_content, data=None):
+        """Extract videos from a results or channel page.
+
+        Decodes the embedded ytInitialData once (unless the caller already
+        has) and walks its videoRenderer nodes, so every field comes from the
+        same video. Falls back to the regex scan if the page has no
+        parseable ytInitialData.
+        """
+        if data is None:
+            data = extract_initial_data(html_content)
+        if data is not None:
+            videos = parse_videos(data, limit=60)
+            if videos:
+                logger.debug(f"Extracted {len(videos)} videos from ytInitialData")
+                return videos
+        logger.debug("No videos in ytInitialData, falling back to regex extraction")
+        return self._extract_video_id_regex(html_content)
+
+    def _extract_channel_info(self, html_content, data=None):
+        """Extract channel information from search results"""
+        if data is None:
+            data = extract_initial_data(html_content)
+        if data is not None:
+            channels = parse_channels(data, limit=30)
+            if channels:
+                logger.debug(f"Extracted {len(channels)} channels from ytInitialData")
+                return channels
+        logger.debug("No channels in ytInitialData, falling back to regex extraction")
+        return self._extract_channel_info_regex(html_content)
+
+    def _extract_video_id_regex(self, html_content):
         logger.debug("Starting video information extraction")
         # Enhanced patterns for better metadata extraction
         patterns = {
@@ -73,8 +123,8 @@ class YouTubeService:
 
         return videos
 
-    def _extract_channel_info(self, html_content):
-        """Extract channel information from search results"""
+    def _extract_channel_info_regex(self, html_content):
+        """Extract channel information from search results with one regex scan per field"""
         logger.debug("Starting channel information extraction")
         
         # Enhanced patterns for channel data
@@ -131,41 +181,248 @@ class YouTubeService:
                 
         return channels
 
-    def search(self, query: str, search_type="videos") -> dict:
+    def _search_params(self, query: str, search_type: str) -> dict:
+        """Query string for a results page of the given search type"""
+        # Set parameters based on search type
+        if search_type == "channels":
+            # Filter for channels
+            sp_param = "EgIQAg%3D%3D"
+        else:
+            # Default filter for videos
+            sp_param = "CAISAhAB"
+
+        # Enhanced search parameters
+        return {
+            'search_query': query,
+            'sp': sp_param,
+            'app': 'desktop',
+        }
+
+    def _remember_innertube(self, html_content: str) -> None:
+        """Keep the API key and client version a page was served with, for continuation requests"""
+        key_match = re.search(r'"INNERTUBE_API_KEY":"([^"]+)"', html_content)
+        if key_match:
+            self._innertube['key'] = key_match.group(1)
+        version_match = re.search(r'"INNERTUBE_CLIENT_VERSION":"([^"]+)"', html_content)
+        if version_match:
+            self._innertube['client_version'] = version_match.group(1)
+
+    def _continuation_request(self, endpoint: str, continuation: str) -> tuple:
+        """(url, params, json body) for an innertube 'search' or 'browse' continuation"""
+        params = {'prettyPrint': 'false'}
+        if self._innertube['key']:
+            params['key'] = self._innertube['key']
+        body = {
+            'context': {'client': {'clientName': 'WEB', 'clientVersion': self._innertube['client_version'],
+                                   'hl': 'en', 'gl': 'US'}},
+            'continuation': continuation
+        }
+        return f"{self.base_url}/youtubei/v1/{endpoint}", params, body
+
+    def _parse_search_results(self, html_content: str, search_type: str) -> dict:
+        """Every result on a results page, plus the token for the page after it.
+
+        Results are not truncated here; the routes page through them.
+        """
+        self._remember_innertube(html_content)
+        data = extract_initial_data(html_content)
+        continuation = find_continuation(data) if data is not None else None
+        if search_type == "channels":
+            results = self._extract_channel_info(html_content, data)
+            return {'channels': results, 'search_type': 'channels', 'total_results': len(results),
+                    'continuation': continuation}
+        else:
+            videos = self._extract_video_id(html_content, data)
+            return {'results': videos, 'search_type': 'videos', 'total_results': len(videos),
+                    'continuation': continuation}
+
+    def _parse_search_continuation(self, data: dict, search_type: str) -> dict:
+        """Results from an innertube search continuation response"""
+        continuation = find_continuation(data)
+        if search_type == "channels":
+            results = parse_channels(data, limit=30)
+            return {'channels': results, 'search_type': 'channels', 'total_results': len(results),
+                    'continuation': continuation}
+        videos = parse_videos(data, limit=60)
+        return {'results': videos, 'search_type': 'videos', 'total_results': len(videos),
+                'continuation': continuation}
+
+    def _check_watch_page(self, html_content: str, video_info: dict) -> None:
+        """Flag age restriction or unavailability found on a watch page"""
+        if "age-restricted" in html_content.lower():
+            video_info['is_restricted'] = True
+            video_info['error_message'] = "This video is age-restricted"
+        elif "unavailable" in html_content.lower():
+            video_info['error_message'] = "This video is unavailable"
+
+    def _video_url_candidates(self, video_id: str) -> list:
+        """(pattern, url) pairs to probe for a playable video, in preference order"""
+        candidates = []
+        for pattern in self.fallback_patterns:
+            if pattern == "embed":
+                url = f"{self.base_url}/embed/{video_id}?autoplay=1&rel=0&modestbranding=1"
+            elif pattern == "watch":
+                url = f"{self.base_url}/watch?v={video_id}"
+            else:
+                url = f"{self.base_url}/shorts/{video_id}"
+            candidates.append((pattern, url))
+        return candidates
+
+    def _remembered_first(self, key: str, candidates: list, name=lambda candidate: candidate) -> tuple:
+        """Split candidates into (remembered resolution, remaining candidates)"""
+        resolved = self._resolutions.get(key)
+        if resolved is None:
+            return [], candidates
+        remembered = [candidate for candidate in candidates if name(candidate) == resolved]
+        if not remembered:
+            self._resolutions.delete(key)
+            return [], candidates
+        return remembered, [candidate for candidate in candidates if name(candidate) != resolved]
+
+    def _channel_urls(self, channel_id: str) -> list:
+        """Channel page URLs to try for an ID, handle or legacy name"""
+        # Handle both @ handles and channel IDs
+        if channel_id.startswith('@'):
+            return [f"{self.base_url}/{channel_id}/videos"]
+        elif channel_id.startswith('UC'):
+            return [f"{self.base_url}/channel/{channel_id}/videos"]
+        else:
+            # Try all formats if the channel ID format is unclear
+            return [
+                f"{self.base_url}/c/{channel_id}/videos",
+                f"{self.base_url}/channel/{channel_id}/videos",
+                f"{self.base_url}/@{channel_id}/videos",
+                f"{self.base_url}/user/{channel_id}/videos"
+            ]
+
+    def _parse_channel_page(self, channel_id: str, html_content: str) -> dict:
+        """Build the channel dict (or an error dict) from a channel videos page"""
+        # Extract channel information with multiple patterns
+        channel_title_pattern = r'\"title\":\"([^\"]+?)\"'
+
+        # Try multiple subscriber count patterns
+        subscriber_patterns = [
+            r'\"subscriberCountText\":\{\"simpleText\":\"([^\"]+?)\"',
+            r'\"subscriberCountText\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\"',
+            r'subscribers\":\{\"simpleText\":\"([^\"]+?)\"',
+            r'\"subCount\":\"([^\"]+?)\"'
+        ]
+
+        channel_title_match = re.search(channel_title_pattern, html_content)
+
+        # Try all subscriber patterns
+        subscriber_match = None
+        for pattern in subscriber_patterns:
+            subscriber_match = re.search(pattern, html_content)
+            if subscriber_match:
+                logger.debug(f"Found subscriber count with pattern: {pattern}")
+                break
+
+        # Check if we got valid channel data
+        if not channel_title_match:
+            logger.error("Could not find channel title in response")
+            return {'error': 'Channel not found', 'error_type': 'not_found'}
+
+        # Extract videos using the same pattern as search results
+        self._remember_innertube(html_content)
+        data = extract_initial_data(html_content)
+        videos = self._format_channel_videos(self._extract_video_id(html_content, data))
+
+        # Keep every video on the page; the routes page through them
+        channel_data = {
+            'id': channel_id,
+            'title': channel_title_match.group(1) if channel_title_match else "Unknown Channel",
+            'subscriber_count': subscriber_match.group(1) if subscriber_match else "Unknown subscribers",
+            'videos': videos,
+            'video_count': len(videos),  # Store the total number of videos we found
+            'continuation': find_continuation(data) if data is not None else None
+        }
+
+        if not channel_data['videos']:
+            logger.warning("No videos found for channel")
+            return {'error': 'No videos found for this channel', 'error_type': 'not_found'}
+
+        logger.debug(f"Successfully extracted {len(channel_data['videos'])} videos for channel")
+        return channel_data
+
+    def _format_channel_videos(self, videos: list) -> list:
+        """Format videos with consistent metadata for display"""
+        for video in videos:
+            # Make sure view count is properly formatted
+            if 'views' in video and video['views']:
+                if not any(substring in video['views'].lower() for substring in ['views', 'view']):
+                    video['views'] = f"{video['views']} views"
+        return videos
+
+    def _parse_channel_continuation(self, channel_id: str, data: dict) -> dict:
+        """Videos from an innertube browse continuation of a channel's videos tab"""
+        videos = self._format_channel_videos(parse_videos(data, limit=60))
+        return {'id': channel_id, 'videos': videos, 'video_count': len(videos),
+                'continuation': find_continuation(data)}
+
+class YouTubeService(YouTubeServiceBase):
+    def __init__(self, http=None, resolution_cache=None, probe_workers: int = 16,
+                 base_url: str = "https://www.youtube.com"):
+        super().__init__(resolution_cache=resolution_cache, base_url=base_url)
+        # Pooled keep-alive session shared by every upstream call
+        self.http = http or get_http_client()
+        # Concurrent misses for the same search or channel share one upstream fetch
+        self._flight = SingleFlight()
+        # Fetches the watch page while the video URL forms are probed
+        self._probe_pool = ThreadPoolExecutor(max_workers=probe_workers, thread_name_prefix="youtube-probe")
+
+    def _first_success(self, candidates: list, probe) -> tuple:
+        """Run probe(candidate) for each candidate in preference order.
+
+        Returns (candidate, result) for the first candidate whose probe
+        gives a truthy result, or (None, None) if every probe fails. The
+        forms can belong to different channels, so a later candidate is
+        only tried once every earlier one has failed.
+        """
+        for candidate in candidates:
+            result = probe(candidate)
+            if result:
+                return candidate, result
+        return None, None
+
+    def _resolve(self, key: str, candidates: list, probe, name=lambda candidate: candidate) -> tuple:
+        """Probe the remembered candidate alone, else the others in order, remembering the winner"""
+        remembered, others = self._remembered_first(key, candidates, name)
+        if remembered:
+            result = probe(remembered[0])
+            if result:
+                return remembered[0], result
+            logger.debug(f"Remembered resolution for {key} failed, probing all candidates")
+            self._resolutions.delete(key)
+        candidate, result = self._first_success(others, probe)
+        if candidate is not None:
+            self._resolutions.set(key, name(candidate))
+        return candidate, result
+
+    def in_flight(self) -> int:
+        """Upstream requests running or waiting on the shared HTTP client"""
+        return self.http.in_flight()
+
+    def search(self, query: str, search_type="videos", continuation=None) -> dict:
+        """Search YouTube, coalescing concurrent identical queries into one fetch.
+
+        With a continuation token, fetches the results page it points to.
+        """
+        return self._flight.do(("search", search_type, query.lower(), continuation),
+                               self._search, query, search_type, continuation)
+
+    def _search(self, query: str, search_type="videos", continuation=None) -> dict:
+        if continuation:
+            return self._search_continuation(search_type, continuation)
         try:
             logger.debug(f"Searching for query: {query}, type: {search_type}")
-            
-            # Set parameters based on search type
-            if search_type == "channels":
-                # Filter for channels
-                sp_param = "EgIQAg%3D%3D"
-            else:
-                # Default filter for videos
-                sp_param = "CAISAhAB"
-                
-            # Enhanced search parameters
-            params = {
-                'search_query': query,
-                'sp': sp_param,
-                'app': 'desktop',
-            }
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            response = requests.get(self.search_url, params=params, headers=headers)
+
+            response = self.http.get(self.search_url, params=self._search_params(query, search_type))
             response.raise_for_status()
 
             if response.status_code == 200:
                 logger.debug("Successfully received search results from YouTube")
-                
-                if search_type == "channels":
-                    results = self._extract_channel_info(response.text)
-                    return {'channels': results[:15], 'search_type': 'channels', 'total_results': len(results)}
-                else:
-                    videos = self._extract_video_id(response.text)
-                    return {'results': videos[:20], 'search_type': 'videos', 'total_results': len(videos)}
+                return self._parse_search_results(response.text, search_type)
             else:
                 logger.error(f"YouTube search failed with status code: {response.status_code}")
                 return {'results': [], 'search_type': search_type}
@@ -174,6 +431,17 @@ class YouTubeService:
             logger.error(f"Search request failed: {str(e)}")
             raise
 
+    def _search_continuation(self, search_type: str, continuation: str) -> dict:
+        try:
+            logger.debug(f"Fetching search continuation, type: {search_type}")
+            url, params, body = self._continuation_request("search", continuation)
+            response = self.http.post(url, params=params, json=body)
+            response.raise_for_status()
+            return self._parse_search_continuation(response.json(), search_type)
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Search continuation request failed: {str(e)}")
+            raise
+
     def get_video_url(self, video_id: str) -> dict:
         """Get video URL with availability check and metadata"""
         logger.debug(f"Attempting to get video URL for ID: {video_id}")
@@ -185,43 +453,30 @@ class YouTubeService:
             'error_message': None
         }
 
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        # Check the watch page for restrictions while the URL forms are probed
+        info_url = f"{self.base_url}/watch?v={video_id}"
+        info_future = self._probe_pool.submit(self.http.get, info_url)
+
+        def probe(candidate):
+            pattern, url = candidate
+            try:
+                return self.http.head(url, allow_redirects=True).status_code == 200
+            except requests.RequestException as e:
+                logger.warning(f"Failed to access {pattern} URL for video {video_id}: {str(e)}")
+                return False
+
+        candidate, _ = self._resolve(f"video:{video_id}", self._video_url_candidates(video_id), probe,
+                                     name=lambda candidate: candidate[0])
 
-        # First try to get video info
         try:
-            info_url = f"{self.base_url}/watch?v={video_id}"
-            response = requests.get(info_url, headers=headers)
-
-            if "age-restricted" in response.text.lower():
-                video_info['is_restricted'] = True
-                video_info['error_message'] = "This video is age-restricted"
-            elif "unavailable" in response.text.lower():
-                video_info['error_message'] = "This video is unavailable"
+            self._check_watch_page(info_future.result().text, video_info)
         except requests.RequestException as e:
             logger.warning(f"Failed to check video info: {str(e)}")
 
-        # Try different URL patterns if video isn't clearly restricted
-        if not video_info['is_restricted']:
-            for pattern in self.fallback_patterns:
-                try:
-                    if pattern == "embed":
-                        url = f"{self.base_url}/embed/{video_id}?autoplay=1&rel=0&modestbranding=1"
-                    elif pattern == "watch":
-                        url = f"{self.base_url}/watch?v={video_id}"
-                    else:
-                        url = f"{self.base_url}/shorts/{video_id}"
-
-                    response = requests.head(url, headers=headers, allow_redirects=True)
-                    if response.status_code == 200:
-                        video_info['url'] = url
-                        logger.debug(f"Successfully found working URL pattern: {pattern}")
-                        break
-
-                except requests.RequestException as e:
-                    logger.warning(f"Failed to access {pattern} URL for video {video_id}: {str(e)}")
-                    continue
+        # Only offer a URL if the video isn't clearly restricted
+        if candidate is not None and not video_info['is_restricted']:
+            video_info['url'] = candidate[1]
+            logger.debug(f"Successfully found working URL pattern: {candidate[0]}")
 
         # If no URL was found but no specific error was detected
         if not video_info['url'] and not video_info['error_message']:
@@ -229,107 +484,60 @@ class YouTubeService:
 
         return video_info
 
-    def get_channel_videos(self, channel_id: str) -> dict:
-        """Fetch videos for a specific channel"""
+    def get_channel_videos(self, channel_id: str, continuation=None) -> dict:
+        """Fetch videos for a specific channel, coalescing concurrent requests for it.
+
+        With a continuation token, fetches the next batch of the channel's videos.
+        """
+        return self._flight.do(("channel", channel_id, continuation), self._get_channel_videos,
+                               channel_id, continuation)
+
+    def _get_channel_videos(self, channel_id: str, continuation=None) -> dict:
         if not channel_id:
             logger.error("Channel ID is required")
-            return {'error': 'Channel ID is required'}
+            return {'error': 'Channel ID is required', 'error_type': 'invalid'}
+
+        if continuation:
+            return self._channel_continuation(channel_id, continuation)
 
         try:
             logger.debug(f"Fetching videos for channel: {channel_id}")
-            # Try multiple URL formats for channels
-            channel_urls = []
-            
-            # Handle both @ handles and channel IDs
-            if channel_id.startswith('@'):
-                channel_urls.append(f"{self.base_url}/{channel_id}/videos")
-            elif channel_id.startswith('UC'):
-                channel_urls.append(f"{self.base_url}/channel/{channel_id}/videos")
-            else:
-                # Try all formats if the channel ID format is unclear
-                channel_urls = [
-                    f"{self.base_url}/c/{channel_id}/videos",
-                    f"{self.base_url}/channel/{channel_id}/videos",
-                    f"{self.base_url}/@{channel_id}/videos",
-                    f"{self.base_url}/user/{channel_id}/videos"
-                ]
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            # Try all URL formats until one works
-            html_content = None
-            for url in channel_urls:
+
+            def probe(url):
                 try:
                     logger.debug(f"Trying channel URL: {url}")
-                    response = requests.get(url, headers=headers)
+                    response = self.http.get(url)
                     if response.status_code == 200:
-                        html_content = response.text
-                        logger.debug(f"Successfully received channel page HTML from {url}")
-                        break
+                        return response.text
                 except requests.RequestException as e:
                     logger.warning(f"Failed to access {url}: {str(e)}")
-                    continue
+                return None
+
+            # Try the URL formats in order and keep the first that works
+            url, html_content = self._resolve(f"channel:{channel_id}", self._channel_urls(channel_id), probe)
+            if html_content:
+                logger.debug(f"Successfully received channel page HTML from {url}")
 
             if not html_content:
                 logger.error("All channel URL formats failed")
-                return {'error': 'Channel not found or unavailable'}
-
-            # Extract channel information with multiple patterns
-            channel_title_pattern = r'\"title\":\"([^\"]+?)\"'
-            
-            # Try multiple subscriber count patterns
-            subscriber_patterns = [
-                r'\"subscriberCountText\":\{\"simpleText\":\"([^\"]+?)\"',
-                r'\"subscriberCountText\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\"',
-                r'subscribers\":\{\"simpleText\":\"([^\"]+?)\"',
-                r'\"subCount\":\"([^\"]+?)\"'
-            ]
+                return {'error': 'Channel not found or unavailable', 'error_type': 'not_found'}
 
-            channel_title_match = re.search(channel_title_pattern, html_content)
-            
-            # Try all subscriber patterns
-            subscriber_match = None
-            for pattern in subscriber_patterns:
-                subscriber_match = re.search(pattern, html_content)
-                if subscriber_match:
-                    logger.debug(f"Found subscriber count with pattern: {pattern}")
-                    break
-
-            # Check if we got valid channel data
-            if not channel_title_match:
-                logger.error("Could not find channel title in response")
-                return {'error': 'Channel not found'}
-
-            # Extract videos using the same pattern as search results
-            videos = self._extract_video_id(html_content)
-            
-            # Format videos with consistent metadata for display
-            for video in videos:
-                # Make sure view count is properly formatted
-                if 'views' in video and video['views']:
-                    if not any(substring in video['views'].lower() for substring in ['views', 'view']):
-                        video['views'] = f"{video['views']} views"
-            
-            # Get as many videos as we can extract, up to 50
-            max_videos = 50
-            
-            channel_data = {
-                'id': channel_id,
-                'title': channel_title_match.group(1) if channel_title_match else "Unknown Channel",
-                'subscriber_count': subscriber_match.group(1) if subscriber_match else "Unknown subscribers",
-                'videos': videos[:max_videos],  # Show more videos for better channel browsing
-                'video_count': len(videos)  # Store the total number of videos we found
-            }
-
-            if not channel_data['videos']:
-                logger.warning("No videos found for channel")
-                return {'error': 'No videos found for this channel'}
-
-            logger.debug(f"Successfully extracted {len(channel_data['videos'])} videos for channel")
-            return channel_data
+            return self._parse_channel_page(channel_id, html_content)
 
         except Exception as e:
             logger.error(f"Channel fetch request failed: {str(e)}")
-            return {'error': f'Failed to fetch channel data: {str(e)}'}
\ No newline at end of file
+            return {'error': f'Failed to fetch channel data: {str(e)}', 'error_type': 'upstream_error'}
+
+    def _channel_continuation(self, channel_id: str, continuation: str) -> dict:
+        try:
+            logger.debug(f"Fetching channel continuation for: {channel_id}")
+            url, params, body = self._continuation_request("browse", continuation)
+            response = self.http.post(url, params=params, json=body)
+            if response.status_code != 200:
+                logger.error(f"Channel continuation failed with status code: {response.status_code}")
+                return {'error': 'Channel page unavailable',
+                        'error_type': error_type_for_status(response.status_code)}
+            return self._parse_channel_continuation(channel_id, response.json())
+        except Exception as e:
+            logger.error(f"Channel continuation request failed: {str(e)}")
+            return {'error': f'Failed to fetch channel data: {str(e)}', 'error_type': 'upstream_error'}
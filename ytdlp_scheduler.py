@@ -0,0 +1,219 @@
+from typing import Any, Dict, Iterator, List, Optional
+from collections import deque
+from contextlib import contextmanager
+import logging
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Small audio-only formats go ahead of video downloads
+PRIORITY_ITAGS = (140, 249)
+
+# Set in the environment of a subprocess that runs inside a slot already
+# held by its parent, so it does not queue for a second one
+SLOT_HELD_ENV = "YTDLP_SLOT_HELD"
+
+class SlotTimeout(TimeoutError):
+    """No download slot became free within max_wait seconds"""
+
+class SubprocessScheduler:
+    """Node-wide limit on concurrently running download subprocesses.
+
+    Every process on the node (gunicorn workers and download_helper.py)
+    queues in one SQLite file, so at most max_concurrency yt-dlp processes
+    run at once however the requests are spread. When a slot frees, the
+    waiter that goes next is the one with the fewest downloads of its own
+    user running or queued ahead of it, so users take turns and one user's
+    burst of clicks cannot hold every slot; ties go to audio formats
+    (PRIORITY_ITAGS) before video, then to the user who started a download
+    least recently, then arrival order.
+
+    Waiters poll every poll_interval seconds and give up with SlotTimeout
+    after max_wait. Rows left by a process that died are removed when its
+    PID is no longer alive.
+    """
+
+    def __init__(self, path: str, max_concurrency: int = 2, poll_interval: float = 0.25,
+                 max_wait: float = 600, timeout: float = 5.0):
+        self._path = path
+        self._max_concurrency = max_concurrency
+        self._poll_interval = poll_interval
+        self._max_wait = max_wait
+        self._timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._stats = {
+            "acquired": 0,
+            "timeouts": 0,
+            "reaped": 0
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ytdlp_slots ("
+                " ticket INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user TEXT NOT NULL,"
+                " priority INTEGER NOT NULL,"
+                " state TEXT NOT NULL,"
+                " pid INTEGER NOT NULL,"
+                " enqueued_at REAL NOT NULL,"
+                " started_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ytdlp_state ON ytdlp_slots (state, user)")
+            conn.execute("CREATE TABLE IF NOT EXISTS ytdlp_users (user TEXT PRIMARY KEY, last_started REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not thread-safe"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _enqueue(self, user: str, priority: int) -> int:
+        cursor = self._conn().execute(
+            "INSERT INTO ytdlp_slots (user, priority, state, pid, enqueued_at) VALUES (?, ?, 'waiting', ?, ?)",
+            (user, priority, os.getpid(), time.time())
+        )
+        return cursor.lastrowid
+
+    def _try_start(self, ticket: int) -> bool:
+        """Take a slot for ticket if one is free and ticket is next in line"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            running = conn.execute("SELECT COUNT(*) FROM ytdlp_slots WHERE state = 'running'").fetchone()[0]
+            if running >= self._max_concurrency:
+                conn.execute("COMMIT")
+                return False
+            next_ticket = conn.execute(
+                "SELECT w.ticket, w.user FROM ytdlp_slots w LEFT JOIN ytdlp_users u ON u.user = w.user"
+                " WHERE w.state = 'waiting' ORDER BY"
+                " (SELECT COUNT(*) FROM ytdlp_slots r WHERE r.user = w.user"
+                "  AND (r.state = 'running' OR r.ticket < w.ticket)),"
+                " w.priority, COALESCE(u.last_started, 0), w.ticket LIMIT 1"
+            ).fetchone()
+            if next_ticket is None or next_ticket[0] != ticket:
+                conn.execute("COMMIT")
+                return False
+            now = time.time()
+            conn.execute("UPDATE ytdlp_slots SET state = 'running', started_at = ? WHERE ticket = ?", (now, ticket))
+            conn.execute("INSERT OR REPLACE INTO ytdlp_users (user, last_started) VALUES (?, ?)",
+                         (next_ticket[1], now))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _release(self, ticket: int) -> None:
+        self._conn().execute("DELETE FROM ytdlp_slots WHERE ticket = ?", (ticket,))
+
+    def _reap(self) -> int:
+        """Remove rows of processes that are no longer alive"""
+        conn = self._conn()
+        dead = []
+        for (pid,) in conn.execute("SELECT DISTINCT pid FROM ytdlp_slots").fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                dead.append(pid)
+            except OSError:
+                pass  # alive, owned by another user
+        for pid in dead:
+            conn.execute("DELETE FROM ytdlp_slots WHERE pid = ?", (pid,))
+        if dead:
+            with self._lock:
+                self._stats["reaped"] += len(dead)
+            logger.warning(f"Released download slots held by exited processes {dead}")
+        return len(dead)
+
+    @contextmanager
+    def slot(self, user: Optional[str] = None, itag: Optional[int] = None) -> Iterator[float]:
+        """Hold one download slot for the duration of the block, yielding the seconds waited"""
+        user = user or "anonymous"
+        priority = 0 if itag in PRIORITY_ITAGS else 1
+        ticket = self._enqueue(user, priority)
+        start = time.monotonic()
+        polls = 0
+        try:
+            while not self._try_start(ticket):
+                waited = time.monotonic() - start
+                if waited >= self._max_wait:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise SlotTimeout(f"No download slot free after {waited:.0f}s")
+                polls += 1
+                if polls % 20 == 0:
+                    self._reap()
+                time.sleep(self._poll_interval)
+            waited = time.monotonic() - start
+            with self._lock:
+                self._stats["acquired"] += 1
+                self._waits.append(waited)
+            if waited >= 1:
+                logger.info(f"Waited {waited:.1f}s for a download slot ({user}, itag {itag})")
+            yield waited
+        finally:
+            self._release(ticket)
+
+    def run(self, command: List[str], user: Optional[str] = None, itag: Optional[int] = None,
+            **kwargs) -> subprocess.CompletedProcess:
+        """subprocess.run inside a download slot, unless this process already runs inside one"""
+        if os.environ.get(SLOT_HELD_ENV):
+            return subprocess.run(command, **kwargs)
+        with self.slot(user, itag):
+            return subprocess.run(command, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Node-wide queue depth and this process's slot wait times"""
+        rows = self._conn().execute(
+            "SELECT state, priority, COUNT(*), MIN(enqueued_at) FROM ytdlp_slots GROUP BY state, priority"
+        ).fetchall()
+        running = sum(count for state, _, count, _ in rows if state == "running")
+        waiting = {priority: (count, oldest) for state, priority, count, oldest in rows if state == "waiting"}
+        oldest = min((oldest for _, oldest in waiting.values()), default=None)
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = dict(self._stats)
+
+        def percentile(fraction):
+            return round(waits[min(len(waits) - 1, int(fraction * len(waits)))], 3) if waits else None
+
+        return dict(
+            stats,
+            max_concurrency=self._max_concurrency,
+            running=running,
+            queued=sum(count for count, _ in waiting.values()),
+            queued_audio=waiting.get(0, (0, None))[0],
+            queued_video=waiting.get(1, (0, None))[0],
+            oldest_wait=round(time.time() - oldest, 3) if oldest is not None else None,
+            wait_p50=percentile(0.5),
+            wait_p95=percentile(0.95),
+            wait_max=round(waits[-1], 3) if waits else None
+        )
+
+_default_scheduler: Optional[SubprocessScheduler] = None
+_default_lock = threading.Lock()
+
+def get_scheduler() -> SubprocessScheduler:
+    """The process-wide scheduler, configured from YTDLP_* environment variables"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = SubprocessScheduler(
+                os.environ.get("YTDLP_SCHEDULER_PATH", os.path.join(os.getcwd(), "instance", "ytdlp_slots.sqlite3")),
+                max_concurrency=int(os.environ.get("YTDLP_MAX_CONCURRENCY", 2)),
+                max_wait=float(os.environ.get("YTDLP_MAX_WAIT", 600))
+            )
+        return _default_scheduler